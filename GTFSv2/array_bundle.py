@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Formato binario simple para guardar varios arrays NumPy en un solo archivo
+Cabecera JSON + arrays contiguos alineados, leídos con mmap (sin copia)
+"""
+
+import json
+import mmap
+import struct
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b'GTFSBND1'
+ALIGN = 64
+
+def _align(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+def write_bundle(path, arrays, meta=None):
+    """
+    Escribe un bundle con los arrays dados
+
+    Args:
+        path: Archivo de salida
+        arrays: Diccionario nombre -> np.ndarray
+        meta: Diccionario serializable a JSON con metadatos libres
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    arrays = {name: np.ascontiguousarray(arr) for name, arr in arrays.items()}
+
+    # Calcular offsets relativos al inicio de la zona de datos
+    layout = {}
+    offset = 0
+    for name, arr in arrays.items():
+        offset = _align(offset)
+        layout[name] = {
+            'dtype': arr.dtype.str,
+            'shape': list(arr.shape),
+            'offset': offset
+        }
+        offset += arr.nbytes
+
+    header = json.dumps({'meta': meta or {}, 'arrays': layout}, ensure_ascii=False).encode('utf-8')
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    # Escribir a un temporal y renombrar para no dejar bundles a medias
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(arr.tobytes())
+        f.truncate(data_start + offset)
+    tmp_path.replace(path)
+
+def read_meta(path):
+    """Lee solo la cabecera (metadatos) de un bundle"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} no es un bundle válido")
+        (header_len,) = struct.unpack('<Q', f.read(8))
+        return json.loads(f.read(header_len).decode('utf-8'))['meta']
+
+def read_bundle(path):
+    """
+    Abre un bundle con mmap
+
+    Returns:
+        (arrays, meta): arrays son vistas de solo lectura sobre el archivo
+    """
+    with open(path, 'rb') as f:
+        size = f.seek(0, 2)
+        mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else b''
+
+    if mm[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} no es un bundle válido")
+    (header_len,) = struct.unpack_from('<Q', mm, len(MAGIC))
+    header_start = len(MAGIC) + 8
+    header = json.loads(bytes(mm[header_start:header_start + header_len]).decode('utf-8'))
+    data_start = _align(header_start + header_len)
+
+    arrays = {}
+    for name, info in header['arrays'].items():
+        dtype = np.dtype(info['dtype'])
+        shape = tuple(info['shape'])
+        count = int(np.prod(shape)) if shape else 1
+        if count == 0:
+            arrays[name] = np.empty(shape, dtype=dtype)
+            continue
+        arr = np.frombuffer(mm, dtype=dtype, count=count, offset=data_start + info['offset'])
+        arrays[name] = arr.reshape(shape)
+
+    return arrays, header['meta']
@@ -4,111 +4,154 @@ Genera la secuencia de paradas para cada trip
 Asigna stop_ids y maneja paradas sintéticas
 """
 
+import argparse
 import json
 import csv
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from shapely.geometry import Point, LineString
+import numpy as np
+
+from geometry_kernel import SegmentArrays, project_points
+from instrumentation import (
+    PROFILER, add_profile_args, configure_from_args, finish_profile, init_pool_worker, load_json, merged, profiled
+)
+from projection import project_coords
+from shape_simplify import ShapeLevels
+from shape_store import default_cache_dir, load_shape_store
+from manifest import BuildManifest, content_hash
+from spatial_index import StopGrid
+from stop_table import StopTable
+from trip_store import TripSequenceWriter, default_store_path
+
+MAX_DISTANCE = 20  # metros
+ASSIGN_VERSION = 1  # incrementar si cambia el algoritmo (invalida el manifiesto)
+SIMPLIFY_TOLERANCE = 5.0  # metros; nivel Douglas-Peucker para filtrar candidatas
 
 def load_shape_from_gtfs(shapes_file, shape_id):
-    """Carga un shape desde shapes.txt del GTFS"""
-    shapes = {}
-    with open(shapes_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            sid = row['shape_id']
-            if sid not in shapes:
-                shapes[sid] = []
-            shapes[sid].append({
-                'lat': float(row['shape_pt_lat']),
-                'lon': float(row['shape_pt_lon']),
-                'seq': int(row['shape_pt_sequence'])
-            })
-    
-    if shape_id in shapes:
-        coords = sorted(shapes[shape_id], key=lambda x: x['seq'])
-        return [[p['lon'], p['lat']] for p in coords]
-    return None
+    """Carga un shape desde shapes.txt del GTFS (vía el caché de shape_store)"""
+    return load_shape_store(shapes_file).get(shape_id)
 
-def calculate_right_side_stops(route_coords, stops_dict, max_distance=25):
+def find_right_side_hits(route_xy, stop_index, max_distance, coarse=None):
     """
-    Calcula qué paradas están al lado derecho de la ruta
-    stops_dict: diccionario con stop_id como clave
+    Paradas de stop_index al lado derecho y a menos de max_distance metros
+    Devuelve la lista sin ordenar, en el orden de inserción del índice
+    coarse: (xy, tolerancia) de un nivel Douglas-Peucker de la shape; las
+    candidatas a más de max_distance + tolerancia de él se descartan antes de
+    proyectar sobre la shape completa (ninguna de ellas podía quedar a menos
+    de max_distance, así que el resultado no cambia)
     """
-    route_line = LineString(route_coords)
     right_stops = []
     
-    for stop_id, stop_data in stops_dict.items():
-        stop_point = Point(stop_data['stop_lon'], stop_data['stop_lat'])
-        
-        # Calcular distancia a la ruta
-        distance = route_line.distance(stop_point)
-        distance_meters = distance * 111000
-        
-        if distance_meters > max_distance:
-            continue
-        
-        # Encontrar el segmento más cercano
-        min_dist = float('inf')
-        segment_idx = 0
-        for i in range(len(route_coords) - 1):
-            seg = LineString([route_coords[i], route_coords[i+1]])
-            d = seg.distance(stop_point)
-            if d < min_dist:
-                min_dist = d
-                segment_idx = i
-        
-        # Determinar lado usando producto cruz
-        p1 = route_coords[segment_idx]
-        p2 = route_coords[segment_idx + 1]
-        
-        dx = p2[0] - p1[0]
-        dy = p2[1] - p1[1]
-        px = stop_data['stop_lon'] - p1[0]
-        py = stop_data['stop_lat'] - p1[1]
-        
-        cross = dx * py - dy * px
-        
-        distance_along = route_line.project(stop_point)
-        
-        if cross < 0:  # Invertido: negativo = derecha
-            right_stops.append({
-                'stop_id': stop_id,
-                'distance_meters': distance_meters,
-                'distance_along': distance_along * 111000
-            })
+    if len(stop_index) == 0:
+        return right_stops
+    
+    # Solo paradas en celdas cercanas a la ruta (+ holgura numérica)
+    candidate_ids = stop_index.query_line(route_xy, max_distance * (1 + 1e-9))
+    PROFILER.count('candidate_stops_tested', len(candidate_ids))
+    
+    if not candidate_ids:
+        return right_stops
+    
+    positions = stop_index.positions_of(candidate_ids)
+    if coarse is not None:
+        coarse_xy, tolerance = coarse
+        near = project_points(positions, coarse_xy)['distance'] <= (max_distance + tolerance) * (1 + 1e-9)
+        candidate_ids = [candidate_ids[i] for i in np.flatnonzero(near)]
+        positions = positions[near]
+        PROFILER.count('candidate_stops_refined', len(candidate_ids))
+    
+    # Distancia, segmento más cercano, lado (producto cruz) y distancia a lo
+    # largo para todas las candidatas en una sola llamada vectorizada
+    hits = project_points(positions, route_xy)
+    
+    # Invertido: producto cruz negativo = derecha
+    on_right = (hits['distance'] <= max_distance) & (hits['cross'] < 0)
+    PROFILER.count('right_side_hits', int(on_right.sum()))
+    
+    for i in np.flatnonzero(on_right):
+        right_stops.append({
+            'stop_id': candidate_ids[i],
+            'distance_meters': float(hits['distance'][i]),
+            'distance_along': float(hits['along'][i])
+        })
+    
+    return right_stops
+
+def calculate_right_side_stops(route_coords, stops, max_distance=25, stop_index=None, route_xy=None):
+    """
+    Calcula qué paradas están al lado derecho de la ruta
+    stops: StopTable con las paradas
+    stop_index: StopGrid de la corrida; si no se pasa se construye desde stops
+    route_xy: coordenadas de la ruta ya proyectadas (metros); si no se pasa se proyecta
+    
+    Distancias en metros (UTM 17S), sin conversiones desde grados
+    """
+    if route_xy is None:
+        route_xy = project_coords(route_coords)
+    if stop_index is None:
+        stop_index = StopGrid.from_stop_table(stops)
+    
+    right_stops = find_right_side_hits(route_xy, stop_index, max_distance)
     
     right_stops.sort(key=lambda x: x['distance_along'])
     
     return right_stops
 
-def ensure_start_end_stops(route_coords, right_stops, stops_dict, trip_id, threshold_meters=10):
+def close_ring(right_stops, linear_ref, stop_index, threshold_meters=10):
+    """
+    Completa la secuencia (ordenada) de una shape circular
+    La parada en el terminal de un anillo está igual de cerca del primer y del
+    último segmento y project_points la deja al inicio (medida ~0), aunque
+    también es la última del recorrido: se repite al final y las medidas se
+    recalculan con locate_sequence, que la busca después de la anterior. Una
+    parada del final que está junto al inicio se repite al principio.
+    Devuelve la misma lista si la shape no es circular o no hace falta
+    """
+    if linear_ref is None or not linear_ref.is_ring or len(right_stops) < 2:
+        return right_stops
+    
+    positions = stop_index.positions_of([stop['stop_id'] for stop in right_stops])
+    near_start = np.hypot(*(positions - linear_ref.route_xy[0]).T) < threshold_meters
+    near_end = np.hypot(*(positions - linear_ref.route_xy[-1]).T) < threshold_meters
+    
+    sequence = list(right_stops)
+    if near_end[0] and not near_end[-1]:
+        sequence.append(right_stops[0])
+    if near_start[-1] and not near_start[0]:
+        sequence.insert(0, right_stops[-1])
+    if len(sequence) == len(right_stops):
+        return right_stops
+    
+    along = linear_ref.locate_sequence(stop_index.positions_of([stop['stop_id'] for stop in sequence]))
+    PROFILER.count('ring_terminals_repeated', len(sequence) - len(right_stops))
+    return [
+        {'stop_id': stop['stop_id'], 'distance_meters': stop['distance_meters'], 'distance_along': float(measure)}
+        for stop, measure in zip(sequence, along)
+    ]
+
+def ensure_start_end_stops(route_coords, right_stops, stops, trip_id, threshold_meters=10,
+                           stop_index=None, route_xy=None):
     """
     Verifica paradas de inicio y fin
-    Si no existen, crea paradas sintéticas y las agrega al diccionario global
+    Si no existen, crea paradas sintéticas y las agrega al StopTable global
+    (y a stop_index, si se pasa)
     """
-    route_line = LineString(route_coords)
-    start_point = Point(route_coords[0][0], route_coords[0][1])
-    end_point = Point(route_coords[-1][0], route_coords[-1][1])
-    
-    # Verificar inicio
-    has_start = False
-    for stop in right_stops:
-        stop_data = stops_dict[stop['stop_id']]
-        stop_point = Point(stop_data['stop_lon'], stop_data['stop_lat'])
-        distance = start_point.distance(stop_point) * 111000
-        if distance < threshold_meters:
-            has_start = True
-            break
-    
-    # Verificar fin
-    has_end = False
-    for stop in right_stops:
-        stop_data = stops_dict[stop['stop_id']]
-        stop_point = Point(stop_data['stop_lon'], stop_data['stop_lat'])
-        distance = end_point.distance(stop_point) * 111000
-        if distance < threshold_meters:
-            has_end = True
-            break
+    if route_xy is None:
+        route_xy = project_coords(route_coords)
+    route_xy = np.asarray(route_xy)
+    
+    # Posiciones proyectadas de las paradas asignadas
+    if stop_index is not None:
+        positions = stop_index.positions_of([stop['stop_id'] for stop in right_stops])
+    else:
+        positions = project_coords(stops.lonlat(stops.rows([stop['stop_id'] for stop in right_stops])))
+    
+    # Verificar inicio y fin
+    start_dist = np.hypot(positions[:, 0] - route_xy[0, 0], positions[:, 1] - route_xy[0, 1])
+    end_dist = np.hypot(positions[:, 0] - route_xy[-1, 0], positions[:, 1] - route_xy[-1, 1])
+    has_start = bool(np.any(start_dist < threshold_meters))
+    has_end = bool(np.any(end_dist < threshold_meters))
     
     new_stops = list(right_stops)
     synthetic_stops_added = []
@@ -116,15 +159,8 @@ def ensure_start_end_stops(route_coords, right_stops, stops_dict, trip_id, thres
     # Crear parada de inicio si es necesaria
     if not has_start:
         start_stop_id = f"SYNTH_START_{trip_id}"
-        stops_dict[start_stop_id] = {
-            'stop_id': start_stop_id,
-            'stop_code': f"INICIO_{trip_id}",
-            'stop_name': f"INICIO RUTA {trip_id}",
-            'stop_lat': route_coords[0][1],
-            'stop_lon': route_coords[0][0],
-            'distrito': 'Generado',
-            'synthetic': True
-        }
+        stops.append(start_stop_id, f"INICIO_{trip_id}", f"INICIO RUTA {trip_id}",
+                     route_coords[0][1], route_coords[0][0], 'Generado', synthetic=True)
         new_stops.insert(0, {
             'stop_id': start_stop_id,
             'distance_meters': 0,
@@ -135,25 +171,267 @@ def ensure_start_end_stops(route_coords, right_stops, stops_dict, trip_id, thres
     # Crear parada de fin si es necesaria
     if not has_end:
         end_stop_id = f"SYNTH_END_{trip_id}"
-        stops_dict[end_stop_id] = {
-            'stop_id': end_stop_id,
-            'stop_code': f"FIN_{trip_id}",
-            'stop_name': f"FIN RUTA {trip_id}",
-            'stop_lat': route_coords[-1][1],
-            'stop_lon': route_coords[-1][0],
-            'distrito': 'Generado',
-            'synthetic': True
-        }
+        stops.append(end_stop_id, f"FIN_{trip_id}", f"FIN RUTA {trip_id}",
+                     route_coords[-1][1], route_coords[-1][0], 'Generado', synthetic=True)
         new_stops.append({
             'stop_id': end_stop_id,
             'distance_meters': 0,
-            'distance_along': route_line.length * 111000
+            'distance_along': SegmentArrays(route_xy).total_length
         })
         synthetic_stops_added.append(end_stop_id)
     
+    if stop_index is not None:
+        for stop_id in synthetic_stops_added:
+            point_xy = route_xy[0] if stop_id.startswith('SYNTH_START_') else route_xy[-1]
+            stop_index.insert_xy(stop_id, float(point_xy[0]), float(point_xy[1]))
+    
     return new_stops, synthetic_stops_added
 
+# Estado de solo lectura de cada proceso (shapes en mmap + índice de paradas base)
+_worker_state = {}
+
+def _init_worker(shapes_file, stops, max_distance, simplify_tolerance=0):
+    _worker_state['shape_store'] = load_shape_store(shapes_file)
+    _worker_state['stop_index'] = StopGrid.from_stop_table(stops)
+    _worker_state['max_distance'] = max_distance
+    _worker_state['simplify_tolerance'] = simplify_tolerance
+    if simplify_tolerance > 0:
+        _worker_state['shape_levels'] = ShapeLevels.open(_worker_state['shape_store'])
+
+def _assign_base_stops(shape_id):
+    """Paradas base del lado derecho de una shape (sin ordenar); None si no hay shape"""
+    route_xy = _worker_state['shape_store'].coords_xy(shape_id)
+    if route_xy is None or len(route_xy) == 0:
+        return None
+    coarse = None
+    tolerance = _worker_state['simplify_tolerance']
+    if tolerance > 0:
+        coarse = _worker_state['shape_levels'].simplified(shape_id, tolerance).xy, tolerance
+    with PROFILER.item('base_stops', shape_id):
+        return find_right_side_hits(route_xy, _worker_state['stop_index'], _worker_state['max_distance'],
+                                    coarse)
+
+def iter_base_assignments(trips, shapes_file, stops, max_distance, workers=1, simplify_tolerance=0):
+    """
+    Asigna las paradas base (sin sintéticas) a cada trip, en el orden de trips
+    Con workers > 1 reparte los trips en un pool de procesos; cada trip es
+    independiente porque solo se consulta el conjunto fijo de paradas base
+    simplify_tolerance > 0: descartar candidatas con el nivel Douglas-Peucker
+    de esa tolerancia (metros) antes de la shape completa
+    """
+    shape_ids = [trip['shape_id'] for trip in trips]
+    
+    if workers <= 1:
+        _init_worker(shapes_file, stops, max_distance, simplify_tolerance)
+        yield from map(_assign_base_stops, shape_ids)
+        return
+    
+    chunksize = max(1, len(shape_ids) // (workers * 4))
+    # Contadores e items de cada proceso vuelven con su resultado (ver instrumentation)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_pool_worker,
+                             initargs=(PROFILER.enabled, _init_worker, str(shapes_file), stops, max_distance,
+                                       simplify_tolerance)) as pool:
+        yield from merged(pool.map(partial(profiled, _assign_base_stops), shape_ids, chunksize=chunksize))
+
+def base_stops_key(route_xy, stop_index, max_distance):
+    """
+    Hash de las entradas de la asignación base de un trip: la shape proyectada
+    y las paradas base de las celdas cercanas (ids + posiciones)
+    """
+    candidate_ids = stop_index.query_line(route_xy, max_distance * (1 + 1e-9))
+    return content_hash(route_xy, candidate_ids, stop_index.positions_of(candidate_ids))
+
+def assign_base_stops(trips, shape_store, stop_index, shapes_file, stops, manifest, workers=1,
+                      simplify_tolerance=0):
+    """
+    Paradas base por trip (en el orden de trips), reutilizando del manifiesto
+    los trips cuyas entradas no cambiaron y recalculando solo el resto
+    """
+    results = [None] * len(trips)
+    keys = {}
+    pending = []
+    
+    for i, trip_info in enumerate(trips):
+        route_xy = shape_store.coords_xy(trip_info['shape_id'])
+        if route_xy is None or len(route_xy) == 0:
+            continue
+        key = base_stops_key(route_xy, stop_index, MAX_DISTANCE)
+        keys[i] = key
+        cached = manifest.lookup(trip_info['trip_id'], key)
+        if cached is not None:
+            results[i] = [
+                {'stop_id': stop_id, 'distance_meters': distance_meters, 'distance_along': distance_along}
+                for stop_id, distance_meters, distance_along in cached
+            ]
+        else:
+            pending.append(i)
+    
+    computed = iter_base_assignments([trips[i] for i in pending], shapes_file, stops, MAX_DISTANCE, workers,
+                                     simplify_tolerance)
+    for i, base_stops in zip(pending, computed):
+        results[i] = base_stops
+        manifest.record(trips[i]['trip_id'], keys[i], [
+            [stop['stop_id'], stop['distance_meters'], stop['distance_along']]
+            for stop in base_stops
+        ])
+    
+    return results
+
+def assign_all_trips(trips, stops, shapes_file, workers=1, full=False, cache_dir=None, json_dir=None,
+                     simplify_tolerance=SIMPLIFY_TOLERANCE):
+    """
+    Asigna paradas a todos los trips (en memoria)
+    
+    Args:
+        trips: Filas de trips.txt (dicts con trip_id, shape_id, route_id)
+        stops: StopTable con las paradas limpias (no se modifica)
+        shapes_file: shapes.txt (se lee vía shape_store)
+        workers: Procesos para la asignación base
+        full: Ignorar el manifiesto incremental
+        cache_dir: Directorio del manifiesto (default: default_cache_dir())
+        json_dir: Si se indica, escribe también trip_*_stops.json ahí
+        simplify_tolerance: Metros; > 0 filtra las candidatas de la asignación
+            base con el nivel Douglas-Peucker de esa tolerancia (ver
+            shape_simplify) antes de proyectarlas sobre la shape completa
+    
+    Returns:
+        Diccionario con 'sequences' (TripSequenceStore), 'all_stops' (StopTable
+        incluyendo sintéticas) y estadísticas de la corrida
+    """
+    cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+    
+    # Todas las paradas (incluyendo sintéticas, que se agregan al final)
+    all_stops = stops.copy()
+    
+    # Shapes (caché binario, con coordenadas proyectadas) e índice espacial de
+    # paradas en metros, una vez por corrida; las sintéticas se insertan al crearse
+    with PROFILER.stage('stop_index'):
+        shape_store = load_shape_store(shapes_file)
+        stop_index = StopGrid.from_stop_table(all_stops)
+        if simplify_tolerance > 0:
+            # Deja cache/shape_levels.bin listo antes de abrir los workers
+            ShapeLevels.open(shape_store)
+    
+    # Las paradas base se asignan en paralelo (solo trips con entradas nuevas
+    # según el manifiesto); las sintéticas creadas por trips anteriores se
+    # agregan después, en orden, igual que en la corrida serial
+    manifest = BuildManifest(cache_dir / 'assign_manifest.json', params={
+        'stage': 'assign_base_stops',
+        'version': ASSIGN_VERSION,
+        'max_distance': MAX_DISTANCE,
+        'cell_size': stop_index.cell_size
+    }, enabled=not full)
+    synthetic_index = StopGrid()
+    with PROFILER.stage('base_stops'):
+        base_assignments = assign_base_stops(trips, shape_store, stop_index, shapes_file, stops,
+                                             manifest, workers, simplify_tolerance)
+    PROFILER.count('manifest_hits', manifest.hits)
+    PROFILER.count('manifest_misses', manifest.misses)
+    print(f"   ♻️  {manifest.hits} trips reutilizados, {manifest.misses} recalculados")
+    
+    # Estadísticas globales
+    total_processed = 0
+    total_stops_assigned = 0
+    total_synthetic = 0
+    failed_trips = []
+    sequence_writer = TripSequenceWriter()
+    
+    for trip_info, base_stops in zip(trips, base_assignments):
+        trip_id = trip_info['trip_id']
+        with PROFILER.item('trip', trip_id):
+            shape_id = trip_info['shape_id']
+            route_id = trip_info.get('route_id', 'N/A')
+            
+            PROFILER.log(f"\n   [{total_processed + 1}/{len(trips)}] Trip {trip_id} (Ruta: {route_id})...")
+            
+            route_coords = shape_store.get(shape_id)
+            
+            if not route_coords:
+                print(f"      ❌ Trip {trip_id}: shape {shape_id} no encontrado")
+                failed_trips.append({'trip_id': trip_id, 'reason': 'Shape not found'})
+                total_processed += 1
+                continue
+            
+            PROFILER.log(f"      Shape: {len(route_coords)} puntos")
+            
+            # Paradas del lado derecho: base + sintéticas de trips anteriores
+            # (mismo orden de candidatas que el índice completo; sort estable)
+            route_xy = shape_store.coords_xy(shape_id)
+            right_stops = base_stops + find_right_side_hits(route_xy, synthetic_index, MAX_DISTANCE)
+            right_stops.sort(key=lambda x: x['distance_along'])
+            
+            if not right_stops:
+                print(f"      ⚠️  Trip {trip_id}: 0 paradas asignadas")
+                failed_trips.append({'trip_id': trip_id, 'reason': 'No stops found'})
+                total_processed += 1
+                continue
+            
+            # Terminal de una shape circular: inicio y fin del recorrido
+            right_stops = close_ring(right_stops, shape_store.linear_ref(shape_id), stop_index)
+            
+            # Asegurar inicio/fin
+            right_stops, synthetic_added = ensure_start_end_stops(route_coords, right_stops, all_stops, trip_id,
+                                                                  stop_index=stop_index, route_xy=route_xy)
+            for stop_id in synthetic_added:
+                synthetic_index.insert_xy(stop_id, *stop_index.position(stop_id))
+            
+            # Guardar secuencia del trip (con su distancia a lo largo de la shape)
+            sequence_writer.add(trip_id, route_id, shape_id, [stop['stop_id'] for stop in right_stops],
+                                [stop['distance_along'] for stop in right_stops])
+            
+            if json_dir is not None:
+                trip_stops_sequence = {
+                    'trip_id': trip_id,
+                    'route_id': route_id,
+                    'shape_id': shape_id,
+                    'total_stops': len(right_stops),
+                    'stops_sequence': [
+                        {
+                            'stop_sequence': idx + 1,
+                            'stop_id': stop['stop_id']
+                        }
+                        for idx, stop in enumerate(right_stops)
+                    ]
+                }
+                
+                with open(Path(json_dir) / f'trip_{trip_id}_stops.json', 'w', encoding='utf-8') as f:
+                    json.dump(trip_stops_sequence, f, ensure_ascii=False, indent=2)
+            
+            PROFILER.log(f"      ✅ {len(right_stops)} paradas ({len(synthetic_added)} sintéticas)")
+            
+            total_processed += 1
+            total_stops_assigned += len(right_stops)
+            total_synthetic += len(synthetic_added)
+    
+    PROFILER.count('synthetic_stops_created', total_synthetic)
+    manifest.save()
+    
+    return {
+        'sequences': sequence_writer.build(),
+        'all_stops': all_stops,
+        'total_processed': total_processed,
+        'total_stops_assigned': total_stops_assigned,
+        'total_synthetic': total_synthetic,
+        'failed_trips': failed_trips
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Genera la secuencia de paradas para cada trip")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Procesos para la asignación por trip (default: 1, serial)")
+    parser.add_argument('--json', action='store_true',
+                        help="Escribir además los trip_*_stops.json individuales (formato anterior)")
+    parser.add_argument('--full', action='store_true',
+                        help="Ignorar el manifiesto y recalcular todos los trips")
+    parser.add_argument('--simplify-tolerance', type=float, default=SIMPLIFY_TOLERANCE,
+                        help="Filtrar candidatas con las shapes simplificadas (Douglas-Peucker) con esta "
+                             f"tolerancia en metros; mismo resultado (default: {SIMPLIFY_TOLERANCE:.0f}, 0 = sin filtro)")
+    add_profile_args(parser)
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    configure_from_args(args, 'assign_stops_to_trips')
     base_path = Path(__file__).parent
     
     print("=" * 80)
@@ -167,95 +445,45 @@ def main():
     
     # 1. Cargar paradas limpias
     print("\n1. Cargando paradas limpias...")
-    with open(stops_clean_file, 'r', encoding='utf-8') as f:
-        stops_data = json.load(f)
+    with PROFILER.stage('load_stops'):
+        stops_data = load_json(stops_clean_file)
     
-    # Crear diccionario por stop_id
-    stops_dict = {stop['stop_id']: stop for stop in stops_data['stops']}
-    print(f"   ✅ {len(stops_dict)} paradas cargadas")
+    # Tabla columnar por stop_id
+    stops = StopTable.from_records(stops_data['stops'])
+    print(f"   ✅ {len(stops)} paradas cargadas")
     
     # 2. Cargar trips
     print("\n2. Cargando trips...")
-    with open(trips_file, 'r', encoding='utf-8') as f:
+    with PROFILER.stage('load_trips'), open(trips_file, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
         trips = [row for row in reader]
     print(f"   ✅ {len(trips)} trips cargados")
     
     # 3. Procesar TODOS los trips
-    print(f"\n3. Procesando todos los trips ({len(trips)} en total)...")
+    print(f"\n3. Procesando todos los trips ({len(trips)} en total, {args.workers} workers)...")
     
-    # Colección de todas las paradas (incluyendo sintéticas)
-    all_stops_dict = stops_dict.copy()
+    with PROFILER.stage('assign'):
+        result = assign_all_trips(trips, stops, shapes_file, workers=args.workers, full=args.full,
+                                  json_dir=base_path if args.json else None,
+                                  simplify_tolerance=args.simplify_tolerance)
+    all_stops = result['all_stops']
+    total_processed = result['total_processed']
+    total_stops_assigned = result['total_stops_assigned']
+    total_synthetic = result['total_synthetic']
+    failed_trips = result['failed_trips']
     
-    # Estadísticas globales
-    total_processed = 0
-    total_stops_assigned = 0
-    total_synthetic = 0
-    failed_trips = []
+    # 4. Guardar secuencias en un solo archivo
+    store_path = default_store_path(base_path)
+    print(f"\n4. Guardando {store_path.name}...")
+    with PROFILER.stage('write_trip_store'):
+        result['sequences'].save(store_path)
+    print(f"   ✅ {len(result['sequences'])} secuencias guardadas")
     
-    for trip_info in trips:
-        trip_id = trip_info['trip_id']
-        shape_id = trip_info['shape_id']
-        route_id = trip_info.get('route_id', 'N/A')
-        
-        print(f"\n   [{total_processed + 1}/{len(trips)}] Trip {trip_id} (Ruta: {route_id})...")
-        
-        route_coords = load_shape_from_gtfs(shapes_file, shape_id)
-        
-        if not route_coords:
-            print(f"      ❌ Shape {shape_id} no encontrado")
-            failed_trips.append({'trip_id': trip_id, 'reason': 'Shape not found'})
-            total_processed += 1
-            continue
-        
-        print(f"      Shape: {len(route_coords)} puntos")
-        
-        # Calcular paradas del lado derecho
-        right_stops = calculate_right_side_stops(route_coords, all_stops_dict, max_distance=20)
-        
-        if not right_stops:
-            print(f"      ⚠️  0 paradas asignadas")
-            failed_trips.append({'trip_id': trip_id, 'reason': 'No stops found'})
-            total_processed += 1
-            continue
-        
-        # Asegurar inicio/fin
-        right_stops, synthetic_added = ensure_start_end_stops(route_coords, right_stops, all_stops_dict, trip_id)
-        
-        # Actualizar diccionario global con las sintéticas nuevas
-        for stop_id in synthetic_added:
-            if stop_id in all_stops_dict:
-                pass  # Ya está
-        
-        # Guardar secuencia del trip
-        trip_stops_sequence = {
-            'trip_id': trip_id,
-            'route_id': route_id,
-            'shape_id': shape_id,
-            'total_stops': len(right_stops),
-            'stops_sequence': [
-                {
-                    'stop_sequence': idx + 1,
-                    'stop_id': stop['stop_id']
-                }
-                for idx, stop in enumerate(right_stops)
-            ]
-        }
-        
-        with open(base_path / f'trip_{trip_id}_stops.json', 'w', encoding='utf-8') as f:
-            json.dump(trip_stops_sequence, f, ensure_ascii=False, indent=2)
-        
-        print(f"      ✅ {len(right_stops)} paradas ({len(synthetic_added)} sintéticas)")
-        
-        total_processed += 1
-        total_stops_assigned += len(right_stops)
-        total_synthetic += len(synthetic_added)
-    
-    # 4. Guardar stops_with_ids_final.json con todas las paradas (incluyendo sintéticas)
-    print(f"\n4. Guardando stops_with_ids_final.json...")
-    all_stops_list = list(all_stops_dict.values())
-    
-    with open(base_path / 'stops_with_ids_final.json', 'w', encoding='utf-8') as f:
+    # 5. Guardar stops_with_ids_final.json con todas las paradas (incluyendo sintéticas)
+    print(f"\n5. Guardando stops_with_ids_final.json...")
+    all_stops_list = all_stops.to_records()
+    
+    with PROFILER.stage('write_final_stops'), open(base_path / 'stops_with_ids_final.json', 'w', encoding='utf-8') as f:
         json.dump({
             'total_stops': len(all_stops_list),
             'synthetic_stops': total_synthetic,
@@ -282,6 +510,8 @@ def main():
             print(f"   • {ft['trip_id']}: {ft['reason']}")
         if len(failed_trips) > 10:
             print(f"   ... y {len(failed_trips) - 10} más")
+    
+    finish_profile()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Benchmark de escalabilidad de las etapas de GTFSv2 sobre ciudades sintéticas
+Para cada tamaño (paradas × trips) genera una ciudad con synthetic_city.py y
+mide, etapa por etapa, tiempo y memoria pico. Cada etapa corre en un proceso
+nuevo (spawn) para que el pico de memoria sea solo el suyo; la carga de sus
+entradas no entra en el tiempo medido.
+
+Escribe un reporte JSON y, con --baseline, lo compara contra un reporte anterior
+y termina con código 1 si alguna etapa empeoró más de --tolerance.
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+REPORT_VERSION = 1
+
+PRESETS = {
+    'quick': [(1000, 100), (5000, 500), (20000, 2000)],
+    'full': [(1000, 100), (10000, 1000), (50000, 5000), (200000, 10000)]
+}
+
+# Diferencias absolutas por debajo de estas no cuentan como regresión (ruido)
+MIN_DELTA = {'seconds': 0.05, 'peak_rss_mb': 5.0}
+
+STAGES = [
+    'shape_store',
+    'generate_unique_stop_ids',
+    'assign_stops',
+    'stop_times',
+    'stops_to_trips_index',
+    'visualizer'
+]
+
+def _maxrss_mb():
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+def _load_stops(path):
+    from stop_table import StopTable
+    return StopTable.from_json(path)
+
+def _load_trips(gtfs_dir):
+    with open(Path(gtfs_dir) / 'trips.txt', 'r', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+def _prepare_stage(stage, city, work_dir, workers):
+    """Carga las entradas de la etapa (fuera de la medición); devuelve la función a medir"""
+    gtfs_dir = Path(city['gtfs_dir'])
+    shapes_file = gtfs_dir / 'shapes.txt'
+
+    if stage == 'shape_store':
+        from shape_store import ShapeStore
+
+        def run():
+            store = ShapeStore.open(shapes_file)
+            return len(store)
+        return run
+
+    if stage == 'generate_unique_stop_ids':
+        from generate_stop_ids import generate_unique_stop_ids
+
+        def run():
+            return len(generate_unique_stop_ids(Path(city['stops_geojson']), work_dir / 'stops_with_ids.json'))
+        return run
+
+    if stage == 'assign_stops':
+        from assign_stops_to_trips import assign_all_trips
+        from trip_store import default_store_path
+        stops = _load_stops(city['stops_file'])
+        trips = _load_trips(gtfs_dir)
+
+        def run():
+            result = assign_all_trips(trips, stops, shapes_file, workers=workers, full=True)
+            # Entradas de las etapas siguientes (formato de los scripts)
+            result['sequences'].save(default_store_path(work_dir))
+            with open(work_dir / 'stops_with_ids_final.json', 'w', encoding='utf-8') as f:
+                json.dump({
+                    'total_stops': len(result['all_stops']),
+                    'synthetic_stops': result['total_synthetic'],
+                    'stops': result['all_stops'].to_records()
+                }, f, ensure_ascii=False, indent=2)
+            return result['total_stops_assigned']
+        return run
+
+    from trip_store import load_trip_sequences
+    stops = _load_stops(work_dir / 'stops_with_ids_final.json')
+    trip_sequences = load_trip_sequences(work_dir)
+
+    if stage == 'stop_times':
+        from generate_stop_times_realistic import STOP_TIMES_FIELDNAMES, TripTimetable
+        from gtfs_writer import write_table_file
+        from speed_model import SpeedModel
+        trips = _load_trips(gtfs_dir)
+
+        def run():
+            timetable = TripTimetable.build(trip_sequences, trips, stops, shapes_file, SpeedModel())
+            return write_table_file(work_dir / 'stop_times.txt', STOP_TIMES_FIELDNAMES, timetable.iter_rows())
+        return run
+
+    if stage == 'stops_to_trips_index':
+        from generate_stops_to_trips_index import build_stops_to_trips_index
+
+        def run():
+            index = build_stops_to_trips_index(trip_sequences, stops)
+            with open(work_dir / 'stops_to_trips_index.json', 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False, indent=2)
+            return index['metadata']['total_connections']
+        return run
+
+    if stage == 'visualizer':
+        from generate_updated_visualizer import generate_html
+
+        def run():
+            html = generate_html(base_path=work_dir, gtfs_dir=gtfs_dir)
+            with open(work_dir / 'trips_visualizer.html', 'w', encoding='utf-8') as f:
+                f.write(html)
+            return len(html)
+        return run
+
+    raise ValueError(f"Etapa desconocida: {stage}")
+
+def run_stage(stage, city, work_dir, workers=1, trace=False):
+    """Corre una etapa en el proceso actual (pensado para un proceso hijo nuevo)"""
+    os.environ['GTFSV2_CACHE_DIR'] = str(Path(work_dir) / 'cache')
+    work_dir = Path(work_dir)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        run = _prepare_stage(stage, city, work_dir, workers)
+        rss_before = _maxrss_mb()
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        items = run()
+        seconds = time.perf_counter() - start
+        traced_peak = tracemalloc.get_traced_memory()[1] if trace else None
+        if trace:
+            tracemalloc.stop()
+
+    result = {
+        'seconds': round(seconds, 4),
+        'peak_rss_mb': round(_maxrss_mb(), 1),
+        'rss_growth_mb': round(_maxrss_mb() - rss_before, 1),
+        'items': items
+    }
+    if traced_peak is not None:
+        result['traced_peak_mb'] = round(traced_peak / (1024 * 1024), 1)
+    return result
+
+def benchmark_size(n_stops, n_trips, stages, workers=1, seed=0, trace=False, keep_dir=None):
+    """Genera la ciudad de un tamaño y mide cada etapa; devuelve la entrada del reporte"""
+    from synthetic_city import generate_city
+
+    tmp = Path(keep_dir) if keep_dir else Path(tempfile.mkdtemp(prefix='gtfsv2_bench_'))
+    city_dir = tmp / f'city_{n_stops}x{n_trips}'
+    work_dir = city_dir / 'work'
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    try:
+        start = time.perf_counter()
+        city = generate_city(city_dir, n_stops, n_trips, seed)
+        entry = {
+            'stops': city['stops'],
+            'trips': city['trips'],
+            'routes': city['routes'],
+            'shape_points': city['shape_points'],
+            'grid_side_km': city['grid_side_km'],
+            'generation_seconds': round(time.perf_counter() - start, 2),
+            'stages': {}
+        }
+
+        ctx = get_context('spawn')
+        for stage in STAGES:
+            if stage not in stages:
+                continue
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                result = pool.submit(run_stage, stage, city, str(work_dir), workers, trace).result()
+            entry['stages'][stage] = result
+            print(f"   {stage:26s} {result['seconds']:9.2f} s  {result['peak_rss_mb']:8.1f} MB pico  "
+                  f"(+{result['rss_growth_mb']:.1f} MB)")
+        return entry
+    finally:
+        if not keep_dir:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+def scaling_exponents(runs):
+    """
+    Pendiente log-log de tiempo vs trips por etapa (1 ≈ lineal, 2 ≈ cuadrático)
+    Solo con dos o más tamaños
+    """
+    exponents = {}
+    for stage in STAGES:
+        points = [(run['trips'], run['stages'][stage]['seconds'])
+                  for run in runs if stage in run['stages'] and run['stages'][stage]['seconds'] > 0]
+        if len({trips for trips, _ in points}) < 2:
+            continue
+        x = np.log([trips for trips, _ in points])
+        y = np.log([seconds for _, seconds in points])
+        exponents[stage] = round(float(np.polyfit(x, y, 1)[0]), 2)
+    return exponents
+
+def compare_reports(report, baseline, tolerance):
+    """Regresiones de tiempo o memoria respecto del reporte base (lista de mensajes)"""
+    previous = {(run['stops'], run['trips']): run for run in baseline.get('runs', [])}
+    regressions = []
+    for run in report['runs']:
+        base_run = previous.get((run['stops'], run['trips']))
+        if base_run is None:
+            continue
+        for stage, result in run['stages'].items():
+            base = base_run['stages'].get(stage)
+            if base is None:
+                continue
+            for metric, min_delta in MIN_DELTA.items():
+                delta = result[metric] - base[metric]
+                if base[metric] > 0 and delta > min_delta and result[metric] > base[metric] * (1 + tolerance):
+                    regressions.append(
+                        f"{run['stops']}x{run['trips']} {stage}: {metric} "
+                        f"{base[metric]} → {result[metric]} (+{result[metric] / base[metric] - 1:.0%})"
+                    )
+    return regressions
+
+def parse_sizes(text):
+    sizes = []
+    for item in text.split(','):
+        stops, trips = item.lower().split('x')
+        sizes.append((int(stops), int(trips)))
+    return sizes
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark de escalabilidad de GTFSv2 con ciudades sintéticas")
+    parser.add_argument('--preset', choices=sorted(PRESETS), default='quick',
+                        help="Tamaños predefinidos (default: quick)")
+    parser.add_argument('--sizes',
+                        help="Tamaños como paradasxtrips separados por coma, p.ej. 1000x100,200000x10000")
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help="Etapas a medir, separadas por coma (default: todas)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Procesos para la asignación (la memoria de los workers no se cuenta)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="Medir también el pico de asignaciones Python/NumPy (más lento)")
+    parser.add_argument('--report', type=Path, default=Path(__file__).parent / 'benchmark_report.json')
+    parser.add_argument('--baseline', type=Path, help="Reporte anterior contra el cual comparar")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Empeoramiento relativo tolerado antes de marcar regresión (default: 0.25)")
+    parser.add_argument('--keep', type=Path, help="Conservar las ciudades generadas en este directorio")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    sizes = parse_sizes(args.sizes) if args.sizes else PRESETS[args.preset]
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"Etapas desconocidas: {', '.join(sorted(unknown))}")
+
+    print("=" * 80)
+    print("📈 BENCHMARK DE ESCALABILIDAD GTFSv2")
+    print("=" * 80)
+
+    runs = []
+    for n_stops, n_trips in sizes:
+        print(f"\n▶ {n_stops} paradas × {n_trips} trips")
+        runs.append(benchmark_size(n_stops, n_trips, stages, args.workers, args.seed,
+                                   args.tracemalloc, args.keep))
+
+    report = {
+        'version': REPORT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'parameters': {'seed': args.seed, 'workers': args.workers, 'stages': stages},
+        'runs': runs,
+        'scaling_exponents': scaling_exponents(runs)
+    }
+
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n📁 Reporte: {args.report}")
+
+    if report['scaling_exponents']:
+        print("\n📐 Exponente de escala (tiempo vs trips):")
+        for stage, exponent in report['scaling_exponents'].items():
+            print(f"   • {stage}: {exponent}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regresiones (tolerancia {args.tolerance:.0%}):")
+            for message in regressions:
+                print(f"   • {message}")
+            sys.exit(1)
+        print(f"\n✅ Sin regresiones respecto de {args.baseline.name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Agrupa paradas cercanas en estaciones (parent_station)
+Los andenes de un mismo paradero (a ambos lados de una avenida, o duplicados
+del GeoJSON con sufijo _1, _2) quedan como paradas sueltas; aquí se agrupan
+con un DBSCAN sobre la grilla de stop_query: una parada es núcleo si tiene
+al menos min_platforms paradas (ella incluida) a menos de radius metros, los
+núcleos vecinos forman una estación (componentes conexas, por propagación de
+la etiqueta mínima) y las paradas no núcleo se suman a la estación de su
+núcleo más cercano. El resto queda sin estación. Como los núcleos se
+encadenan, un grupo de más de max_diameter metros (default 2 × radius) se
+parte con un enlace completo voraz: cada estación arranca en su primer andén
+y suma, del más cercano al más lejano, los que quedan a menos de
+max_diameter de todos sus andenes.
+
+Cada estación se escribe en stops.txt con location_type=1 en el centroide de
+sus andenes, y los andenes con parent_station = su stop_id. Las estaciones no
+aparecen en stop_times (OTP y raptor.py resuelven origen/destino por estación).
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from generate_gtfs_files import generate_stops_txt
+from instrumentation import PROFILER, add_profile_args, configure_from_args, finish_profile, load_json
+from stop_query import StopQuery
+from stop_table import StopTable
+
+DEFAULT_STATION_RADIUS = 10.0  # metros
+MIN_PLATFORMS = 2
+STATION_PREFIX = 'EST_'
+
+class StationTable:
+    """
+    Estaciones (dicts con la estructura de las paradas, location_type=1) y
+    parents: stop_id del andén -> stop_id de su estación
+    """
+
+    def __init__(self, stations, parents):
+        self.stations = stations
+        self.parents = parents
+
+    def __len__(self):
+        return len(self.stations)
+
+    def apply(self, stops):
+        """Marca parent_station en los andenes del StopTable (y lo quita de las demás paradas)"""
+        stops.set_parents(self.parents)
+
+def dbscan_labels(query, radius, min_samples=MIN_PLATFORMS):
+    """
+    Etiqueta de estación por parada de query (-1 = sin estación), numeradas
+    desde 0 en el orden de su primera parada
+    """
+    n = len(query)
+    nearby = query.radius(query.xy, radius, projected=True)
+    counts = nearby.counts()
+    core = counts >= min_samples
+    origin = np.repeat(np.arange(n), counts)
+    neighbor = nearby.indices
+
+    # Componentes conexas entre núcleos: etiqueta mínima del vecindario y
+    # salto de punteros (labels[i] <= i siempre apunta a un nodo de la componente)
+    labels = np.arange(n)
+    linked = core[origin] & core[neighbor]
+    a, b = origin[linked], neighbor[linked]
+    while True:
+        updated = labels.copy()
+        np.minimum.at(updated, a, labels[b])
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            break
+        labels = updated
+    labels[~core] = -1
+
+    # Bordes: la estación del núcleo más cercano (el vecindario viene ordenado por distancia)
+    border = ~core[origin] & core[neighbor]
+    first = np.unique(origin[border], return_index=True)[1]
+    labels[origin[border][first]] = labels[neighbor[border][first]]
+
+    stations = labels >= 0
+    _, dense = np.unique(labels[stations], return_inverse=True)
+    labels[stations] = dense
+    return labels
+
+def split_wide_groups(xy, labels, max_diameter, min_platforms=MIN_PLATFORMS):
+    """
+    Parte los grupos de labels cuyo diámetro supera max_diameter metros
+    (enlace completo voraz, ver docstring del módulo); los pedazos de menos de
+    min_platforms andenes quedan sin estación. Devuelve etiquetas nuevas,
+    numeradas desde 0 en el orden de su primera parada
+    """
+    labels = labels.copy()
+    next_label = labels.max(initial=-1) + 1
+    for label in np.unique(labels[labels >= 0]).tolist():
+        members = np.flatnonzero(labels == label)
+        distance = np.hypot(*(xy[members, None, :] - xy[None, members, :]).transpose(2, 0, 1))
+        if distance.max() <= max_diameter:
+            continue
+        pending = np.ones(len(members), dtype=bool)
+        while pending.any():
+            seed = np.flatnonzero(pending)[0]
+            group = [seed]
+            for candidate in np.flatnonzero(pending)[np.argsort(distance[seed, pending], kind='stable')].tolist():
+                if candidate != seed and (distance[candidate, group] <= max_diameter).all():
+                    group.append(candidate)
+            pending[group] = False
+            labels[members[group]] = next_label if len(group) >= min_platforms else -1
+            next_label += 1
+
+    stations = labels >= 0
+    _, first = np.unique(labels[stations], return_index=True)
+    order = np.argsort(first, kind='stable')
+    dense = np.empty(len(order), dtype=np.int64)
+    dense[order] = np.arange(len(order))
+    labels[stations] = dense[np.unique(labels[stations], return_inverse=True)[1]]
+    return labels
+
+def build_stations(stops, radius=DEFAULT_STATION_RADIUS, min_platforms=MIN_PLATFORMS, max_diameter=None):
+    """
+    Estaciones de las paradas de stops a menos de radius metros entre sí
+
+    Args:
+        stops: StopTable con las paradas (incluyendo sintéticas; todas son andenes)
+        radius: Distancia máxima entre andenes vecinos de una estación (metros)
+        min_platforms: Paradas a menos de radius para que una sea núcleo (DBSCAN min_samples)
+        max_diameter: Distancia máxima entre dos andenes de una estación (default 2 × radius)
+    Returns:
+        StationTable
+    """
+    query = StopQuery.from_stop_table(stops)
+    with PROFILER.stage('dbscan'):
+        labels = dbscan_labels(query, radius, min_platforms)
+        labels = split_wide_groups(query.xy, labels, 2 * radius if max_diameter is None else max_diameter,
+                                   min_platforms)
+
+    members = np.flatnonzero(labels >= 0)
+    members = members[np.argsort(labels[members], kind='stable')]
+    offsets = np.searchsorted(labels[members], np.arange(labels.max() + 2)) if len(members) else np.zeros(1, int)
+
+    # Las filas de query son las del StopTable
+    lats, lons = stops.lat.tolist(), stops.lon.tolist()
+    stations, parents = [], {}
+    for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+        children = members[start:end].tolist()
+        first = children[0]
+        station_id = f"{STATION_PREFIX}{stops.stop_ids[first]}"
+        stations.append({
+            'stop_id': station_id,
+            'stop_code': stops.codes[first],
+            'stop_name': stops.names[first],
+            'stop_lat': sum(lats[child] for child in children) / len(children),
+            'stop_lon': sum(lons[child] for child in children) / len(children),
+            'distrito': stops.districts[stops.district[first]],
+            'location_type': 1,
+            'platforms': len(children)
+        })
+        parents.update((stops.stop_ids[child], station_id) for child in children)
+    return StationTable(stations, parents)
+
+def cluster_stations(base_path, radius=DEFAULT_STATION_RADIUS, min_platforms=MIN_PLATFORMS, max_diameter=None):
+    """
+    Agrupa las paradas de stops_with_ids_final.json: guarda parent_station en
+    los andenes y la lista 'stations' en el mismo archivo, y reescribe
+    gtfs_feed/stops.txt
+    """
+    stops_file = base_path / 'stops_with_ids_final.json'
+    with PROFILER.stage('load_inputs'):
+        stops_data = load_json(stops_file)
+        stops = StopTable.from_records(stops_data['stops'])
+
+    with PROFILER.stage('build_stations'):
+        stations = build_stations(stops, radius, min_platforms, max_diameter)
+        stations.apply(stops)
+    stops_data['stops'] = stops.to_records()
+    stops_data['stations'] = stations.stations
+
+    with PROFILER.stage('write_outputs'):
+        with open(stops_file, 'w', encoding='utf-8') as f:
+            json.dump(stops_data, f, ensure_ascii=False, indent=2)
+        generate_stops_txt(stops_data, base_path / 'gtfs_feed/stops.txt')
+    return stations
+
+def main():
+    parser = argparse.ArgumentParser(description="Agrupa paradas cercanas en estaciones (parent_station)")
+    parser.add_argument('--radius', type=float, default=DEFAULT_STATION_RADIUS,
+                        help=f"Distancia máxima entre andenes vecinos en metros (default: {DEFAULT_STATION_RADIUS:.0f})")
+    parser.add_argument('--min-platforms', type=int, default=MIN_PLATFORMS,
+                        help=f"Paradas a menos del radio para formar estación (default: {MIN_PLATFORMS})")
+    parser.add_argument('--max-diameter', type=float,
+                        help="Distancia máxima entre dos andenes de una estación en metros (default: 2 × radio)")
+    add_profile_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args, 'cluster_stations')
+
+    base_path = Path(__file__).parent
+
+    print("=" * 80)
+    print("🚉 AGRUPANDO PARADAS EN ESTACIONES")
+    print("=" * 80)
+    print()
+
+    stations = cluster_stations(base_path, args.radius, args.min_platforms, args.max_diameter)
+
+    print(f"   ✅ {len(stations)} estaciones con {len(stations.parents)} andenes (radio {args.radius:.0f} m)")
+    if len(stations):
+        sizes = [station['platforms'] for station in stations.stations]
+        print(f"   📊 Andenes por estación: promedio {sum(sizes) / len(sizes):.1f}, máximo {max(sizes)}")
+    print(f"\n📁 Archivos: stops_with_ids_final.json, gtfs_feed/stops.txt")
+    print()
+
+    finish_profile()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Feed GTFS en memoria
+Reúne paradas, trips, rutas, shapes y secuencias de paradas en un solo objeto
+para encadenar las etapas de GTFSv2 sin pasar por archivos intermedios.
+Los archivos (intermedios o finales) se escriben solo cuando se piden.
+"""
+
+import csv
+import json
+from pathlib import Path
+
+from assign_stops_to_trips import SIMPLIFY_TOLERANCE, assign_all_trips
+from cluster_stations import DEFAULT_STATION_RADIUS, build_stations
+from fix_duplicate_routes import dedupe_routes
+from generate_gtfs_files import STOPS_FIELDNAMES, generate_stops_txt, iter_stops_rows
+from generate_stop_ids import build_stop_ids
+from generate_stop_times_realistic import STOP_TIMES_FIELDNAMES, TripTimetable
+from generate_stops_to_trips_index import build_stops_to_trips_index
+from generate_transfers import DEFAULT_RADIUS, TRANSFERS_FIELDNAMES, build_transfers
+from gtfs_writer import SHAPES_FIELDNAMES, GTFSZipWriter, iter_shape_rows, write_table_file
+from instrumentation import load_json
+from service_expansion import (
+    FREQUENCIES_FIELDNAMES, expand_sequences, expand_timetable, iter_expanded_trip_rows
+)
+from shape_store import default_cache_dir, load_shape_store
+from speed_model import SpeedModel
+from stop_table import StopTable
+from stops_trips_csr import build_stop_trip_index, feed_stamps
+from trip_store import default_store_path
+
+# Tablas que no genera el pipeline (se mantienen a mano en gtfs_feed/)
+STATIC_TABLES = ['agency.txt', 'calendar.txt']
+
+# Formas de expandir el servicio (ver service_expansion); None = una salida por trip
+SERVICE_MODES = ('frequencies', 'expand')
+
+def read_csv_rows(path):
+    """Filas de un archivo CSV como lista de dicts"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+def write_csv_rows(path, rows, fieldnames=None):
+    """Escribe filas (dicts) en un CSV; las columnas salen de la primera fila por defecto"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames or rows[0].keys())
+        writer.writeheader()
+        writer.writerows(rows)
+
+class Feed:
+    """
+    Estado del feed entre etapas
+
+    stops: StopTable de paradas (incluye sintéticas después de assign_stops)
+    trips / routes: filas de trips.txt y routes.txt
+    shapes: ShapeStore de shapes.txt
+    sequences: TripSequenceStore (después de assign_stops)
+    timetable: TripTimetable con los tiempos de stop_times (después de build_stop_times)
+    service_plan / service_mode: HeadwayPlan y forma de expandir el servicio (después de plan_service)
+    transfers: TransferTable de transbordos a pie (después de build_transfers)
+    stations: StationTable de estaciones (después de build_stations; los andenes
+        llevan parent_station en self.stops)
+    """
+
+    def __init__(self, stops, trips, routes, shapes_file, cache_dir=None):
+        self.stops = stops
+        self.trips = trips
+        self.routes = routes
+        self.shapes_file = Path(shapes_file)
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.shapes = load_shape_store(self.shapes_file)
+        self.sequences = None
+        self.synthetic_stops = 0
+        self.timetable = None
+        self.stops_to_trips = None
+        self.merged_agencies = {}
+        self.stop_ids_data = None
+        self.service_plan = None
+        self.service_mode = None
+        self.transfers = None
+        self.stations = None
+
+    @classmethod
+    def from_files(cls, gtfs_dir, stops_file=None, stops_geojson=None, cache_dir=None):
+        """
+        Carga el feed base: shapes/trips/routes de gtfs_dir y las paradas desde
+        stops_file (JSON con 'stops') o, si se indica, desde el GeoJSON de paraderos
+        generando los stop_ids en memoria
+        """
+        gtfs_dir = Path(gtfs_dir)
+        stop_ids_data = None
+        if stops_geojson:
+            features = load_json(stops_geojson)['features']
+            stops, grupos, duplicados = build_stop_ids(features)
+            stop_ids_data = {
+                'total_stops': len(stops),
+                'unique_names': len(grupos),
+                'duplicated_names': len(duplicados),
+                'stops': stops
+            }
+        else:
+            stops = StopTable.from_json(stops_file)
+
+        feed = cls(
+            stops,
+            read_csv_rows(gtfs_dir / 'trips.txt'),
+            read_csv_rows(gtfs_dir / 'routes.txt'),
+            gtfs_dir / 'shapes.txt',
+            cache_dir=cache_dir
+        )
+        feed.stop_ids_data = stop_ids_data
+        return feed
+
+    def assign_stops(self, workers=1, full=False, simplify_tolerance=SIMPLIFY_TOLERANCE):
+        """
+        Asigna paradas a cada trip; agrega las sintéticas a self.stops
+        simplify_tolerance: metros del nivel Douglas-Peucker que filtra candidatas (0 = sin filtro)
+        """
+        result = assign_all_trips(self.trips, self.stops, self.shapes_file, workers=workers,
+                                  full=full, cache_dir=self.cache_dir, simplify_tolerance=simplify_tolerance)
+        self.stops = result['all_stops']
+        self.sequences = result['sequences']
+        self.synthetic_stops = result['total_synthetic']
+        return result
+
+    def build_stop_times(self, avg_speed_kmh=20, speed_profile=None):
+        """
+        Calcula los tiempos de stop_times de todos los trips (arrays, sin filas)
+        speed_profile: CSV de franjas horarias (default: speed_profile.csv si existe)
+        """
+        model = SpeedModel.load(speed_profile, default_speed_kmh=avg_speed_kmh)
+        self.timetable = TripTimetable.build(self.sequences, self.trips, self.stops, self.shapes_file, model)
+        return self.timetable
+
+    def dedupe_routes(self):
+        """Deja una sola entrada por route_id"""
+        self.routes, self.merged_agencies = dedupe_routes(self.routes)
+        return self.routes
+
+    def build_stops_to_trips_index(self):
+        """
+        Índice invertido parada -> trips
+        Con servicio 'expand' lista los trips plantilla (una entrada por salida
+        no cabe en un JSON razonable); stops_to_trips.bin sí lista las salidas
+        """
+        self.stops_to_trips = build_stops_to_trips_index(self.sequences, self.stops)
+        if self.service_mode == 'expand':
+            metadata = self.stops_to_trips['metadata']
+            metadata['template_trips'] = True
+            metadata['expanded_trips'] = self.service_plan.total_trips(self.trips)
+        return self.stops_to_trips
+
+    def build_transfers(self, radius=DEFAULT_RADIUS):
+        """Transbordos a pie entre paradas cercanas con rutas distintas (transfers.txt)"""
+        self.transfers = build_transfers(self.stops, self.sequences, radius)
+        return self.transfers
+
+    def build_stations(self, radius=DEFAULT_STATION_RADIUS):
+        """Agrupa paradas cercanas en estaciones (location_type=1, parent_station)"""
+        self.stations = build_stations(self.stops, radius)
+        self.stations.apply(self.stops)
+        return self.stations
+
+    def plan_service(self, plan, mode):
+        """
+        Expande el servicio al escribir el feed: 'frequencies' agrega
+        frequencies.txt; 'expand' escribe una fila de trips/stop_times por salida
+        """
+        if mode not in SERVICE_MODES:
+            raise ValueError(f"Modo de servicio desconocido: {mode}")
+        self.service_plan = plan
+        self.service_mode = mode
+
+    def _trip_table(self):
+        """(fieldnames, filas) de trips.txt según el modo de servicio"""
+        fieldnames = list(self.trips[0].keys())
+        if self.service_mode == 'expand':
+            return fieldnames, iter_expanded_trip_rows(self.trips, self.service_plan, fieldnames)
+        return fieldnames, (list(trip.values()) for trip in self.trips)
+
+    def _served_sequences(self):
+        """Secuencias de los trips de trips.txt: con 'expand', una por salida"""
+        if self.service_mode == 'expand':
+            return expand_sequences(self.sequences, self.service_plan)
+        return self.sequences
+
+    def _stop_times_rows(self):
+        if self.service_mode == 'expand':
+            return expand_timetable(self.timetable, self.service_plan)
+        return self.timetable.iter_rows()
+
+    def stops_data(self):
+        """Paradas con la estructura de stops_with_ids_final.json (+ 'stations' si se agruparon)"""
+        stops_list = self.stops.to_records()
+        stops_data = {
+            'total_stops': len(stops_list),
+            'synthetic_stops': self.synthetic_stops,
+            'stops': stops_list
+        }
+        if self.stations is not None:
+            stops_data['stations'] = self.stations.stations
+        return stops_data
+
+    def write_gtfs(self, output_dir):
+        """
+        Escribe stops.txt, routes.txt, trips.txt, stop_times.txt (y frequencies.txt,
+        transfers.txt) en output_dir; devuelve el número de filas de stop_times
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        generate_stops_txt(self.stops_data(), output_dir / 'stops.txt')
+        write_csv_rows(output_dir / 'routes.txt', self.routes)
+        if self.service_mode == 'expand':
+            write_table_file(output_dir / 'trips.txt', *self._trip_table())
+            # Un frequencies.txt anterior apuntaría a los trips plantilla
+            (output_dir / 'frequencies.txt').unlink(missing_ok=True)
+        else:
+            write_csv_rows(output_dir / 'trips.txt', self.trips)
+        if self.service_mode == 'frequencies':
+            write_table_file(output_dir / 'frequencies.txt', FREQUENCIES_FIELDNAMES,
+                             self.service_plan.frequency_rows(self.trips))
+        if self.transfers is not None:
+            write_table_file(output_dir / 'transfers.txt', TRANSFERS_FIELDNAMES, self.transfers.iter_rows())
+        else:
+            # Un transfers.txt anterior podría apuntar a paradas que ya no existen
+            (output_dir / 'transfers.txt').unlink(missing_ok=True)
+        return write_table_file(output_dir / 'stop_times.txt', STOP_TIMES_FIELDNAMES, self._stop_times_rows())
+
+    def write_gtfs_zip(self, zip_path, static_dir, avg_speed_kmh=20, speed_profile=None):
+        """
+        Escribe el feed completo (incluida shapes.txt) directo a un zip, en una pasada
+        agency.txt y calendar.txt se copian de static_dir. Si stop_times no se
+        calculó antes, se calcula aquí; sus filas se generan mientras se escriben
+        (sin materializar)
+        """
+        static_dir = Path(static_dir)
+        if self.timetable is None:
+            self.build_stop_times(avg_speed_kmh, speed_profile)
+
+        with GTFSZipWriter(zip_path) as feed_zip:
+            for name in STATIC_TABLES:
+                feed_zip.write_file(name, static_dir / name)
+            feed_zip.write_table('routes.txt', list(self.routes[0].keys()),
+                                 (list(route.values()) for route in self.routes))
+            feed_zip.write_table('trips.txt', *self._trip_table())
+            if self.service_mode == 'frequencies':
+                feed_zip.write_table('frequencies.txt', FREQUENCIES_FIELDNAMES,
+                                     self.service_plan.frequency_rows(self.trips))
+            stops_data = self.stops_data()
+            feed_zip.write_table('stops.txt', STOPS_FIELDNAMES,
+                                 iter_stops_rows(stops_data['stops'] + stops_data.get('stations', [])))
+            if self.transfers is not None:
+                feed_zip.write_table('transfers.txt', TRANSFERS_FIELDNAMES, self.transfers.iter_rows())
+            feed_zip.write_table('shapes.txt', SHAPES_FIELDNAMES, iter_shape_rows(self.shapes))
+            feed_zip.write_table('stop_times.txt', STOP_TIMES_FIELDNAMES, self._stop_times_rows())
+        return feed_zip.tables
+
+    def write_stops_to_trips_index(self, output_file):
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(self.stops_to_trips, f, ensure_ascii=False, indent=2)
+
+    def write_stop_trip_csr(self, output_file, feed_dir=None):
+        """
+        Índice CSR parada -> trips (stops_to_trips.bin, ver stops_trips_csr)
+        feed_dir: gtfs_feed/ recién escrito, cuyos stamps se guardan en el índice
+        """
+        stamps = feed_stamps(feed_dir) if feed_dir is not None else None
+        return build_stop_trip_index(self._served_sequences(), output_file, stamps)
+
+    def write_intermediate(self, base_path):
+        """
+        Escribe los intermedios de los scripts por etapa (stops_with_ids.json si
+        las paradas vinieron del GeoJSON, trip_sequences.bin y
+        stops_with_ids_final.json), para seguir con cualquier script suelto
+        """
+        base_path = Path(base_path)
+        if self.stop_ids_data is not None:
+            stop_ids_data = dict(self.stop_ids_data, stops=self.stop_ids_data['stops'].to_records())
+            with open(base_path / 'stops_with_ids.json', 'w', encoding='utf-8') as f:
+                json.dump(stop_ids_data, f, ensure_ascii=False, indent=2)
+        self.sequences.save(default_store_path(base_path))
+        with open(base_path / 'stops_with_ids_final.json', 'w', encoding='utf-8') as f:
+            json.dump(self.stops_data(), f, ensure_ascii=False, indent=2)
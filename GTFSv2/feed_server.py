@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Servicio HTTP local de consultas sobre el feed de GTFSv2
+Carga una sola vez las salidas del pipeline (stops_with_ids_final.json,
+stops_to_trips.bin, gtfs_feed/routes.txt, trips.txt y stop_times.txt) y
+responde desde índices en memoria:
+
+    GET /stops/<stop_id>                         parada + rutas y trips que pasan
+    GET /trips/<trip_id>                         secuencia de paradas con horarios
+    GET /routes/<route_id>                       ruta + sus trips
+    GET /near?lat=..&lon=..&radius=300&limit=20  paradas cercanas a un punto
+    GET /stats                                   concurrencia, latencias y caché
+
+Las respuestas de /stops, /trips y /routes se serializan al cargar (JSON en
+bytes, con su versión gzip calculada al primer pedido que la acepte); las de
+/near se guardan en un LRU por parámetros. Sin dependencias fuera de la
+biblioteca estándar y NumPy (asyncio.start_server, HTTP/1.1 con keep-alive).
+"""
+
+import argparse
+import asyncio
+import csv
+import gzip
+import json
+import time
+from collections import OrderedDict, defaultdict, deque
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+from instrumentation import load_json
+from stop_query import StopQuery
+from stops_trips_csr import open_index
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_LRU_SIZE = 1024
+DEFAULT_RADIUS = 300.0  # metros
+MAX_RADIUS = 5000.0
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 200
+LATENCY_WINDOW = 2048  # últimas latencias guardadas por endpoint
+MIN_GZIP_BYTES = 256
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+class CachedResponse:
+    """Cuerpo JSON serializado una vez, con su versión gzip calculada bajo demanda"""
+
+    __slots__ = ('status', 'body', '_gzipped')
+
+    def __init__(self, payload, status=200):
+        self.status = status
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        self._gzipped = None
+
+    def encoded(self, accept_gzip):
+        """(cuerpo, content-encoding o None) según lo que acepte el cliente"""
+        if not accept_gzip or len(self.body) < MIN_GZIP_BYTES:
+            return self.body, None
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6, mtime=0)
+        return self._gzipped, 'gzip'
+
+class LRUCache:
+    """Caché LRU acotado (OrderedDict) para consultas con parámetros"""
+
+    def __init__(self, max_size=DEFAULT_LRU_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        response = self.entries.get(key)
+        if response is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return response
+
+    def put(self, key, response):
+        self.entries[key] = response
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+class FeedIndex:
+    """Índices en memoria sobre las salidas del pipeline"""
+
+    def __init__(self, base_path):
+        base_path = Path(base_path)
+        feed_dir = base_path / 'gtfs_feed'
+
+        self.stops = {s['stop_id']: s for s in load_json(base_path / 'stops_with_ids_final.json')['stops']}
+
+        # Se reconstruye si quedó viejo respecto de trips.txt / stop_times.txt
+        self.stop_trips = open_index(base_path)
+
+        with open(feed_dir / 'routes.txt', 'r', encoding='utf-8') as f:
+            self.routes = {route['route_id']: route for route in csv.DictReader(f)}
+        with open(feed_dir / 'trips.txt', 'r', encoding='utf-8') as f:
+            self.trips = {trip['trip_id']: trip for trip in csv.DictReader(f)}
+        self.route_trips = defaultdict(list)
+        for trip in self.trips.values():
+            self.route_trips[trip['route_id']].append(trip['trip_id'])
+
+        # Horarios por trip y stop_sequence
+        self.stop_times = defaultdict(dict)
+        with open(feed_dir / 'stop_times.txt', 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            columns = {name: i for i, name in enumerate(next(reader))}
+            trip_col, seq_col = columns['trip_id'], columns['stop_sequence']
+            arr_col, dep_col = columns['arrival_time'], columns['departure_time']
+            for row in reader:
+                self.stop_times[row[trip_col]][int(row[seq_col])] = (row[arr_col], row[dep_col])
+
+        self.stop_query = StopQuery.from_stops_dict(self.stops)
+
+    def stop_summary(self, stop_id):
+        stop = self.stops[stop_id]
+        return {
+            'stop_id': stop_id,
+            'stop_name': stop.get('stop_name', ''),
+            'stop_code': stop.get('stop_code', ''),
+            'stop_lat': stop['stop_lat'],
+            'stop_lon': stop['stop_lon'],
+            'distrito': stop.get('distrito', '')
+        }
+
+    def stop_payload(self, stop_id):
+        if stop_id not in self.stops:
+            return None
+        trips = self.stop_trips.trips_at(stop_id)
+        payload = self.stop_summary(stop_id)
+        payload['routes'] = self.stop_trips.routes_at(stop_id)
+        payload['total_trips'] = len(trips)
+        payload['trips'] = trips
+        return payload
+
+    def trip_payload(self, trip_id):
+        stop_ids = self.stop_trips.stops_of(trip_id)
+        if stop_ids is None:
+            return None
+        trip = self.trips.get(trip_id, {})
+        times = self.stop_times.get(trip_id, {})
+        stops = []
+        for seq, stop_id in enumerate(stop_ids, 1):
+            entry = {'stop_sequence': seq, **(self.stop_summary(stop_id) if stop_id in self.stops
+                                              else {'stop_id': stop_id})}
+            if seq in times:
+                entry['arrival_time'], entry['departure_time'] = times[seq]
+            stops.append(entry)
+        return {
+            'trip_id': trip_id,
+            'route_id': self.stop_trips.route_of(trip_id),
+            'shape_id': trip.get('shape_id', ''),
+            'trip_headsign': trip.get('trip_headsign', ''),
+            'total_stops': len(stops),
+            'stops': stops
+        }
+
+    def route_payload(self, route_id):
+        route = self.routes.get(route_id)
+        if route is None:
+            return None
+        return {
+            **route,
+            'total_trips': len(self.route_trips.get(route_id, [])),
+            'trips': [
+                {
+                    'trip_id': trip_id,
+                    'trip_headsign': self.trips[trip_id].get('trip_headsign', ''),
+                    'shape_id': self.trips[trip_id].get('shape_id', ''),
+                    'total_stops': len(self.stop_trips.stops_of(trip_id) or [])
+                }
+                for trip_id in self.route_trips.get(route_id, [])
+            ]
+        }
+
+    def near_payload(self, lat, lon, radius, limit):
+        """Paradas a menos de radius metros de (lat, lon), las más cercanas primero"""
+        result = self.stop_query.radius([[lon, lat]], radius)
+        stops = []
+        for stop_id, distance in result.stops_of(0)[:limit]:
+            entry = self.stop_summary(stop_id)
+            entry['distance_m'] = round(distance, 1)
+            entry['routes'] = self.stop_trips.routes_at(stop_id)
+            stops.append(entry)
+        return {'lat': lat, 'lon': lon, 'radius': radius, 'total_stops': len(stops), 'stops': stops}
+
+class ServerStats:
+    """Contadores de concurrencia, latencia por endpoint y caché"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.connections = 0
+        self.open_connections = 0
+        self.max_open_connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = defaultdict(int)
+        self.statuses = defaultdict(int)
+        self.bytes_sent = 0
+        self.gzip_responses = 0
+        self.latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+
+    def begin(self):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return time.perf_counter()
+
+    def end(self, endpoint, status, started, n_bytes, gzipped):
+        self.in_flight -= 1
+        self.requests[endpoint] += 1
+        self.statuses[status] += 1
+        self.bytes_sent += n_bytes
+        self.gzip_responses += int(gzipped)
+        self.latencies[endpoint].append(time.perf_counter() - started)
+
+    def report(self, precomputed, lru):
+        latencies = {}
+        for endpoint, values in self.latencies.items():
+            ms = np.array(values) * 1000
+            latencies[endpoint] = {
+                'count': self.requests[endpoint],
+                'p50_ms': round(float(np.percentile(ms, 50)), 3),
+                'p95_ms': round(float(np.percentile(ms, 95)), 3),
+                'p99_ms': round(float(np.percentile(ms, 99)), 3),
+                'max_ms': round(float(ms.max()), 3)
+            }
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'connections': self.connections,
+            'open_connections': self.open_connections,
+            'max_open_connections': self.max_open_connections,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'requests': sum(self.requests.values()),
+            'statuses': {str(status): n for status, n in sorted(self.statuses.items())},
+            'bytes_sent': self.bytes_sent,
+            'gzip_responses': self.gzip_responses,
+            'latency': latencies,
+            'cache': {
+                'precomputed_responses': precomputed,
+                'lru_entries': len(lru.entries),
+                'lru_max_size': lru.max_size,
+                'lru_hits': lru.hits,
+                'lru_misses': lru.misses
+            }
+        }
+
+def _error(status, message):
+    return CachedResponse({'error': message}, status=status)
+
+class FeedServer:
+    """Enruta las consultas y mantiene las respuestas serializadas"""
+
+    def __init__(self, feed_index, lru_size=DEFAULT_LRU_SIZE):
+        self.feed = feed_index
+        self.lru = LRUCache(lru_size)
+        self.stats = ServerStats()
+        self.responses = {}
+
+    def warm(self):
+        """Serializa de antemano las respuestas de /stops, /trips y /routes"""
+        for kind, ids, build in (
+            ('stops', self.feed.stops, self.feed.stop_payload),
+            ('trips', self.feed.stop_trips.trip_ids, self.feed.trip_payload),
+            ('routes', self.feed.routes, self.feed.route_payload)
+        ):
+            for item_id in ids:
+                payload = build(item_id)
+                if payload is not None:
+                    self.responses[(kind, item_id)] = CachedResponse(payload)
+        return len(self.responses)
+
+    def resolve(self, target):
+        """(endpoint, CachedResponse) para la ruta pedida"""
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+
+        if len(parts) == 2 and parts[0] in ('stops', 'trips', 'routes'):
+            response = self.responses.get((parts[0], parts[1]))
+            return parts[0], response or _error(404, f"{parts[0][:-1]} no encontrado: {parts[1]}")
+
+        if parts == ['near']:
+            return 'near', self._near(parse_qs(url.query))
+
+        if parts == ['stats']:
+            return 'stats', CachedResponse(self.stats.report(len(self.responses), self.lru))
+
+        return 'other', _error(404, f"ruta desconocida: {url.path}")
+
+    def _near(self, query):
+        try:
+            lat = float(query['lat'][0])
+            lon = float(query['lon'][0])
+            radius = min(float(query.get('radius', [DEFAULT_RADIUS])[0]), MAX_RADIUS)
+            limit = min(int(query.get('limit', [DEFAULT_LIMIT])[0]), MAX_LIMIT)
+        except (KeyError, ValueError):
+            return _error(400, "parámetros: lat, lon (obligatorios), radius (m), limit")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180) or radius <= 0 or limit <= 0:
+            return _error(400, "lat/lon fuera de rango o radius/limit no positivos")
+
+        # ~1 m de resolución en la clave: consultas casi idénticas comparten entrada
+        key = (round(lat, 5), round(lon, 5), round(radius, 1), limit)
+        response = self.lru.get(key)
+        if response is None:
+            response = CachedResponse(self.feed.near_payload(*key))
+            self.lru.put(key, response)
+        return response
+
+    async def handle_connection(self, reader, writer):
+        stats = self.stats
+        stats.connections += 1
+        stats.open_connections += 1
+        stats.max_open_connections = max(stats.max_open_connections, stats.open_connections)
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+
+                # Descartar el cuerpo (POST, PUT...) para que el siguiente pedido
+                # de la conexión empiece en su línea de petición
+                try:
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        break
+                    if length:
+                        await reader.readexactly(length)
+                except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                started = self.stats.begin()
+                if method in ('GET', 'HEAD'):
+                    endpoint, response = self.resolve(target)
+                else:
+                    endpoint, response = 'other', _error(405, f"método no soportado: {method}")
+                body, encoding = response.encoded('gzip' in headers.get('accept-encoding', ''))
+
+                # Un cuerpo chunked no se descarta: se responde y se cierra
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and version.strip() == 'HTTP/1.1'
+                              and 'transfer-encoding' not in headers)
+                out = [
+                    f"HTTP/1.1 {response.status} {STATUS_TEXT.get(response.status, '')}",
+                    "Content-Type: application/json; charset=utf-8",
+                    f"Content-Length: {len(body)}",
+                    "Vary: Accept-Encoding",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}"
+                ]
+                if encoding:
+                    out.append(f"Content-Encoding: {encoding}")
+                writer.write(('\r\n'.join(out) + '\r\n\r\n').encode('latin-1'))
+                if method != 'HEAD':
+                    writer.write(body)
+                await writer.drain()
+                self.stats.end(endpoint, response.status, started, len(body), encoding is not None)
+
+                if not keep_alive:
+                    break
+        finally:
+            stats.open_connections -= 1
+            writer.close()
+
+async def serve(server, host, port):
+    tcp_server = await asyncio.start_server(server.handle_connection, host, port)
+    addresses = ', '.join(str(sock.getsockname()) for sock in tcp_server.sockets)
+    print(f"🌐 Escuchando en {addresses} (Ctrl+C para salir)")
+    async with tcp_server:
+        await tcp_server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Servicio HTTP local de consultas sobre el feed de GTFSv2")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"Interfaz (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"Puerto (default: {DEFAULT_PORT})")
+    parser.add_argument('--base-path', type=Path, default=Path(__file__).parent,
+                        help="Directorio con las salidas del pipeline (default: GTFSv2/)")
+    parser.add_argument('--lru-size', type=int, default=DEFAULT_LRU_SIZE,
+                        help=f"Entradas del caché de /near (default: {DEFAULT_LRU_SIZE})")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("🚏 SERVICIO DE CONSULTAS GTFSv2")
+    print("=" * 80)
+    print()
+
+    start = time.perf_counter()
+    feed_index = FeedIndex(args.base_path)
+    server = FeedServer(feed_index, lru_size=args.lru_size)
+    precomputed = server.warm()
+    print(f"   ✅ {len(feed_index.stops)} paradas, {len(feed_index.trips)} trips, {len(feed_index.routes)} rutas")
+    print(f"   ✅ {precomputed} respuestas serializadas en {time.perf_counter() - start:.2f} s")
+    print()
+
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    except KeyboardInterrupt:
+        print("\n👋 Servicio detenido")
+
+if __name__ == "__main__":
+    main()
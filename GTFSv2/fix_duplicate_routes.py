@@ -8,6 +8,31 @@ import csv
 from pathlib import Path
 from collections import defaultdict
 
+def dedupe_routes(routes):
+    """
+    Mantiene una sola entrada por route_id (la primera ocurrencia)
+    
+    Returns:
+        (unique_routes, kept_agencies): rutas ordenadas por route_id y, para
+        las que tenían duplicados, la lista de agency_id fusionados
+    """
+    route_groups = defaultdict(list)
+    for route in routes:
+        route_groups[route['route_id']].append(route)
+    
+    unique_routes = []
+    kept_agencies = {}
+    
+    for route_id, instances in sorted(route_groups.items()):
+        # Mantener solo la primera ocurrencia
+        unique_routes.append(instances[0])
+        
+        if len(instances) > 1:
+            # Guardar info de qué agencias operan esta ruta
+            kept_agencies[route_id] = [r['agency_id'] for r in instances]
+    
+    return unique_routes, kept_agencies
+
 def main():
     base_path = Path(__file__).parent
     
@@ -56,19 +81,9 @@ def main():
     
     # 4. Decidir qué ruta mantener (primera ocurrencia)
     print("2. Seleccionando rutas únicas...")
-    unique_routes = []
-    kept_agencies = {}
-    
-    for route_id, instances in sorted(route_groups.items()):
-        # Mantener solo la primera ocurrencia
-        first_route = instances[0][1]
-        unique_routes.append(first_route)
-        
-        if len(instances) > 1:
-            # Guardar info de qué agencias operan esta ruta
-            agencies = [r['agency_id'] for _, r in instances]
-            kept_agencies[route_id] = agencies
-            print(f"   {route_id}: Mantenida primera, fusionadas {len(instances)} agencias: {', '.join(agencies)}")
+    unique_routes, kept_agencies = dedupe_routes(routes)
+    for route_id, agencies in kept_agencies.items():
+        print(f"   {route_id}: Mantenida primera, fusionadas {len(agencies)} agencias: {', '.join(agencies)}")
     
     print(f"\n   ✅ Rutas después de unificación: {len(unique_routes)}")
     print()
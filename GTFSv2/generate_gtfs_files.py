@@ -9,39 +9,45 @@ import json
 import csv
 from pathlib import Path
 
+from gtfs_writer import write_table_file
+from trip_store import load_trip_sequences
+
+STOPS_FIELDNAMES = [
+    'stop_id',
+    'stop_code',
+    'stop_name',
+    'stop_lat',
+    'stop_lon',
+    'location_type',
+    'parent_station'
+]
+
+def iter_stops_rows(stops):
+    """Filas de stops.txt (en el orden de STOPS_FIELDNAMES)"""
+    for stop in stops:
+        yield (
+            stop['stop_id'],
+            stop['stop_code'],
+            stop['stop_name'],
+            stop['stop_lat'],
+            stop['stop_lon'],
+            stop.get('location_type', 0),  # 0 = stop/platform, 1 = estación
+            stop.get('parent_station', '')
+        )
+
 def generate_stops_txt(stops_data, output_file):
-    """Genera stops.txt desde stops_with_ids_final.json"""
+    """Genera stops.txt desde stops_with_ids_final.json (paradas y, si hay, estaciones)"""
     print("📝 Generando stops.txt...")
     
-    fieldnames = [
-        'stop_id',
-        'stop_code',
-        'stop_name',
-        'stop_lat',
-        'stop_lon',
-        'location_type',
-        'parent_station'
-    ]
-    
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        for stop in stops_data['stops']:
-            writer.writerow({
-                'stop_id': stop['stop_id'],
-                'stop_code': stop['stop_code'],
-                'stop_name': stop['stop_name'],
-                'stop_lat': stop['stop_lat'],
-                'stop_lon': stop['stop_lon'],
-                'location_type': 0,  # 0 = stop/platform
-                'parent_station': ''
-            })
+    stations = stops_data.get('stations', [])
+    write_table_file(output_file, STOPS_FIELDNAMES, iter_stops_rows(stops_data['stops'] + stations))
     
     print(f"   ✅ {len(stops_data['stops'])} paradas escritas en {output_file}")
+    if stations:
+        print(f"   ✅ {len(stations)} estaciones (location_type=1)")
 
-def generate_stop_times_txt(trip_files, output_file):
-    """Genera stop_times.txt desde archivos trip_*.json"""
+def generate_stop_times_txt(trip_sequences, output_file):
+    """Genera stop_times.txt desde las secuencias de trip_sequences.bin"""
     print("\n📝 Generando stop_times.txt...")
     
     fieldnames = [
@@ -60,10 +66,7 @@ def generate_stop_times_txt(trip_files, output_file):
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
         
-        for trip_file in sorted(trip_files):
-            with open(trip_file, 'r', encoding='utf-8') as tf:
-                trip_data = json.load(tf)
-            
+        for trip_data in trip_sequences.iter_trips():
             trip_id = trip_data['trip_id']
             num_stops = len(trip_data['stops_sequence'])
             
@@ -105,7 +108,7 @@ def generate_stop_times_txt(trip_files, output_file):
                 total_stop_times += 1
     
     print(f"   ✅ {total_stop_times} stop_times escritos en {output_file}")
-    print(f"   📊 Promedio: {total_stop_times / len(trip_files):.1f} paradas por trip")
+    print(f"   📊 Promedio: {total_stop_times / len(trip_sequences):.1f} paradas por trip")
 
 def main():
     base_path = Path(__file__).parent
@@ -125,11 +128,11 @@ def main():
     
     # 2. Generar stop_times.txt
     print("\n2. Procesando stop_times.txt...")
-    trip_files = sorted(base_path.glob('trip_*.json'))
-    print(f"   📁 Encontrados {len(trip_files)} archivos trip_*.json")
+    trip_sequences = load_trip_sequences(base_path)
+    print(f"   📁 Encontradas {len(trip_sequences)} secuencias de trips")
     
     output_stop_times = base_path / 'stop_times.txt'
-    generate_stop_times_txt(trip_files, output_stop_times)
+    generate_stop_times_txt(trip_sequences, output_stop_times)
     
     # Resumen final
     print("\n" + "=" * 80)
@@ -137,7 +140,7 @@ def main():
     print("=" * 80)
     print(f"\n📁 Archivos creados:")
     print(f"   • stops.txt ({stops_data['total_stops']} paradas)")
-    print(f"   • stop_times.txt ({len(trip_files)} trips)")
+    print(f"   • stop_times.txt ({len(trip_sequences)} trips)")
     print(f"\n📦 Paradas totales:")
     print(f"   • Regulares: {stops_data['total_stops'] - stops_data['synthetic_stops']}")
     print(f"   • Sintéticas: {stops_data['synthetic_stops']}")
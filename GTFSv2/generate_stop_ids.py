@@ -8,6 +8,54 @@ import json
 from collections import defaultdict
 from pathlib import Path
 
+import numpy as np
+
+from stop_table import StopTable
+
+def build_stop_ids(features):
+    """
+    Genera stop_ids únicos en memoria desde las features del GeoJSON de paraderos
+    
+    Returns:
+        (stops, grupos, duplicados): StopTable con las paradas en el orden
+        original, índices agrupados por nombre y los nombres duplicados
+    """
+    # Agrupar por nombre para detectar duplicados
+    grupos = defaultdict(list)
+    for idx, feature in enumerate(features):
+        nombre = feature['properties']['nombre']
+        grupos[nombre].append(idx)
+    
+    duplicados = {nombre: indices for nombre, indices in grupos.items() if len(indices) > 1}
+    
+    # Una fila por feature en el orden original; los índices de cada grupo son
+    # crecientes, así que el sufijo es el número de aparición del nombre
+    stop_ids, codes, lats, lons, distritos = [], [], [], [], []
+    apariciones = defaultdict(int)
+    
+    for feature in features:
+        props = feature['properties']
+        coords = feature['geometry']['coordinates']
+        nombre = props['nombre']
+        
+        if nombre in duplicados:
+            # Nombre duplicado - agregar sufijo (código original sin sufijo,
+            # nombre con sufijo para diferenciar)
+            apariciones[nombre] += 1
+            stop_ids.append(f"{nombre}_{apariciones[nombre]}")
+        else:
+            # Nombre único - usar tal cual
+            stop_ids.append(nombre)
+        codes.append(nombre)
+        lats.append(coords[1])
+        lons.append(coords[0])
+        distritos.append(props['distrito'])
+    
+    stops = StopTable.from_columns(stop_ids, codes, stop_ids, lats, lons, distritos,
+                                   original_index=np.arange(len(features)))
+    
+    return stops, grupos, duplicados
+
 def generate_unique_stop_ids(stops_geojson_file, output_file):
     """Genera stop_ids únicos y guarda el mapeo"""
     
@@ -23,70 +71,23 @@ def generate_unique_stop_ids(stops_geojson_file, output_file):
     total = len(data['features'])
     print(f"   ✅ {total} paradas cargadas")
     
-    # Agrupar por nombre para detectar duplicados
+    # Agrupar por nombre y generar stop_ids
     print("\n2. Analizando nombres...")
-    grupos = defaultdict(list)
-    for idx, feature in enumerate(data['features']):
-        nombre = feature['properties']['nombre']
-        grupos[nombre].append(idx)
-    
-    duplicados = {nombre: indices for nombre, indices in grupos.items() if len(indices) > 1}
+    stops, grupos, duplicados = build_stop_ids(data['features'])
     print(f"   ✅ {len(grupos)} nombres únicos")
     print(f"   ⚠️  {len(duplicados)} nombres duplicados")
     
-    # Generar stop_ids
     print("\n3. Generando stop_ids...")
-    stops_data = []
-    
-    for nombre, indices in grupos.items():
-        if len(indices) == 1:
-            # Nombre único - usar tal cual
-            idx = indices[0]
-            feature = data['features'][idx]
-            coords = feature['geometry']['coordinates']
-            props = feature['properties']
-            
-            stops_data.append({
-                'stop_id': nombre,
-                'stop_code': nombre,
-                'stop_name': nombre,
-                'stop_lat': coords[1],
-                'stop_lon': coords[0],
-                'distrito': props['distrito'],
-                'original_index': idx
-            })
-        else:
-            # Nombre duplicado - agregar sufijos
-            for suffix_idx, idx in enumerate(indices, 1):
-                feature = data['features'][idx]
-                coords = feature['geometry']['coordinates']
-                props = feature['properties']
-                
-                stop_id = f"{nombre}_{suffix_idx}"
-                
-                stops_data.append({
-                    'stop_id': stop_id,
-                    'stop_code': nombre,  # Código original sin sufijo
-                    'stop_name': stop_id, # Nombre con sufijo para diferenciar
-                    'stop_lat': coords[1],
-                    'stop_lon': coords[0],
-                    'distrito': props['distrito'],
-                    'original_index': idx
-                })
-    
-    # Ordenar por índice original para mantener orden
-    stops_data.sort(key=lambda x: x['original_index'])
-    
-    print(f"   ✅ {len(stops_data)} stop_ids generados")
+    print(f"   ✅ {len(stops)} stop_ids generados")
     
     # Guardar resultado
     print(f"\n4. Guardando resultado...")
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump({
-            'total_stops': len(stops_data),
+            'total_stops': len(stops),
             'unique_names': len(grupos),
             'duplicated_names': len(duplicados),
-            'stops': stops_data
+            'stops': stops.to_records()
         }, f, ensure_ascii=False, indent=2)
     
     print(f"   ✅ Archivo guardado: {output_file.name}")
@@ -95,16 +96,16 @@ def generate_unique_stop_ids(stops_geojson_file, output_file):
     if duplicados:
         print(f"\n5. Ejemplos de stop_ids con sufijos:")
         for nombre in list(duplicados.keys())[:5]:
-            stops_con_sufijo = [s for s in stops_data if s['stop_code'] == nombre]
             print(f"   • {nombre}:")
-            for stop in stops_con_sufijo:
-                print(f"     → {stop['stop_id']} ({stop['distrito']})")
+            for suffix_idx in range(1, len(grupos[nombre]) + 1):
+                row = stops.index_of(f"{nombre}_{suffix_idx}")
+                print(f"     → {stops.stop_ids[row]} ({stops.districts[stops.district[row]]})")
     
     print("\n" + "=" * 80)
     print("✅ COMPLETADO")
     print("=" * 80)
     
-    return stops_data
+    return stops
 
 def main():
     base_path = Path(__file__).parent
@@ -112,11 +113,11 @@ def main():
     stops_file = base_path / 'paraderos_consolidados.geojson'
     output_file = base_path / 'stops_with_ids.json'
     
-    stops_data = generate_unique_stop_ids(stops_file, output_file)
+    stops = generate_unique_stop_ids(stops_file, output_file)
     
     print(f"\n📊 Resumen:")
-    print(f"   • Total de paradas: {len(stops_data)}")
-    print(f"   • IDs únicos generados: {len(stops_data)}")
+    print(f"   • Total de paradas: {len(stops)}")
+    print(f"   • IDs únicos generados: {len(stops)}")
 
 if __name__ == "__main__":
     main()
@@ -1,210 +1,246 @@
 #!/usr/bin/env python3
 """
 Genera stop_times.txt con tiempos calculados según distancia real
-Usa la distancia a lo largo de la ruta (distance_along) de los archivos trip_*.json
+Usa la distancia a lo largo de la ruta (distance_along) de las secuencias en trip_sequences.bin
+y las velocidades por franja horaria de speed_model (speed_profile.csv, o velocidad constante)
 """
 
-import json
+import argparse
 import csv
 from pathlib import Path
-from shapely.geometry import Point, LineString
 
-def calculate_travel_time(distance_km, avg_speed_kmh=20):
-    """
-    Calcula tiempo de viaje basado en distancia
-    
-    Args:
-        distance_km: Distancia en kilómetros
-        avg_speed_kmh: Velocidad promedio (20 km/h para buses urbanos)
-    
-    Returns:
-        Tiempo en minutos (mínimo 1 minuto)
-    """
-    time_hours = distance_km / avg_speed_kmh
-    time_minutes = int(time_hours * 60)
-    return max(time_minutes, 1)  # Mínimo 1 minuto
-
-def load_shape_from_gtfs(shapes_file, shape_id):
-    """Carga las coordenadas de una shape desde shapes.txt"""
-    coords = []
-    with open(shapes_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row['shape_id'] == shape_id:
-                coords.append((
-                    float(row['shape_pt_lon']),
-                    float(row['shape_pt_lat']),
-                    int(row['shape_pt_sequence'])
-                ))
-    coords.sort(key=lambda x: x[2])
-    return [(lon, lat) for lon, lat, _ in coords]
-
-def calculate_distance_along_for_stops(route_coords, stops_with_coords):
+import numpy as np
+
+from gtfs_time import TimeTable
+from gtfs_writer import write_table_file
+from instrumentation import PROFILER, add_profile_args, configure_from_args, finish_profile
+from projection import project_coords
+from shape_store import load_shape_store
+from speed_model import SpeedModel
+from stop_table import StopTable
+from trip_store import load_trip_sequences
+
+START_SECONDS = 6 * 3600  # 06:00:00, salida de la primera parada
+
+STOP_TIMES_FIELDNAMES = [
+    'trip_id',
+    'arrival_time',
+    'departure_time',
+    'stop_id',
+    'stop_sequence',
+    'pickup_type',
+    'drop_off_type'
+]
+
+class TripTimetable:
     """
-    Calcula la distancia a lo largo de la ruta para cada parada
-    
-    Args:
-        route_coords: Lista de coordenadas (lon, lat) de la ruta
-        stops_with_coords: Lista de diccionarios con stop_id, lat, lon
-    
-    Returns:
-        Lista de diccionarios con stop_id y distance_along_km
+    stop_times de todos los trips en arrays planos (CSR por trip): las paradas
+    del trip i ocupan offsets[i]:offsets[i+1]. Los tiempos (segundos) se
+    calculan con SpeedModel.schedule para todos los trips en una sola pasada
     """
-    route_line = LineString(route_coords)
-    
-    stops_with_distance = []
-    for stop in stops_with_coords:
-        stop_point = Point(stop['lon'], stop['lat'])
-        distance_along = route_line.project(stop_point)  # En grados
-        distance_along_km = distance_along * 111  # Convertir a km (aprox)
-        
-        stops_with_distance.append({
-            'stop_id': stop['stop_id'],
-            'stop_sequence': stop['stop_sequence'],
-            'distance_along_km': distance_along_km
-        })
-    
-    return stops_with_distance
-
-def generate_stop_times_with_realistic_times(base_path, avg_speed_kmh=20):
+
+    def __init__(self, trip_ids, route_ids, offsets, stop_ids, stop_sequences, distances, districts,
+                 model, start_seconds=START_SECONDS, dwell_secs=0.0):
+        self.trip_ids = list(trip_ids)
+        self.route_ids = list(route_ids)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.stop_ids = list(stop_ids)
+        self.stop_sequences = np.asarray(stop_sequences, dtype=np.int64)
+        self.distances = np.asarray(distances, dtype=np.float64)
+        self.model = model
+        self.start_seconds = start_seconds
+        self.dwell_secs = dwell_secs
+
+        lengths = np.diff(self.offsets)
+        stop_routes = np.repeat(np.array(self.route_ids, dtype=object), lengths)
+        self.profiles = model.hop_profiles(stop_routes, districts)
+        self.arrival, self.departure = model.schedule(self.offsets, self.distances, self.profiles,
+                                                      start_seconds, dwell_secs)
+
+        # Subida solo en la primera parada de la secuencia, bajada solo en la última
+        last_sequence = np.repeat(lengths, lengths)
+        self.pickup_type = np.where((self.stop_sequences == last_sequence) & (self.stop_sequences != 1), 1, 0)
+        self.drop_off_type = np.where(self.stop_sequences == 1, 1, 0)
+
+    @classmethod
+    def build(cls, trip_sequences, trips, stops, shapes_file, model, start_seconds=START_SECONDS,
+              dwell_secs=0.0):
+        """
+        Arma el timetable desde el store de secuencias
+
+        Args:
+            trip_sequences: TripSequenceStore con las secuencias de paradas
+            trips: Filas de trips.txt (solo se generan los trips presentes)
+            stops: StopTable con las paradas (incluyendo sintéticas)
+            shapes_file: shapes.txt (solo para secuencias sin distancias guardadas)
+            model: SpeedModel
+        """
+        trips_info = {trip['trip_id']: trip for trip in trips}
+        trip_ids, route_ids, entries, distances = [], [], [], []
+        offsets = [0]
+
+        # Fila del StopTable de cada stop_id del store (-1 = no está, se omite)
+        stop_index = np.asarray(trip_sequences.stop_index, dtype=np.int64)
+        entry_rows = stops.rows(trip_sequences.stop_ids)[stop_index]
+        store_offsets = np.asarray(trip_sequences.offsets, dtype=np.int64)
+        trip_start = np.repeat(store_offsets[:-1], np.diff(store_offsets))
+        store_offsets = store_offsets.tolist()
+
+        for i, trip_id in enumerate(trip_sequences.trip_ids):
+            trip = trips_info.get(trip_id)
+
+            if trip is None or not trip.get('shape_id'):
+                print(f"   ⚠️  Trip {trip_id}: No shape_id encontrado, se omite")
+                continue
+
+            start, end = store_offsets[i], store_offsets[i + 1]
+            entry = np.arange(start, end)[entry_rows[start:end] >= 0]
+
+            linear_ref = None
+            if trip_sequences.distance_along is None:
+                linear_ref = load_shape_store(shapes_file).linear_ref(trip['shape_id'])
+                if linear_ref is None:
+                    print(f"   ⚠️  Trip {trip_id}: Shape {trip['shape_id']} no encontrado")
+                    continue
+
+            with PROFILER.item('trip', trip_id):
+                if linear_ref is None:
+                    along_m = trip_sequences.distance_along[entry]
+                else:
+                    # Proyección de las paradas en lote, resolviendo terminales de rutas circulares
+                    along_m = linear_ref.locate_sequence(project_coords(stops.lonlat(entry_rows[entry])))
+
+            trip_ids.append(trip_id)
+            route_ids.append(trip.get('route_id', ''))
+            entries.append(entry)
+            distances.append(np.asarray(along_m, dtype=np.float64))
+            offsets.append(offsets[-1] + len(entry))
+
+            if (i + 1) % 50 == 0:
+                PROFILER.log(f"   Procesados {i + 1}/{len(trip_sequences)} trips...")
+
+        # Paradas de todos los trips generados, como posiciones en el store
+        entry = np.concatenate(entries) if entries else np.zeros(0, dtype=np.int64)
+        stop_ids = [trip_sequences.stop_ids[j] for j in stop_index[entry].tolist()]
+        sequences = entry - trip_start[entry] + 1
+        distances = np.concatenate(distances) if distances else np.zeros(0)
+        return cls(trip_ids, route_ids, offsets, stop_ids, sequences, distances,
+                   stops.district_names(entry_rows[entry]), model, start_seconds, dwell_secs)
+
+    def __len__(self):
+        return len(self.trip_ids)
+
+    @property
+    def total_stop_times(self):
+        return len(self.stop_ids)
+
+    def trip_slice(self, i):
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def trip_times(self, i, starts):
+        """
+        Llegadas y salidas (segundos enteros, matrices salidas × paradas) del
+        trip i saliendo a cada hora de starts, con las franjas de esas horas
+        """
+        starts = np.asarray(starts, dtype=np.float64)
+        part = self.trip_slice(i)
+        n = part.stop - part.start
+        offsets = np.arange(len(starts) + 1, dtype=np.int64) * n
+        arrival, departure = self.model.schedule(offsets, np.tile(self.distances[part], len(starts)),
+                                                 np.tile(self.profiles[part], len(starts)),
+                                                 starts, self.dwell_secs)
+        return (np.rint(arrival).astype(np.int64).reshape(len(starts), n),
+                np.rint(departure).astype(np.int64).reshape(len(starts), n))
+
+    def iter_rows(self, time_table=None):
+        """Filas de stop_times (listas en el orden de STOP_TIMES_FIELDNAMES), trip por trip"""
+        time_table = time_table or TimeTable()
+        # Redondeo del tiempo acumulado (no por tramo): sin deriva en rutas largas
+        arrival_text = time_table.format(np.rint(self.arrival)).tolist()
+        departure_text = time_table.format(np.rint(self.departure)).tolist()
+        sequences = self.stop_sequences.tolist()
+        pickup = self.pickup_type.tolist()
+        drop_off = self.drop_off_type.tolist()
+
+        for i, trip_id in enumerate(self.trip_ids):
+            for j in range(self.offsets[i], self.offsets[i + 1]):
+                yield [
+                    trip_id,
+                    arrival_text[j],
+                    departure_text[j],
+                    self.stop_ids[j],
+                    sequences[j],
+                    pickup[j],
+                    drop_off[j]
+                ]
+
+def generate_stop_times_with_realistic_times(base_path, avg_speed_kmh=20, speed_profile=None):
     """
     Genera stop_times.txt con tiempos calculados según distancia real
+    speed_profile: CSV de franjas horarias (default: speed_profile.csv si existe)
     """
     print("=" * 80)
     print("⏱️  GENERANDO STOP_TIMES CON TIEMPOS REALISTAS")
     print("=" * 80)
     print()
-    print(f"Velocidad promedio: {avg_speed_kmh} km/h")
+
+    model = SpeedModel.load(speed_profile, default_speed_kmh=avg_speed_kmh)
+    if model.is_constant:
+        print(f"Velocidad promedio: {avg_speed_kmh} km/h")
+    else:
+        print(f"Velocidades por franja: {len(model.edges) - 1} franjas, {len(model.profiles)} perfiles "
+              f"(fuera de franja: {avg_speed_kmh} km/h)")
     print()
-    
+
     # Archivos necesarios
     shapes_file = base_path.parent / 'GTFS/out/trujillo/gtfs/shapes.txt'
     trips_file = base_path.parent / 'GTFS/out/trujillo/gtfs/trips.txt'
     stops_file = base_path / 'stops_with_ids_final.json'
     output_file = base_path / 'gtfs_feed/stop_times.txt'
-    
-    # Cargar paradas
-    with open(stops_file, 'r', encoding='utf-8') as f:
-        stops_data = json.load(f)
-    stops_dict = {s['stop_id']: s for s in stops_data['stops']}
-    
-    # Cargar trips para obtener shape_id
-    with open(trips_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        trips_shapes = {row['trip_id']: row['shape_id'] for row in reader}
-    
-    # Procesar cada trip
-    trip_files = sorted(base_path.glob('trip_*.json'))
-    
-    fieldnames = [
-        'trip_id',
-        'arrival_time',
-        'departure_time',
-        'stop_id',
-        'stop_sequence',
-        'pickup_type',
-        'drop_off_type'
-    ]
-    
-    total_stop_times = 0
-    total_synthetic_warnings = 0
-    
-    with open(output_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        
-        for idx, trip_file in enumerate(trip_files, 1):
-            with open(trip_file, 'r', encoding='utf-8') as tf:
-                trip_data = json.load(tf)
-            
-            trip_id = trip_data['trip_id']
-            shape_id = trips_shapes.get(trip_id)
-            
-            if not shape_id:
-                print(f"   ⚠️  Trip {trip_id}: No shape_id encontrado, usando tiempos fijos")
-                continue
-            
-            # Cargar geometría de la ruta
-            route_coords = load_shape_from_gtfs(shapes_file, shape_id)
-            
-            if not route_coords:
-                print(f"   ⚠️  Trip {trip_id}: Shape {shape_id} no encontrado")
-                continue
-            
-            # Preparar paradas con coordenadas
-            stops_with_coords = []
-            for stop_info in trip_data['stops_sequence']:
-                stop_id = stop_info['stop_id']
-                if stop_id in stops_dict:
-                    stops_with_coords.append({
-                        'stop_id': stop_id,
-                        'stop_sequence': stop_info['stop_sequence'],
-                        'lat': stops_dict[stop_id]['stop_lat'],
-                        'lon': stops_dict[stop_id]['stop_lon']
-                    })
-            
-            # Calcular distancias a lo largo de la ruta
-            stops_with_distance = calculate_distance_along_for_stops(route_coords, stops_with_coords)
-            
-            # Calcular tiempos acumulados
-            start_time_minutes = 6 * 60  # 06:00:00
-            cumulative_time_minutes = start_time_minutes
-            
-            num_stops = len(stops_with_distance)
-            
-            for i, stop in enumerate(stops_with_distance):
-                # Calcular tiempo desde la parada anterior
-                if i > 0:
-                    distance_delta_km = stop['distance_along_km'] - stops_with_distance[i-1]['distance_along_km']
-                    travel_time_min = calculate_travel_time(distance_delta_km, avg_speed_kmh)
-                    cumulative_time_minutes += travel_time_min
-                
-                hours = cumulative_time_minutes // 60
-                minutes = cumulative_time_minutes % 60
-                time_str = f"{hours:02d}:{minutes:02d}:00"
-                
-                # Pickup/dropoff types
-                if stop['stop_sequence'] == 1:
-                    pickup_type = 0
-                    drop_off_type = 1
-                elif stop['stop_sequence'] == num_stops:
-                    pickup_type = 1
-                    drop_off_type = 0
-                else:
-                    pickup_type = 0
-                    drop_off_type = 0
-                
-                writer.writerow({
-                    'trip_id': trip_id,
-                    'arrival_time': time_str,
-                    'departure_time': time_str,
-                    'stop_id': stop['stop_id'],
-                    'stop_sequence': stop['stop_sequence'],
-                    'pickup_type': pickup_type,
-                    'drop_off_type': drop_off_type
-                })
-                
-                total_stop_times += 1
-            
-            if idx % 50 == 0:
-                print(f"   Procesados {idx}/{len(trip_files)} trips...")
-    
+
+    with PROFILER.stage('load_inputs'):
+        # Cargar paradas
+        stops = StopTable.from_json(stops_file)
+
+        # Cargar trips (shape_id y route_id)
+        with open(trips_file, 'r', encoding='utf-8') as f:
+            trips = list(csv.DictReader(f))
+
+        # Secuencias de paradas de todos los trips (un solo archivo)
+        trip_sequences = load_trip_sequences(base_path)
+
+    with PROFILER.stage('schedule'):
+        timetable = TripTimetable.build(trip_sequences, trips, stops, shapes_file, model)
+
+    with PROFILER.stage('write_stop_times'):
+        total_stop_times = write_table_file(output_file, STOP_TIMES_FIELDNAMES, timetable.iter_rows())
+
     print()
     print(f"   ✅ {total_stop_times} stop_times escritos")
-    print(f"   📊 Promedio: {total_stop_times / len(trip_files):.1f} paradas por trip")
+    print(f"   📊 Promedio: {total_stop_times / max(len(timetable), 1):.1f} paradas por trip")
     print()
-    
+
     return output_file
 
 def main():
+    parser = argparse.ArgumentParser(description="Genera stop_times.txt con tiempos calculados por distancia")
+    parser.add_argument('--speed', type=float, default=20,
+                        help="Velocidad en km/h fuera de las franjas del perfil (default: 20)")
+    parser.add_argument('--speed-profile', type=Path,
+                        help="CSV de velocidades por franja horaria (default: speed_profile.csv si existe)")
+    add_profile_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args, 'generate_stop_times_realistic')
+
     base_path = Path(__file__).parent
-    
+
     print()
     print("Generando stop_times.txt con tiempos calculados por distancia...")
     print()
-    
-    output_file = generate_stop_times_with_realistic_times(base_path, avg_speed_kmh=20)
-    
+
+    output_file = generate_stop_times_with_realistic_times(base_path, avg_speed_kmh=args.speed,
+                                                           speed_profile=args.speed_profile)
+
     print("=" * 80)
     print("✅ STOP_TIMES.TXT REGENERADO CON TIEMPOS REALISTAS")
     print("=" * 80)
@@ -216,5 +252,7 @@ def main():
     print("   2. Validar nuevamente con GTFS validator")
     print()
 
+    finish_profile()
+
 if __name__ == "__main__":
     main()
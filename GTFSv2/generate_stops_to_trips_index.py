@@ -2,44 +2,37 @@
 """
 Genera un índice invertido: para cada parada, lista los trips que pasan por ella.
 Útil para saber qué opciones de transporte tiene un usuario desde una parada.
+Además del JSON escribe stops_to_trips.bin (índice CSR con mmap, ver stops_trips_csr.py).
 """
 
+import argparse
 import json
 from pathlib import Path
 from collections import defaultdict
 
-def main():
-    base_path = Path(__file__).parent
-    
-    print("=" * 80)
-    print("🔄 GENERANDO ÍNDICE INVERTIDO: PARADAS → TRIPS")
-    print("=" * 80)
-    print()
-    
-    # 1. Cargar todas las paradas
-    print("1. Cargando paradas...")
-    stops_file = base_path / 'stops_with_ids_final.json'
-    with open(stops_file, 'r', encoding='utf-8') as f:
-        stops_data = json.load(f)
-    
-    stops_index = {s['stop_id']: s for s in stops_data['stops']}
-    print(f"   ✅ {len(stops_index)} paradas cargadas")
+from instrumentation import PROFILER, add_profile_args, configure_from_args, finish_profile
+from stop_table import StopTable
+from stops_trips_csr import build_stop_trip_index, default_feed_dir, default_index_path, feed_stamps
+from trip_store import load_trip_sequences
+
+def build_stops_to_trips_index(trip_sequences, stops):
+    """
+    Construye el índice invertido parada -> trips en memoria
     
-    # 2. Cargar todos los trips
-    print("\n2. Procesando trips...")
-    trip_files = sorted(base_path.glob('trip_*.json'))
-    print(f"   📁 {len(trip_files)} archivos encontrados")
+    Args:
+        trip_sequences: TripSequenceStore con las secuencias de paradas
+        stops: StopTable con las paradas (incluyendo sintéticas)
     
+    Returns:
+        Diccionario con 'metadata' y 'stops' (estructura de stops_to_trips_index.json)
+    """
     # Índice invertido: stop_id -> lista de trips
     stops_to_trips = defaultdict(list)
     
     # Contadores
     total_connections = 0
     
-    for trip_file in trip_files:
-        with open(trip_file, 'r', encoding='utf-8') as f:
-            trip_data = json.load(f)
-        
+    for trip_data in trip_sequences.iter_trips():
         trip_id = trip_data['trip_id']
         route_id = trip_data['route_id']
         
@@ -57,19 +50,14 @@ def main():
             
             total_connections += 1
     
-    print(f"   ✅ {total_connections} conexiones parada-trip procesadas")
-    
-    # 3. Ordenar trips por ruta
-    print("\n3. Organizando datos...")
+    # Ordenar por route_id primero, luego por trip_id
     for stop_id in stops_to_trips:
-        # Ordenar por route_id primero, luego por trip_id
         stops_to_trips[stop_id].sort(key=lambda x: (x['route_id'], x['trip_id']))
     
-    # 4. Generar estadísticas
-    print("\n4. Calculando estadísticas...")
-    
     trips_per_stop = [len(trips) for trips in stops_to_trips.values()]
     
+    avg_trips = max_trips = min_trips = 0
+    busiest_stop_id = busiest_stop_name = ''
     if trips_per_stop:
         avg_trips = sum(trips_per_stop) / len(trips_per_stop)
         max_trips = max(trips_per_stop)
@@ -77,21 +65,14 @@ def main():
         
         # Encontrar la parada con más trips
         busiest_stop_id = max(stops_to_trips.keys(), key=lambda k: len(stops_to_trips[k]))
-        busiest_stop_name = stops_index[busiest_stop_id]['stop_name']
-        
-        print(f"   📊 Promedio de trips por parada: {avg_trips:.1f}")
-        print(f"   📊 Máximo trips en una parada: {max_trips}")
-        print(f"   📊 Mínimo trips en una parada: {min_trips}")
-        print(f"   🏆 Parada más concurrida: {busiest_stop_name} ({max_trips} trips)")
-    
-    # 5. Crear estructura final con información completa
-    print("\n5. Generando archivo JSON...")
+        busiest_stop_name = stops.names[stops.index_of(busiest_stop_id)]
     
     stops_with_trips = []
+    lats, lons = stops.lat.tolist(), stops.lon.tolist()
     
     for stop_id, trips_list in stops_to_trips.items():
-        if stop_id in stops_index:
-            stop = stops_index[stop_id]
+        row = stops.index_of(stop_id)
+        if row is not None:
             
             # Agrupar por ruta para mejor visualización
             routes_dict = {}
@@ -106,11 +87,11 @@ def main():
             
             stops_with_trips.append({
                 'stop_id': stop_id,
-                'stop_name': stop['stop_name'],
-                'stop_code': stop['stop_code'],
-                'stop_lat': stop['stop_lat'],
-                'stop_lon': stop['stop_lon'],
-                'distrito': stop.get('distrito', ''),
+                'stop_name': stops.names[row],
+                'stop_code': stops.codes[row],
+                'stop_lat': lats[row],
+                'stop_lon': lons[row],
+                'distrito': stops.districts[stops.district[row]],
                 'total_trips': len(trips_list),
                 'total_routes': len(routes_dict),
                 'routes': [
@@ -126,41 +107,92 @@ def main():
     # Ordenar por número de trips (más concurridas primero)
     stops_with_trips.sort(key=lambda x: x['total_trips'], reverse=True)
     
-    # 6. Guardar archivo
-    output_file = base_path / 'stops_to_trips_index.json'
-    
-    output_data = {
+    return {
         'metadata': {
             'total_stops': len(stops_with_trips),
-            'total_trips': len(trip_files),
+            'total_trips': len(trip_sequences),
             'total_connections': total_connections,
-            'avg_trips_per_stop': avg_trips if trips_per_stop else 0,
-            'max_trips_per_stop': max_trips if trips_per_stop else 0,
-            'min_trips_per_stop': min_trips if trips_per_stop else 0,
+            'avg_trips_per_stop': avg_trips,
+            'max_trips_per_stop': max_trips,
+            'min_trips_per_stop': min_trips,
             'busiest_stop': {
-                'stop_id': busiest_stop_id if trips_per_stop else '',
-                'stop_name': busiest_stop_name if trips_per_stop else '',
-                'trips_count': max_trips if trips_per_stop else 0
+                'stop_id': busiest_stop_id,
+                'stop_name': busiest_stop_name,
+                'trips_count': max_trips
             }
         },
         'stops': stops_with_trips
     }
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera el índice invertido paradas → trips")
+    add_profile_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args, 'generate_stops_to_trips_index')
+    
+    base_path = Path(__file__).parent
+    
+    print("=" * 80)
+    print("🔄 GENERANDO ÍNDICE INVERTIDO: PARADAS → TRIPS")
+    print("=" * 80)
+    print()
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output_data, f, ensure_ascii=False, indent=2)
+    # 1. Cargar todas las paradas
+    print("1. Cargando paradas...")
+    stops_file = base_path / 'stops_with_ids_final.json'
+    with PROFILER.stage('load_stops'):
+        stops = StopTable.from_json(stops_file)
+    print(f"   ✅ {len(stops)} paradas cargadas")
+    
+    # 2. Cargar todos los trips
+    print("\n2. Procesando trips...")
+    with PROFILER.stage('load_trip_store'):
+        trip_sequences = load_trip_sequences(base_path)
+    print(f"   📁 {len(trip_sequences)} secuencias encontradas")
+    
+    # Construir índice en memoria
+    with PROFILER.stage('build_index'):
+        output_data = build_stops_to_trips_index(trip_sequences, stops)
+    metadata = output_data['metadata']
+    stops_with_trips = output_data['stops']
+    total_connections = metadata['total_connections']
+    avg_trips = metadata['avg_trips_per_stop']
+    print(f"   ✅ {total_connections} conexiones parada-trip procesadas")
+    
+    # 3. Estadísticas
+    print("\n3. Calculando estadísticas...")
+    if stops_with_trips:
+        print(f"   📊 Promedio de trips por parada: {avg_trips:.1f}")
+        print(f"   📊 Máximo trips en una parada: {metadata['max_trips_per_stop']}")
+        print(f"   📊 Mínimo trips en una parada: {metadata['min_trips_per_stop']}")
+        print(f"   🏆 Parada más concurrida: {metadata['busiest_stop']['stop_name']} ({metadata['max_trips_per_stop']} trips)")
+    
+    # 4. Guardar archivo
+    print("\n4. Generando archivo JSON...")
+    output_file = base_path / 'stops_to_trips_index.json'
+    
+    with PROFILER.stage('write_index'):
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(output_data, f, ensure_ascii=False, indent=2)
     
     file_size = output_file.stat().st_size / 1024
     print(f"   ✅ Archivo generado: {output_file}")
     print(f"   📊 Tamaño: {file_size:.1f} KB")
     
-    # 7. Mostrar top 10 paradas más concurridas
+    # Índice binario para consultas sin parsear el JSON
+    csr_file = default_index_path(base_path)
+    with PROFILER.stage('write_csr_index'):
+        build_stop_trip_index(trip_sequences, csr_file, feed_stamps(default_feed_dir(base_path)))
+    print(f"   ✅ Índice CSR: {csr_file} ({csr_file.stat().st_size / 1024:.1f} KB)")
+    
+    # 5. Mostrar top 10 paradas más concurridas
     print("\n" + "=" * 80)
     print("✅ ÍNDICE GENERADO")
     print("=" * 80)
     
     print(f"\n📊 Estadísticas globales:")
     print(f"   • Paradas con servicio: {len(stops_with_trips)}")
-    print(f"   • Total de trips: {len(trip_files)}")
+    print(f"   • Total de trips: {len(trip_sequences)}")
     print(f"   • Conexiones parada-trip: {total_connections}")
     print(f"   • Promedio trips/parada: {avg_trips:.1f}")
     
@@ -171,8 +203,10 @@ def main():
             routes_str += f"... (+{len(stop['routes'])-5})"
         print(f"   {i:2d}. {stop['stop_name']:30s} - {stop['total_trips']:3d} trips - Rutas: {routes_str}")
     
-    print(f"\n📁 Archivo: stops_to_trips_index.json")
+    print(f"\n📁 Archivos: stops_to_trips_index.json, {csr_file.name}")
     print("\n💡 Uso: Busca un stop_id para ver todos los trips que pasan por esa parada")
+    
+    finish_profile()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Genera transfers.txt: transbordos a pie entre paradas cercanas
+Une las paradas con servicio a menos de un radio de caminata (grilla de
+stop_query, tiempo lineal en el número de paradas), calcula el tiempo de
+caminata (distancia en línea recta × factor de desvío / velocidad, con un
+mínimo de MIN_WALK_SECONDS: las terminales sintéticas de trips distintos que
+comparten punto de inicio o fin están a 0 m y darían transbordos de 0 s) y deja
+solo los pares donde la parada destino tiene alguna ruta que no pasa por la
+de origen (caminar a una parada con las mismas rutas no abre viajes nuevos).
+
+Cada par se escribe en ambos sentidos por separado (la poda no es simétrica)
+con transfer_type=2 y min_transfer_time en segundos.
+"""
+
+import argparse
+import math
+from pathlib import Path
+
+import numpy as np
+
+from gtfs_writer import write_table_file
+from instrumentation import PROFILER, add_profile_args, configure_from_args, finish_profile
+from stop_query import StopQuery
+from stop_table import StopTable
+from trip_store import load_trip_sequences
+
+DEFAULT_RADIUS = 250.0  # metros
+WALK_SPEED_MS = 1.2  # ~4.3 km/h
+DETOUR_FACTOR = 1.3  # recorrido por calles vs línea recta
+MIN_WALK_SECONDS = 60  # bajar de un bus y subir a otro, aunque las paradas coincidan
+MIN_TRANSFER_TIME = 2  # transfer_type: requiere min_transfer_time
+
+TRANSFERS_FIELDNAMES = ['from_stop_id', 'to_stop_id', 'transfer_type', 'min_transfer_time']
+
+class TransferTable:
+    """Pares (from, to) de transbordo a pie: índices en stop_ids, metros y segundos"""
+
+    def __init__(self, stop_ids, from_index, to_index, distances, seconds):
+        self.stop_ids = stop_ids
+        self.from_index = from_index
+        self.to_index = to_index
+        self.distances = distances
+        self.seconds = seconds
+
+    def __len__(self):
+        return len(self.from_index)
+
+    def iter_rows(self):
+        """Filas de transfers.txt (listas en el orden de TRANSFERS_FIELDNAMES)"""
+        for a, b, secs in zip(self.from_index.tolist(), self.to_index.tolist(), self.seconds.tolist()):
+            yield [self.stop_ids[a], self.stop_ids[b], MIN_TRANSFER_TIME, secs]
+
+def stop_routes(trip_sequences, stop_ids):
+    """
+    Rutas de cada parada en CSR: las de stop_ids[i] son
+    routes[offsets[i]:offsets[i+1]] (códigos en route_ids, sin repetir)
+    """
+    route_ids = sorted(set(trip_sequences.route_ids))
+    route_code = {route_id: i for i, route_id in enumerate(route_ids)}
+    position = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+
+    # Paradas del store -> posiciones en stop_ids (-1 si no está)
+    store_to_stop = np.array([position.get(stop_id, -1) for stop_id in trip_sequences.stop_ids], dtype=np.int64)
+    lengths = np.diff(np.asarray(trip_sequences.offsets, dtype=np.int64))
+    entry_route = np.repeat(np.array([route_code[r] for r in trip_sequences.route_ids], dtype=np.int64), lengths)
+    entry_stop = store_to_stop[np.asarray(trip_sequences.stop_index, dtype=np.int64)]
+    keep = entry_stop >= 0
+
+    n_routes = max(len(route_ids), 1)
+    keys = np.unique(entry_stop[keep] * n_routes + entry_route[keep])
+    stops, routes = keys // n_routes, keys % n_routes
+    offsets = np.zeros(len(stop_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(stops, minlength=len(stop_ids)), out=offsets[1:])
+    return route_ids, offsets, routes
+
+def build_transfers(stops, trip_sequences, radius=DEFAULT_RADIUS, walk_speed=WALK_SPEED_MS,
+                    detour=DETOUR_FACTOR, min_seconds=MIN_WALK_SECONDS):
+    """
+    Transbordos a pie entre paradas con servicio a menos de radius metros
+
+    Args:
+        stops: StopTable con las paradas (incluyendo sintéticas)
+        trip_sequences: TripSequenceStore (rutas que pasan por cada parada)
+        radius: Radio de caminata en metros (línea recta)
+        walk_speed: Velocidad de caminata en m/s
+        detour: Factor de desvío del recorrido por calles
+        min_seconds: Tiempo mínimo de transbordo en segundos
+    Returns:
+        TransferTable
+    """
+    rows = stops.rows(list(dict.fromkeys(trip_sequences.stop_ids)))
+    query = StopQuery.from_stop_table(stops, rows[rows >= 0])
+    route_ids, route_offsets, routes = stop_routes(trip_sequences, query.stop_ids)
+
+    # Join espacial: todas las paradas contra la grilla, en lote
+    with PROFILER.stage('spatial_join'):
+        nearby = query.radius(query.xy, radius, projected=True)
+    from_index = np.repeat(np.arange(len(query.stop_ids)), nearby.counts())
+    to_index, distances = nearby.indices, nearby.distances
+    other = from_index != to_index
+    from_index, to_index, distances = from_index[other], to_index[other], distances[other]
+
+    # Poda: se conserva el par si alguna ruta de la parada destino no pasa por la de origen
+    with PROFILER.stage('route_pruning'):
+        n_routes = max(len(route_ids), 1)
+        origin_keys = np.repeat(np.arange(len(query.stop_ids)), np.diff(route_offsets)) * n_routes + routes
+        starts = route_offsets[to_index]
+        counts = route_offsets[to_index + 1] - starts
+        pair = np.repeat(np.arange(len(to_index)), counts)
+        dest_routes = routes[np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+        keys = from_index[pair] * n_routes + dest_routes
+        found = np.searchsorted(origin_keys, keys)
+        shared = (found < len(origin_keys)) & (origin_keys[np.minimum(found, len(origin_keys) - 1)] == keys)
+        useful = np.bincount(pair[~shared], minlength=len(to_index)) > 0
+    from_index, to_index, distances = from_index[useful], to_index[useful], distances[useful]
+
+    # Orden estable del archivo: por parada de origen y luego por distancia
+    order = np.lexsort((distances, from_index))
+    from_index, to_index, distances = from_index[order], to_index[order], distances[order]
+    seconds = np.maximum(np.ceil(distances * detour / walk_speed), min_seconds).astype(np.int64)
+    return TransferTable(query.stop_ids, from_index, to_index, distances, seconds)
+
+def generate_transfers(base_path, radius=DEFAULT_RADIUS, walk_speed=WALK_SPEED_MS, detour=DETOUR_FACTOR,
+                       min_seconds=MIN_WALK_SECONDS):
+    """Escribe gtfs_feed/transfers.txt desde stops_with_ids_final.json y trip_sequences.bin"""
+    with PROFILER.stage('load_inputs'):
+        stops = StopTable.from_json(base_path / 'stops_with_ids_final.json')
+        trip_sequences = load_trip_sequences(base_path)
+
+    with PROFILER.stage('build_transfers'):
+        transfers = build_transfers(stops, trip_sequences, radius, walk_speed, detour, min_seconds)
+
+    output_file = base_path / 'gtfs_feed/transfers.txt'
+    with PROFILER.stage('write_transfers'):
+        write_table_file(output_file, TRANSFERS_FIELDNAMES, transfers.iter_rows())
+    return output_file, transfers
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera transfers.txt con transbordos a pie entre paradas cercanas")
+    parser.add_argument('--radius', type=float, default=DEFAULT_RADIUS,
+                        help=f"Radio de caminata en metros (default: {DEFAULT_RADIUS:.0f})")
+    parser.add_argument('--walk-speed', type=float, default=WALK_SPEED_MS,
+                        help=f"Velocidad de caminata en m/s (default: {WALK_SPEED_MS})")
+    parser.add_argument('--detour', type=float, default=DETOUR_FACTOR,
+                        help=f"Factor de desvío sobre la línea recta (default: {DETOUR_FACTOR})")
+    parser.add_argument('--min-time', type=int, default=MIN_WALK_SECONDS,
+                        help=f"Tiempo mínimo de transbordo en segundos (default: {MIN_WALK_SECONDS})")
+    add_profile_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args, 'generate_transfers')
+
+    base_path = Path(__file__).parent
+
+    print("=" * 80)
+    print("🚶 GENERANDO TRANSFERS.TXT (TRANSBORDOS A PIE)")
+    print("=" * 80)
+    print()
+
+    output_file, transfers = generate_transfers(base_path, args.radius, args.walk_speed, args.detour,
+                                                 args.min_time)
+
+    print(f"   ✅ {len(transfers)} transbordos entre {len(set(transfers.from_index.tolist()))} paradas "
+          f"(radio {args.radius:.0f} m)")
+    if len(transfers):
+        print(f"   📊 Caminata promedio: {transfers.distances.mean():.0f} m, "
+              f"{transfers.seconds.mean():.0f} s (máx. {math.ceil(transfers.seconds.max() / 60)} min)")
+    print(f"\n📁 Archivo: {output_file}")
+    print()
+
+    finish_profile()
+
+if __name__ == "__main__":
+    main()
@@ -4,120 +4,261 @@ Genera visualizador actualizado que permite seleccionar cualquier trip
 de los 210 procesados y ver sus paradas asignadas.
 """
 
+import argparse
 import json
 import csv
 from pathlib import Path
 
-def load_trips_info():
+from instrumentation import PROFILER, add_profile_args, configure_from_args, finish_profile, load_json
+from polyline import POLYLINE_PRECISION, encode_polyline
+from shape_simplify import DEFAULT_TOLERANCES, ShapeLevels
+from shape_store import load_shape_store
+from trip_store import load_trip_sequences
+
+def default_gtfs_dir():
+    return Path(__file__).parent.parent / 'GTFS/out/trujillo/gtfs'
+
+def load_trips_info(gtfs_dir=None):
     """Carga información de trips desde trips.txt"""
-    base_path = Path(__file__).parent
-    trips_file = base_path.parent / 'GTFS/out/trujillo/gtfs/trips.txt'
+    trips_file = Path(gtfs_dir or default_gtfs_dir()) / 'trips.txt'
     
     with open(trips_file, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
         return list(reader)
 
-def load_shapes_coords():
-    """Carga coordenadas de todas las shapes"""
-    base_path = Path(__file__).parent
-    shapes_file = base_path.parent / 'GTFS/out/trujillo/gtfs/shapes.txt'
-    
-    shapes_dict = {}
+def load_shapes_coords(gtfs_dir=None):
+    """Carga coordenadas de todas las shapes (ordenadas por secuencia)"""
+    shapes_file = Path(gtfs_dir or default_gtfs_dir()) / 'shapes.txt'
     
-    with open(shapes_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            shape_id = row['shape_id']
-            if shape_id not in shapes_dict:
-                shapes_dict[shape_id] = []
-            
-            shapes_dict[shape_id].append({
-                'lat': float(row['shape_pt_lat']),
-                'lon': float(row['shape_pt_lon']),
-                'seq': int(row['shape_pt_sequence'])
-            })
-    
-    # Ordenar por secuencia
-    for shape_id in shapes_dict:
-        shapes_dict[shape_id].sort(key=lambda x: x['seq'])
-    
-    return shapes_dict
+    store = load_shape_store(shapes_file)
+    return {shape_id: store.points(shape_id) for shape_id in store.shape_ids}
 
-def load_all_stops():
+def load_all_stops(base_path=None):
     """Carga todas las paradas desde stops_with_ids_final.json"""
-    base_path = Path(__file__).parent
-    stops_file = base_path / 'stops_with_ids_final.json'
+    stops_file = Path(base_path or Path(__file__).parent) / 'stops_with_ids_final.json'
     
-    with open(stops_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    data = load_json(stops_file)
     
     return data['stops']
 
-def load_trip_stops(trip_id):
+def load_trip_stops(trip_id, trip_sequences=None):
     """Carga paradas de un trip específico"""
-    base_path = Path(__file__).parent
-    trip_file = base_path / f'trip_{trip_id}_stops.json'
-    
-    try:
-        with open(trip_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return None
+    if trip_sequences is None:
+        trip_sequences = load_trip_sequences(Path(__file__).parent)
+    return trip_sequences.get(trip_id)
+
+def load_inputs(base_path, gtfs_dir=None):
+    """trips.txt, paradas por stop_id y secuencias de trip_sequences.bin"""
+    with PROFILER.stage('load_inputs'):
+        trips = load_trips_info(gtfs_dir)
+        all_stops = load_all_stops(base_path)
+        trip_sequences = load_trip_sequences(base_path)
+    return trips, {s['stop_id']: s for s in all_stops}, trip_sequences
 
-def generate_html():
-    """Genera el HTML del visualizador"""
+def build_trips_data(trips, stops_index, trip_sequences):
+    """Trips con secuencia y sus paradas con coordenadas (formato del visualizador)"""
+    trips_data = []
+    with PROFILER.stage('build_trips_data'):
+        for trip in trips:
+            trip_stops = load_trip_stops(trip['trip_id'], trip_sequences)
+            if trip_stops:
+                # Cargar coordenadas de paradas
+                stops_with_coords = []
+                for stop_info in trip_stops['stops_sequence']:
+                    stop_id = stop_info['stop_id']
+                    if stop_id in stops_index:
+                        stop = stops_index[stop_id]
+                        stops_with_coords.append({
+                            'stop_sequence': stop_info['stop_sequence'],
+                            'stop_id': stop_id,
+                            'stop_name': stop['stop_name'],
+                            'lat': stop['stop_lat'],
+                            'lon': stop['stop_lon'],
+                            'is_synthetic': stop_id.startswith('SYNTH_')
+                        })
+                
+                trips_data.append({
+                    'trip_id': trip['trip_id'],
+                    'route_id': trip['route_id'],
+                    'shape_id': trip['shape_id'],
+                    'stops': stops_with_coords
+                })
+    return trips_data
+
+def print_summary(trips, shapes_count, stops_index):
+    routes = {trip['route_id'] for trip in trips}
+    print(f"  ✓ {len(trips)} trips")
+    print(f"  ✓ {shapes_count} shapes")
+    print(f"  ✓ {len(stops_index)} paradas")
+    print(f"  ✓ {len(routes)} rutas")
+
+def generate_html(base_path=None, gtfs_dir=None):
+    """
+    Genera el HTML del visualizador con todos los trips y shapes embebidos
+    base_path: directorio con stops_with_ids_final.json y trip_sequences.bin
+    gtfs_dir: directorio con trips.txt y shapes.txt
+    """
+    base_path = Path(base_path or Path(__file__).parent)
     
     print("Cargando datos...")
-    trips = load_trips_info()
-    shapes = load_shapes_coords()
-    all_stops = load_all_stops()
+    trips, stops_index, trip_sequences = load_inputs(base_path, gtfs_dir)
+    with PROFILER.stage('load_shapes'):
+        shapes = load_shapes_coords(gtfs_dir)
+    print_summary(trips, len(shapes), stops_index)
     
-    # Crear índice de paradas
-    stops_index = {s['stop_id']: s for s in all_stops}
+    # Preparar datos para el visualizador
+    trips_data = build_trips_data(trips, stops_index, trip_sequences)
     
-    # Organizar trips por ruta
-    routes_dict = {}
-    for trip in trips:
-        route_id = trip['route_id']
-        if route_id not in routes_dict:
-            routes_dict[route_id] = []
-        routes_dict[route_id].append(trip)
+    print(f"\nGenerando HTML...")
     
-    print(f"  ✓ {len(trips)} trips")
-    print(f"  ✓ {len(shapes)} shapes")
-    print(f"  ✓ {len(all_stops)} paradas")
-    print(f"  ✓ {len(routes_dict)} rutas")
+    return page_html(f'''        // Datos
+        const tripsData = {json.dumps(trips_data, ensure_ascii=False)};
+        const shapesData = {json.dumps(shapes, ensure_ascii=False)};
+        
+        function loadIndex() {{
+            return Promise.resolve(tripsData.map(trip => ({{
+                trip_id: trip.trip_id,
+                route_id: trip.route_id,
+                stop_count: trip.stops.length
+            }})));
+        }}
+        
+        function loadTrip(tripId) {{
+            const trip = tripsData.find(t => t.trip_id === tripId);
+            const shapeCoords = shapesData[trip.shape_id] || [];
+            return Promise.resolve({{trip: trip, shapes: [[0, shapeCoords.map(pt => [pt.lat, pt.lon])]]}});
+        }}
+''')
+
+def compact_trip(trip_data, shape_levels, precision=POLYLINE_PRECISION):
+    """
+    Chunk de un trip para el modo por partes: shape (un nivel Douglas-Peucker
+    por tolerancia, lista de (tolerancia, coords (lon, lat))) y coordenadas
+    de paradas como encoded polylines, y el resto de las paradas en arrays por
+    columna (stop_name vacío cuando es igual al stop_id)
+    """
+    stops = trip_data['stops']
+    return {
+        'trip_id': trip_data['trip_id'],
+        'route_id': trip_data['route_id'],
+        'shapes': [[tolerance, encode_polyline(coords[:, 1], coords[:, 0], precision)]
+                   for tolerance, coords in shape_levels],
+        'stops': encode_polyline([stop['lat'] for stop in stops], [stop['lon'] for stop in stops], precision),
+        'stop_ids': [stop['stop_id'] for stop in stops],
+        'stop_sequences': [stop['stop_sequence'] for stop in stops],
+        'stop_names': [stop['stop_name'] if stop['stop_name'] != stop['stop_id'] else '' for stop in stops]
+    }
+
+def generate_chunked(output_dir, base_path=None, gtfs_dir=None, precision=POLYLINE_PRECISION,
+                     tolerances=DEFAULT_TOLERANCES):
+    """
+    Escribe el visualizador por partes en output_dir: index.html (sin datos),
+    trips.json (índice [trip_id, route_id, paradas] por trip) y
+    trips/<n>.json (un chunk por trip, n = posición en el índice). La página
+    pide solo el chunk del trip seleccionado y dibuja la shape con el nivel de
+    simplificación (tolerances, metros) que no llega a un píxel del zoom actual.
+    Returns: (número de trips, bytes de datos escritos)
+    """
+    base_path = Path(base_path or Path(__file__).parent)
+    output_dir = Path(output_dir)
+    chunk_dir = output_dir / 'trips'
+    chunk_dir.mkdir(parents=True, exist_ok=True)
     
-    # Preparar datos para el visualizador
-    trips_data = []
-    for trip in trips:
-        trip_stops = load_trip_stops(trip['trip_id'])
-        if trip_stops:
-            # Cargar coordenadas de paradas
-            stops_with_coords = []
-            for stop_info in trip_stops['stops_sequence']:
-                stop_id = stop_info['stop_id']
-                if stop_id in stops_index:
-                    stop = stops_index[stop_id]
-                    stops_with_coords.append({
-                        'stop_sequence': stop_info['stop_sequence'],
-                        'stop_id': stop_id,
-                        'stop_name': stop['stop_name'],
-                        'lat': stop['stop_lat'],
-                        'lon': stop['stop_lon'],
-                        'is_synthetic': stop_id.startswith('SYNTH_')
-                    })
-            
-            trips_data.append({
-                'trip_id': trip['trip_id'],
-                'route_id': trip['route_id'],
-                'shape_id': trip['shape_id'],
-                'stops': stops_with_coords
-            })
+    print("Cargando datos...")
+    trips, stops_index, trip_sequences = load_inputs(base_path, gtfs_dir)
+    with PROFILER.stage('load_shapes'):
+        store = load_shape_store(Path(gtfs_dir or default_gtfs_dir()) / 'shapes.txt')
+        levels = ShapeLevels.open(store)
+    print_summary(trips, len(store), stops_index)
     
-    print(f"\nGenerando HTML...")
+    trips_data = build_trips_data(trips, stops_index, trip_sequences)
     
-    html = f'''<!DOCTYPE html>
+    print(f"\nGenerando chunks...")
+    # Chunks de una corrida anterior con más trips quedarían huérfanos
+    for old_chunk in chunk_dir.glob('*.json'):
+        old_chunk.unlink()
+    
+    data_bytes = 0
+    index = []
+    with PROFILER.stage('write_chunks'):
+        for n, trip_data in enumerate(trips_data):
+            shape_levels = []
+            if trip_data['shape_id'] in store:
+                shape_levels = [(tolerance, levels.simplified(trip_data['shape_id'], tolerance).coords)
+                                for tolerance in sorted(tolerances)]
+            chunk = compact_trip(trip_data, shape_levels, precision)
+            text = json.dumps(chunk, ensure_ascii=False, separators=(',', ':'))
+            (chunk_dir / f'{n}.json').write_text(text, encoding='utf-8')
+            data_bytes += len(text.encode('utf-8'))
+            index.append([trip_data['trip_id'], trip_data['route_id'], len(trip_data['stops'])])
+        
+        text = json.dumps({'polyline_precision': precision, 'trips': index},
+                          ensure_ascii=False, separators=(',', ':'))
+        (output_dir / 'trips.json').write_text(text, encoding='utf-8')
+        data_bytes += len(text.encode('utf-8'))
+    
+    html = page_html(f'''        // Datos por trip bajo demanda: trips.json (índice) y trips/<n>.json
+        const POLYLINE_SCALE = {10 ** precision};
+        const tripChunks = {{}};
+        
+        function decodePolyline(encoded) {{
+            const points = [];
+            let index = 0, lat = 0, lon = 0;
+            while (index < encoded.length) {{
+                const delta = [0, 0];
+                for (let k = 0; k < 2; k++) {{
+                    let result = 0, shift = 0, chunk;
+                    do {{
+                        chunk = encoded.charCodeAt(index++) - 63;
+                        result |= (chunk & 0x1f) << shift;
+                        shift += 5;
+                    }} while (chunk & 0x20);
+                    delta[k] = (result & 1) ? ~(result >> 1) : (result >> 1);
+                }}
+                lat += delta[0];
+                lon += delta[1];
+                points.push([lat / POLYLINE_SCALE, lon / POLYLINE_SCALE]);
+            }}
+            return points;
+        }}
+        
+        function loadIndex() {{
+            return fetch('trips.json').then(response => response.json()).then(index =>
+                index.trips.map(([tripId, routeId, stopCount], n) => {{
+                    tripChunks[tripId] = n;
+                    return {{trip_id: tripId, route_id: routeId, stop_count: stopCount}};
+                }}));
+        }}
+        
+        function loadTrip(tripId) {{
+            return fetch(`trips/${{tripChunks[tripId]}}.json`).then(response => response.json()).then(chunk => {{
+                const coords = decodePolyline(chunk.stops);
+                const stops = chunk.stop_ids.map((stopId, i) => ({{
+                    stop_sequence: chunk.stop_sequences[i],
+                    stop_id: stopId,
+                    stop_name: chunk.stop_names[i] || stopId,
+                    lat: coords[i][0],
+                    lon: coords[i][1],
+                    is_synthetic: stopId.startsWith('SYNTH_')
+                }}));
+                return {{
+                    trip: {{trip_id: chunk.trip_id, route_id: chunk.route_id, stops: stops}},
+                    shapes: chunk.shapes.map(([tolerance, encoded]) => [tolerance, decodePolyline(encoded)])
+                }};
+            }});
+        }}
+''')
+    with PROFILER.stage('write_html'):
+        (output_dir / 'index.html').write_text(html, encoding='utf-8')
+    return len(trips_data), data_bytes
+
+def page_html(data_script):
+    """
+    Página del visualizador; data_script define loadIndex() (promesa del
+    índice de trips) y loadTrip(tripId) (promesa de {trip, shapes}, con
+    shapes = [[tolerancia en metros, latLngs], ...] de menor a mayor)
+    """
+    return f'''<!DOCTYPE html>
 <html>
 <head>
     <meta charset="utf-8">
@@ -264,10 +405,7 @@ def generate_html():
     </div>
 
     <script>
-        // Datos
-        const tripsData = {json.dumps(trips_data, ensure_ascii=False)};
-        const shapesData = {json.dumps(shapes, ensure_ascii=False)};
-        
+{data_script}
         // Inicializar mapa
         const map = L.map('map').setView([-8.1116, -79.0288], 13);
         
@@ -276,8 +414,9 @@ def generate_html():
             maxZoom: 19
         }}).addTo(map);
         
-        // Capas
+        // Capas (routeShapes: niveles de la shape del trip mostrado)
         let routeLayer = null;
+        let routeShapes = null;
         let stopsLayer = null;
         let stopsVisible = true;
         
@@ -287,22 +426,26 @@ def generate_html():
         const statsPanel = document.getElementById('statsPanel');
         const toggleButton = document.getElementById('toggleStops');
         
-        // Organizar trips por ruta
+        // Índice de trips (trip_id, route_id, stop_count), organizado por ruta
+        let tripsIndex = [];
         const tripsByRoute = {{}};
-        tripsData.forEach(trip => {{
-            if (!tripsByRoute[trip.route_id]) {{
-                tripsByRoute[trip.route_id] = [];
-            }}
-            tripsByRoute[trip.route_id].push(trip);
-        }});
-        
-        // Poblar selector de rutas
-        const sortedRoutes = Object.keys(tripsByRoute).sort();
-        sortedRoutes.forEach(routeId => {{
-            const option = document.createElement('option');
-            option.value = routeId;
-            option.textContent = `${{routeId}} (${{tripsByRoute[routeId].length}} trips)`;
-            routeSelector.appendChild(option);
+        loadIndex().then(index => {{
+            tripsIndex = index;
+            tripsIndex.forEach(trip => {{
+                if (!tripsByRoute[trip.route_id]) {{
+                    tripsByRoute[trip.route_id] = [];
+                }}
+                tripsByRoute[trip.route_id].push(trip);
+            }});
+            
+            // Poblar selector de rutas
+            const sortedRoutes = Object.keys(tripsByRoute).sort();
+            sortedRoutes.forEach(routeId => {{
+                const option = document.createElement('option');
+                option.value = routeId;
+                option.textContent = `${{routeId}} (${{tripsByRoute[routeId].length}} trips)`;
+                routeSelector.appendChild(option);
+            }});
         }});
         
         // Event: cambio de ruta
@@ -317,12 +460,12 @@ def generate_html():
                 trips.forEach(trip => {{
                     const option = document.createElement('option');
                     option.value = trip.trip_id;
-                    option.textContent = `Trip ${{trip.trip_id}} (${{trip.stops.length}} paradas)`;
+                    option.textContent = `Trip ${{trip.trip_id}} (${{trip.stop_count}} paradas)`;
                     tripSelector.appendChild(option);
                 }});
             }} else {{
                 // Mostrar todos los trips
-                tripsData.forEach(trip => {{
+                tripsIndex.forEach(trip => {{
                     const option = document.createElement('option');
                     option.value = trip.trip_id;
                     option.textContent = `${{trip.route_id}} - Trip ${{trip.trip_id}}`;
@@ -338,7 +481,12 @@ def generate_html():
         tripSelector.addEventListener('change', function() {{
             const tripId = this.value;
             if (tripId) {{
-                displayTrip(tripId);
+                loadTrip(tripId).then(({{trip, shapes}}) => {{
+                    // Ignorar respuestas de un trip que ya no está seleccionado
+                    if (tripSelector.value === tripId) {{
+                        displayTrip(trip, shapes);
+                    }}
+                }});
             }} else {{
                 clearMap();
             }}
@@ -360,10 +508,27 @@ def generate_html():
             }}
         }});
         
+        // Nivel más simplificado cuya tolerancia no llega a un píxel del zoom actual
+        function shapeForZoom(shapes) {{
+            const metersPerPixel = 156543.03 * Math.cos(map.getCenter().lat * Math.PI / 180) / Math.pow(2, map.getZoom());
+            let latLngs = shapes[0][1];
+            shapes.forEach(([tolerance, level]) => {{
+                if (tolerance <= metersPerPixel) latLngs = level;
+            }});
+            return latLngs;
+        }}
+        
+        map.on('zoomend', function() {{
+            if (routeLayer) {{
+                routeLayer.setLatLngs(shapeForZoom(routeShapes));
+            }}
+        }});
+        
         function clearMap() {{
             if (routeLayer) {{
                 map.removeLayer(routeLayer);
                 routeLayer = null;
+                routeShapes = null;
             }}
             if (stopsLayer) {{
                 map.removeLayer(stopsLayer);
@@ -373,23 +538,20 @@ def generate_html():
             toggleButton.style.display = 'none';
         }}
         
-        function displayTrip(tripId) {{
+        function displayTrip(trip, shapes) {{
             clearMap();
             
-            const trip = tripsData.find(t => t.trip_id === tripId);
-            if (!trip) return;
-            
-            // Dibujar ruta
-            const shapeCoords = shapesData[trip.shape_id];
-            if (shapeCoords) {{
-                const latLngs = shapeCoords.map(pt => [pt.lat, pt.lon]);
-                routeLayer = L.polyline(latLngs, {{
+            // Dibujar ruta (encuadre con la shape completa, luego el nivel del zoom)
+            if (shapes.length && shapes[0][1].length) {{
+                routeLayer = L.polyline(shapes[0][1], {{
                     color: '#2196F3',
                     weight: 4,
                     opacity: 0.7
                 }}).addTo(map);
+                routeShapes = shapes;
                 
                 map.fitBounds(routeLayer.getBounds(), {{padding: [50, 50]}});
+                routeLayer.setLatLngs(shapeForZoom(shapes));
             }}
             
             // Dibujar paradas
@@ -455,20 +617,48 @@ def generate_html():
     </script>
 </body>
 </html>'''
-    
-    return html
 
 def main():
+    parser = argparse.ArgumentParser(description="Genera trips_visualizer.html")
+    parser.add_argument('--chunked', nargs='?', type=Path, const=Path(__file__).parent / 'trips_visualizer',
+                        help="Escribir una página sin datos y un chunk por trip que se carga al "
+                             "seleccionarlo (default: trips_visualizer/)")
+    add_profile_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args, 'generate_updated_visualizer')
+    
     print("=" * 80)
     print("🎨 GENERANDO VISUALIZADOR ACTUALIZADO")
     print("=" * 80)
     print()
     
-    html = generate_html()
+    if args.chunked:
+        with PROFILER.stage('generate_chunked'):
+            total_trips, data_bytes = generate_chunked(args.chunked)
+        output_file = args.chunked / 'index.html'
+        
+        print()
+        print("=" * 80)
+        print("✅ VISUALIZADOR GENERADO (POR PARTES)")
+        print("=" * 80)
+        print(f"📁 Directorio: {args.chunked}")
+        print(f"📊 Página: {output_file.stat().st_size / 1024:.1f} KB; datos: {total_trips} chunks, "
+              f"{data_bytes / (1024 * 1024):.2f} MB")
+        print()
+        print("🌐 Para ver (los chunks se piden por HTTP):")
+        print(f"   python3 -m http.server 8000 -d {args.chunked}")
+        print("   http://localhost:8000/")
+        
+        finish_profile()
+        return
+    
+    with PROFILER.stage('generate_html'):
+        html = generate_html()
     
     output_file = Path(__file__).parent / 'trips_visualizer.html'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(html)
+    with PROFILER.stage('write_html'):
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(html)
     
     file_size = output_file.stat().st_size / (1024 * 1024)
     
@@ -481,6 +671,8 @@ def main():
     print()
     print("🌐 Para ver:")
     print(f"   file://{output_file.absolute()}")
+    
+    finish_profile()
 
 if __name__ == "__main__":
     main()
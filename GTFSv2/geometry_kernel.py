@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Kernel vectorizado (NumPy) para relacionar paradas con los segmentos de una shape
+Calcula en una sola llamada, para un lote de paradas:
+- distancia mínima a la polilínea
+- índice del segmento más cercano
+- producto cruz (lado de la vía)
+- distancia a lo largo de la shape (equivalente a LineString.project)
+
+Replica las fórmulas de GEOS (Distance::pointToSegment y LengthIndexedLine)
+para que los resultados coincidan con el camino original basado en shapely.
+"""
+
+import numpy as np
+
+from instrumentation import PROFILER
+
+# Tamaño máximo de la matriz paradas × segmentos por bloque
+MAX_BLOCK_CELLS = 4_000_000
+
+class SegmentArrays:
+    """
+    Segmentos de una polilínea en arrays (inicio, delta, largo, acumulado)
+    measure: medidas acumuladas por vértice ya calculadas (p.ej. del caché de shapes)
+    """
+
+    def __init__(self, route_coords, measure=None):
+        coords = np.asarray(route_coords, dtype=np.float64)[:, :2]
+        self.coords = coords
+        self.ax = coords[:-1, 0]
+        self.ay = coords[:-1, 1]
+        self.bx = coords[1:, 0]
+        self.by = coords[1:, 1]
+        self.dx = self.bx - self.ax
+        self.dy = self.by - self.ay
+        self.len2 = self.dx * self.dx + self.dy * self.dy
+        self.length = np.sqrt(self.len2)
+        # Medida acumulada en cada vértice (suma secuencial como GEOS)
+        if measure is None:
+            measure = np.zeros(len(coords), dtype=np.float64)
+            if len(self.length):
+                np.cumsum(self.length, out=measure[1:])
+        self.measure = np.asarray(measure, dtype=np.float64)
+        self.start_measure = self.measure[:-1]
+        self.total_length = float(self.measure[-1]) if len(self.length) else 0.0
+
+    def __len__(self):
+        return len(self.length)
+
+def _point_distance(px, py, qx, qy):
+    dx = px - qx
+    dy = py - qy
+    return np.sqrt(dx * dx + dy * dy)
+
+def project_points(points, segments):
+    """
+    Relaciona un lote de puntos con los segmentos de una shape
+
+    Args:
+        points: array (m, 2) de (x, y) en el mismo sistema que la shape
+        segments: SegmentArrays de la shape (o coordenadas de la shape)
+
+    Returns:
+        Diccionario de arrays de largo m:
+        - 'distance': distancia mínima a la polilínea
+        - 'segment': índice del segmento más cercano (primer mínimo)
+        - 'cross': producto cruz respecto a ese segmento (< 0 = derecha)
+        - 'along': distancia a lo largo de la shape hasta la proyección
+    """
+    if not isinstance(segments, SegmentArrays):
+        segments = SegmentArrays(segments)
+
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    m = len(points)
+    n = len(segments)
+    PROFILER.count('kernel_calls')
+    PROFILER.count('kernel_point_segment_pairs', m * n)
+
+    result = {
+        'distance': np.empty(m, dtype=np.float64),
+        'segment': np.zeros(m, dtype=np.int64),
+        'cross': np.empty(m, dtype=np.float64),
+        'along': np.empty(m, dtype=np.float64)
+    }
+    if m == 0:
+        return result
+    if n == 0:
+        raise ValueError("La shape necesita al menos 2 puntos")
+
+    block = max(1, MAX_BLOCK_CELLS // n)
+    for start in range(0, m, block):
+        end = min(m, start + block)
+        _project_block(points[start:end], segments, result, start, end)
+
+    return result
+
+def _project_block(points, seg, result, start, end):
+    px = points[:, 0:1]
+    py = points[:, 1:2]
+
+    # Distancia punto-segmento (misma secuencia de operaciones que GEOS)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = ((px - seg.ax) * seg.dx + (py - seg.ay) * seg.dy) / seg.len2
+        s = ((seg.ay - py) * seg.dx - (seg.ax - px) * seg.dy) / seg.len2
+    perp = np.abs(s) * seg.length
+
+    dist_a = _point_distance(px, py, seg.ax, seg.ay)
+    dist_b = _point_distance(px, py, seg.bx, seg.by)
+    degenerate = seg.len2 == 0
+
+    dist = np.where(r <= 0.0, dist_a, np.where(r >= 1.0, dist_b, perp))
+    dist = np.where(degenerate, dist_a, dist)
+
+    # argmin devuelve el primer mínimo, igual que el bucle con '<'
+    seg_idx = np.argmin(dist, axis=1)
+    rows = np.arange(len(points))
+    min_dist = dist[rows, seg_idx]
+
+    # Lado de la vía con producto cruz sobre el segmento más cercano
+    ax = seg.ax[seg_idx]
+    ay = seg.ay[seg_idx]
+    dx = seg.dx[seg_idx]
+    dy = seg.dy[seg_idx]
+    cross = dx * (points[:, 1] - ay) - dy * (points[:, 0] - ax)
+
+    # Medida a lo largo (LengthIndexOfPoint::segmentNearestMeasure)
+    r_near = r[rows, seg_idx]
+    seg_len = seg.length[seg_idx]
+    seg_start = seg.start_measure[seg_idx]
+    along = np.where(
+        r_near <= 0.0,
+        seg_start,
+        np.where(r_near <= 1.0, seg_start + r_near * seg_len, seg_start + seg_len)
+    )
+    # Segmento degenerado: r es NaN y GEOS devuelve inicio + largo (= inicio)
+    along = np.where(np.isnan(r_near), seg_start + seg_len, along)
+
+    result['distance'][start:end] = min_dist
+    result['segment'][start:end] = seg_idx
+    result['cross'][start:end] = cross
+    result['along'][start:end] = along
+
+def shapely_reference(points, route_coords):
+    """Camino original con shapely (un LineString por segmento); usado para paridad"""
+    from shapely.geometry import Point, LineString
+
+    route_line = LineString(route_coords)
+    out = {'distance': [], 'segment': [], 'cross': [], 'along': []}
+    for x, y in np.asarray(points, dtype=np.float64).tolist():
+        stop_point = Point(x, y)
+        min_dist = float('inf')
+        segment_idx = 0
+        for i in range(len(route_coords) - 1):
+            seg = LineString([route_coords[i], route_coords[i + 1]])
+            d = seg.distance(stop_point)
+            if d < min_dist:
+                min_dist = d
+                segment_idx = i
+        p1 = route_coords[segment_idx]
+        p2 = route_coords[segment_idx + 1]
+        out['distance'].append(route_line.distance(stop_point))
+        out['segment'].append(segment_idx)
+        out['cross'].append((p2[0] - p1[0]) * (y - p1[1]) - (p2[1] - p1[1]) * (x - p1[0]))
+        out['along'].append(route_line.project(stop_point))
+    return {k: np.array(v) for k, v in out.items()}
+
+def check_parity(points, route_coords):
+    """
+    Compara project_points contra shapely_reference
+
+    Returns:
+        Lista de diferencias encontradas (vacía si hay paridad exacta)
+    """
+    fast = project_points(points, route_coords)
+    ref = shapely_reference(points, route_coords)
+    problems = []
+    for key in ('distance', 'segment', 'cross', 'along'):
+        diff = np.nonzero(fast[key] != ref[key])[0]
+        for i in diff[:5]:
+            problems.append(f"{key}[{i}]: kernel={fast[key][i]!r} shapely={ref[key][i]!r}")
+    return problems
+
+def main():
+    """Verifica paridad kernel vs shapely sobre las shapes y paradas reales"""
+    import json
+    from pathlib import Path
+
+    from shape_store import load_shape_store
+
+    base_path = Path(__file__).parent
+    shapes_file = base_path.parent / 'GTFS/out/trujillo/gtfs/shapes.txt'
+    stops_file = base_path / 'stops_with_ids_final.json'
+
+    print("=" * 80)
+    print("🧪 PARIDAD KERNEL NUMPY vs SHAPELY")
+    print("=" * 80)
+
+    store = load_shape_store(shapes_file)
+    with open(stops_file, 'r', encoding='utf-8') as f:
+        stops = json.load(f)['stops']
+    points = np.array([[s['stop_lon'], s['stop_lat']] for s in stops])
+
+    failures = 0
+    for shape_id in store.shape_ids:
+        route_coords = store.get(shape_id)
+        if not route_coords or len(route_coords) < 2:
+            continue
+        # Paradas cercanas a la shape (las que realmente llegan al test de lado)
+        near = project_points(points, route_coords)['distance'] * 111000 <= 50
+        problems = check_parity(points[near], route_coords)
+        if problems:
+            failures += 1
+            print(f"   ❌ Shape {shape_id}:")
+            for p in problems:
+                print(f"      {p}")
+
+    print()
+    if failures:
+        print(f"❌ {failures} shapes con diferencias")
+        raise SystemExit(1)
+    print(f"✅ Paridad exacta en {len(store)} shapes")
+
+if __name__ == "__main__":
+    main()
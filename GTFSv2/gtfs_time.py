@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Tiempos GTFS ('HH:MM:SS', HH puede pasar de 24) <-> segundos desde el inicio
+del día de servicio, y formateo en lote de arrays de segundos
+"""
+
+import numpy as np
+
+DAY_SECONDS = 24 * 3600
+
+def parse_gtfs_time(text):
+    """'HH:MM:SS' a segundos desde el inicio del día de servicio"""
+    hours, minutes, seconds = (int(part) for part in text.strip().split(':'))
+    return hours * 3600 + minutes * 60 + seconds
+
+def format_gtfs_time(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+class TimeTable:
+    """
+    Textos 'HH:MM:SS' precalculados por segundo, para formatear arrays de
+    tiempos con una sola indexación (crece si aparece un tiempo mayor)
+    """
+
+    def __init__(self, max_seconds=2 * DAY_SECONDS):
+        self.strings = np.empty(0, dtype=object)
+        self._grow(max_seconds)
+
+    def _grow(self, max_seconds):
+        # 'HH:' por hora + 'MM:SS' por segundo de la hora, concatenados en lote
+        seconds = np.arange(len(self.strings), max_seconds + 1)
+        hours = np.array([f"{h:02d}:" for h in range(max_seconds // 3600 + 1)], dtype=object)
+        minutes = np.array([f"{s // 60:02d}:{s % 60:02d}" for s in range(3600)], dtype=object)
+        self.strings = np.concatenate([self.strings, hours[seconds // 3600] + minutes[seconds % 3600]])
+
+    def format(self, seconds):
+        """Array de segundos enteros (cualquier forma) a array de textos de la misma forma"""
+        seconds = np.asarray(seconds, dtype=np.int64)
+        if seconds.size and seconds.max() >= len(self.strings):
+            self._grow(int(seconds.max()))
+        return self.strings[seconds]
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Escritura en streaming de tablas GTFS
+Las filas llegan de generadores y se formatean por lotes (un csv.writer sobre
+un buffer que se vacía cada BATCH_ROWS filas), así la memoria queda acotada por
+el tamaño del lote y no por el de la tabla. Las filas también pueden llegar ya
+codificadas en bloques de texto (TextBlocks). GTFSZipWriter escribe cada tabla
+directo como entrada del zip, sin copias intermedias en disco.
+"""
+
+import csv
+import io
+import shutil
+import time
+import zipfile
+from pathlib import Path
+
+from instrumentation import PROFILER
+
+BATCH_ROWS = 5000
+COPY_CHUNK = 1 << 20
+
+SHAPES_FIELDNAMES = ['shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence']
+
+def csv_line(values):
+    """Una fila codificada como CSV (con el mismo dialecto y fin de línea que las tablas)"""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+class TextBlocks:
+    """
+    Filas ya codificadas como CSV, en bloques (texto, número de filas)
+    Para generadores que arman el texto de muchas filas de una vez (p.ej.
+    service_expansion); iter_csv_chunks los escribe tal cual
+    """
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+def _iter_text_chunks(fieldnames, blocks, batch_size, counter):
+    parts = [csv_line(fieldnames)]
+    pending = 0
+    for text, n_rows in blocks:
+        parts.append(text)
+        pending += n_rows
+        if pending >= batch_size:
+            chunk = ''.join(parts)
+            PROFILER.count('csv_rows_written', pending)
+            PROFILER.count('csv_bytes_written', len(chunk))
+            yield chunk
+            if counter is not None:
+                counter[0] += pending
+            parts = []
+            pending = 0
+    chunk = ''.join(parts)
+    PROFILER.count('csv_rows_written', pending)
+    PROFILER.count('csv_bytes_written', len(chunk))
+    yield chunk
+    if counter is not None:
+        counter[0] += pending
+
+def iter_csv_chunks(fieldnames, rows, batch_size=BATCH_ROWS, counter=None):
+    """
+    Texto CSV (con cabecera) en bloques de hasta batch_size filas
+    rows: iterable de filas (listas/tuplas) o TextBlocks ya codificados
+    Si se pasa counter (lista de un elemento), acumula ahí las filas escritas
+    """
+    if isinstance(rows, TextBlocks):
+        yield from _iter_text_chunks(fieldnames, rows, batch_size, counter)
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fieldnames)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending == batch_size:
+            chunk = buffer.getvalue()
+            PROFILER.count('csv_rows_written', pending)
+            PROFILER.count('csv_bytes_written', len(chunk))
+            yield chunk
+            buffer.seek(0)
+            buffer.truncate()
+            if counter is not None:
+                counter[0] += pending
+            pending = 0
+    chunk = buffer.getvalue()
+    PROFILER.count('csv_rows_written', pending)
+    PROFILER.count('csv_bytes_written', len(chunk))
+    yield chunk
+    if counter is not None:
+        counter[0] += pending
+
+def write_table_file(path, fieldnames, rows, batch_size=BATCH_ROWS):
+    """Escribe una tabla GTFS en un archivo .txt; devuelve el número de filas"""
+    counter = [0]
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for chunk in iter_csv_chunks(fieldnames, rows, batch_size, counter):
+            f.write(chunk)
+    return counter[0]
+
+def iter_shape_rows(shape_store, shape_ids=None):
+    """Filas de shapes.txt desde un ShapeStore (todas las shapes por defecto)"""
+    for shape_id in shape_store.shape_ids if shape_ids is None else shape_ids:
+        coords = shape_store.coords(shape_id)
+        if coords is None:
+            continue
+        seqs = shape_store.sequences(shape_id)
+        for (lon, lat), seq in zip(coords.tolist(), seqs.tolist()):
+            yield (shape_id, lat, lon, seq)
+
+class GTFSZipWriter:
+    """
+    Zip GTFS escrito tabla por tabla en una sola pasada
+
+        with GTFSZipWriter('gtfs_trujillo.zip') as feed_zip:
+            feed_zip.write_table('stop_times.txt', fieldnames, rows)
+
+    Se escribe sobre un archivo temporal que reemplaza al destino solo si todo
+    terminó bien (un zip a medio escribir nunca queda con el nombre final)
+    """
+
+    def __init__(self, path, compresslevel=6):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + '.tmp')
+        self.zip = zipfile.ZipFile(self.tmp_path, 'w', compression=zipfile.ZIP_DEFLATED,
+                                   compresslevel=compresslevel)
+        self.tables = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.zip.close()
+        if exc_type is None:
+            self.tmp_path.replace(self.path)
+        else:
+            self.tmp_path.unlink(missing_ok=True)
+        return False
+
+    def _open_entry(self, name):
+        info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        # Con un ZipInfo propio (fecha y permisos) el nivel del ZipFile no se
+        # aplica solo; ZipFile.open(nombre) lo copia igual
+        info._compresslevel = self.zip.compresslevel
+        info.external_attr = 0o644 << 16
+        return self.zip.open(info, 'w', force_zip64=True)
+
+    def write_table(self, name, fieldnames, rows, batch_size=BATCH_ROWS):
+        """Escribe la tabla `name` desde un iterable de filas; devuelve el número de filas"""
+        counter = [0]
+        with self._open_entry(name) as entry:
+            for chunk in iter_csv_chunks(fieldnames, rows, batch_size, counter):
+                entry.write(chunk.encode('utf-8'))
+        self.tables[name] = counter[0]
+        return counter[0]
+
+    def write_file(self, name, source_path):
+        """Copia un archivo .txt existente (p.ej. agency.txt) como entrada del zip"""
+        with open(source_path, 'rb') as src, self._open_entry(name) as entry:
+            shutil.copyfileobj(src, entry, COPY_CHUNK)
+        self.tables[name] = None
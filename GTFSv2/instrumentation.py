@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Instrumentación de corridas
+Un perfilador por proceso (PROFILER) que, con --profile, registra tiempo de
+pared/CPU y RSS pico por etapa y por item (trip), contadores de eventos del
+camino caliente (paradas candidatas evaluadas, llamadas al kernel geométrico,
+bytes de JSON parseados, filas CSV escritas) y, opcionalmente, volcados de
+cProfile y tracemalloc; todo en un reporte JSON por corrida.
+
+Los procesos de un pool tienen su propia copia de PROFILER: se arrancan con
+init_pool_worker, cada tarea se envuelve con profiled (devuelve el resultado
+junto con los contadores e items que registró) y merged los suma al
+PROFILER del proceso principal.
+
+Sin --profile las llamadas son no-ops baratas. Los mensajes por trip solo se
+imprimen con --verbose.
+"""
+
+import cProfile
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+
+REPORT_VERSION = 2
+SLOWEST_ITEMS = 20
+TRACEMALLOC_TOP = 25
+
+def default_profile_dir():
+    return Path(__file__).parent / 'profiles'
+
+def peak_rss_mb():
+    """RSS pico del proceso en MB (ru_maxrss: KB en Linux, bytes en macOS)"""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+class RunProfiler:
+    """Registro de etapas, items y contadores de una corrida"""
+
+    def __init__(self):
+        self.enabled = False
+        self.verbose = False
+        self.script = None
+        self.report_path = None
+        self.stages = []
+        self.items = {}
+        self.counters = Counter()
+        self._stack = []
+        self._cprofile = None
+        self._tracemalloc = False
+        self._start_wall = None
+        self._start_cpu = None
+        self._started = None
+
+    def configure(self, script, report_path=None, verbose=False, cprofile=False, trace_memory=False):
+        """Activa el registro (report_path) y/o los mensajes detallados (verbose)"""
+        self.script = script
+        self.verbose = verbose
+        self.enabled = report_path is not None
+        self.report_path = Path(report_path) if report_path is not None else None
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._started = time.strftime('%Y-%m-%dT%H:%M:%S')
+        if self.enabled and trace_memory:
+            tracemalloc.start()
+            self._tracemalloc = True
+        if self.enabled and cprofile:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def start_worker(self, enabled):
+        """En un proceso de un pool: registra solo contadores e items, desde cero"""
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile = None
+        if self._tracemalloc:
+            tracemalloc.stop()
+            self._tracemalloc = False
+        self.enabled = enabled
+        self.report_path = None
+        self.stages = []
+        self.items = {}
+        self.counters = Counter()
+        self._stack = []
+
+    def collect(self):
+        """Contadores e items registrados desde la última llamada (se vacían); None sin --profile"""
+        if not self.enabled:
+            return None
+        recorded = dict(self.counters), self.items
+        self.counters = Counter()
+        self.items = {}
+        return recorded
+
+    def merge(self, recorded):
+        """Suma lo devuelto por collect() en otro proceso"""
+        if recorded is None or not self.enabled:
+            return
+        counters, items = recorded
+        self.counters.update(counters)
+        for kind, values in items.items():
+            self.items.setdefault(kind, {}).update(values)
+
+    def log(self, *args, **kwargs):
+        """print solo con --verbose (mensajes por trip)"""
+        if self.verbose:
+            print(*args, **kwargs)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] += n
+
+    @contextmanager
+    def stage(self, name):
+        """Mide una etapa; las etapas anidadas se registran como 'padre/hija'"""
+        if not self.enabled:
+            yield
+            return
+        self._stack.append(name)
+        full_name = '/'.join(self._stack)
+        rss_before = peak_rss_mb()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.stages.append({
+                'name': full_name,
+                'wall_s': round(time.perf_counter() - wall, 6),
+                'cpu_s': round(time.process_time() - cpu, 6),
+                'peak_rss_mb': round(peak_rss_mb(), 1),
+                'rss_growth_mb': round(peak_rss_mb() - rss_before, 1)
+            })
+            self._stack.pop()
+
+    @contextmanager
+    def item(self, kind, item_id):
+        """
+        Mide un item (p.ej. un trip) dentro de una etapa: pared, CPU, RSS pico
+        del proceso al terminarlo y cuánto lo hizo crecer el item
+        """
+        if not self.enabled:
+            yield
+            return
+        rss_before = peak_rss_mb()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            rss_after = peak_rss_mb()
+            self.items.setdefault(kind, {})[str(item_id)] = (
+                time.perf_counter() - wall,
+                time.process_time() - cpu,
+                rss_after,
+                rss_after - rss_before
+            )
+
+    def _items_report(self):
+        report = {}
+        for kind, values in self.items.items():
+            walls = [wall for wall, _, _, _ in values.values()]
+            growths = [growth for _, _, _, growth in values.values()]
+            slowest = sorted(values.items(), key=lambda kv: kv[1][0], reverse=True)[:SLOWEST_ITEMS]
+            report[kind] = {
+                'count': len(values),
+                'wall_s_total': round(sum(walls), 6),
+                'wall_s_mean': round(sum(walls) / len(walls), 6) if walls else 0,
+                'wall_s_max': round(max(walls), 6) if walls else 0,
+                'rss_growth_mb_max': round(max(growths), 1) if growths else 0,
+                'slowest': [
+                    {'id': item_id, 'wall_s': round(wall, 6), 'cpu_s': round(cpu, 6),
+                     'peak_rss_mb': round(rss, 1), 'rss_growth_mb': round(growth, 1)}
+                    for item_id, (wall, cpu, rss, growth) in slowest
+                ],
+                # [wall_s, cpu_s, peak_rss_mb, rss_growth_mb] por item
+                'all': {item_id: [round(wall, 6), round(cpu, 6), round(rss, 1), round(growth, 1)]
+                        for item_id, (wall, cpu, rss, growth) in values.items()}
+            }
+        return report
+
+    def write_report(self):
+        """Escribe el reporte JSON (y los volcados pedidos); devuelve su ruta o None"""
+        if not self.enabled:
+            return None
+        self.report_path.parent.mkdir(parents=True, exist_ok=True)
+
+        report = {
+            'version': REPORT_VERSION,
+            'script': self.script,
+            'argv': sys.argv[1:],
+            'started': self._started,
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'pid': os.getpid()
+            },
+            'total': {
+                'wall_s': round(time.perf_counter() - self._start_wall, 6),
+                'cpu_s': round(time.process_time() - self._start_cpu, 6),
+                'peak_rss_mb': round(peak_rss_mb(), 1)
+            },
+            'stages': self.stages,
+            'items': self._items_report(),
+            'counters': dict(sorted(self.counters.items()))
+        }
+
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            prof_path = self.report_path.with_suffix('.prof')
+            self._cprofile.dump_stats(prof_path)
+            report['cprofile'] = str(prof_path)
+
+        if self._tracemalloc:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            report['tracemalloc'] = {
+                'current_mb': round(current / (1024 * 1024), 2),
+                'peak_mb': round(peak / (1024 * 1024), 2),
+                'top': [
+                    {'where': str(stat.traceback), 'size_kb': round(stat.size / 1024, 1), 'count': stat.count}
+                    for stat in snapshot.statistics('lineno')[:TRACEMALLOC_TOP]
+                ]
+            }
+
+        with open(self.report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return self.report_path
+
+PROFILER = RunProfiler()
+
+def init_pool_worker(enabled, initializer=None, *initargs):
+    """
+    initializer de ProcessPoolExecutor: PROFILER del proceso arranca vacío
+    (registrando si enabled, el PROFILER.enabled del principal) y después
+    initializer(*initargs)
+    """
+    PROFILER.start_worker(enabled)
+    if initializer is not None:
+        initializer(*initargs)
+
+def profiled(func, *args):
+    """Tarea de un pool: (func(*args), lo que registró el proceso); usar con functools.partial"""
+    return func(*args), PROFILER.collect()
+
+def merged(results):
+    """Resultados de tareas profiled, sumando lo registrado en cada proceso a PROFILER"""
+    for result, recorded in results:
+        PROFILER.merge(recorded)
+        yield result
+
+def add_profile_args(parser):
+    """Agrega --profile, --cprofile, --tracemalloc y --verbose a un ArgumentParser"""
+    parser.add_argument('--profile', nargs='?', type=Path, const=True, default=None,
+                        help="Registrar tiempos/memoria/contadores en un reporte JSON "
+                             "(default: profiles/<script>_<fecha>.json)")
+    parser.add_argument('--cprofile', action='store_true',
+                        help="Con --profile: volcado de cProfile (.prof junto al reporte)")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="Con --profile: pico y principales asignaciones de memoria (más lento)")
+    parser.add_argument('--verbose', '-v', action='store_true',
+                        help="Mostrar el detalle por trip")
+    return parser
+
+def configure_from_args(args, script):
+    """Configura PROFILER desde los argumentos de add_profile_args"""
+    report_path = args.profile
+    if report_path is True:
+        report_path = default_profile_dir() / f"{script}_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    PROFILER.configure(script, report_path, verbose=args.verbose,
+                       cprofile=args.cprofile, trace_memory=args.tracemalloc)
+    return PROFILER
+
+def finish_profile():
+    """Escribe el reporte si --profile estaba activo e informa su ruta"""
+    path = PROFILER.write_report()
+    if path is not None:
+        print(f"\n🔎 Perfil: {path}")
+    return path
+
+def load_json(path):
+    """json.load contando los bytes parseados"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    PROFILER.count('json_bytes_parsed', len(data))
+    return json.loads(data)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Referenciación lineal sobre las shapes
+Cada shape se recorre con sus medidas acumuladas (metros desde el inicio de
+cada vértice, precalculadas en el caché de shape_store) y las paradas se
+proyectan en lote con el kernel vectorizado.
+
+En rutas circulares (inicio y fin a menos de RING_TOLERANCE metros) una parada
+en el terminal está a la misma distancia del primer y del último segmento:
+LineString.project la lleva siempre al inicio (medida ~0), aunque en la
+secuencia sea la última; lo mismo pasa con cualquier shape que vuelve a pasar
+por un tramo ya recorrido. locate_sequence resuelve esos casos con el orden de
+la secuencia: cada parada se busca solo después de la anterior. La asignación
+de paradas la usa para repetir el terminal de las shapes circulares al final
+del recorrido (ver close_ring en assign_stops_to_trips).
+"""
+
+import numpy as np
+
+from geometry_kernel import SegmentArrays, project_points
+
+# Distancia máxima (metros) entre el primer y el último punto para tratar la shape como circular
+RING_TOLERANCE = 50.0
+
+def cumulative_measures(route_xy):
+    """
+    Medida acumulada (metros) en cada vértice de una polilínea
+    Suma secuencial de los largos de segmento (mismo orden que GEOS)
+    """
+    route_xy = np.asarray(route_xy, dtype=np.float64)
+    measure = np.zeros(len(route_xy), dtype=np.float64)
+    if len(route_xy) > 1:
+        dx = route_xy[1:, 0] - route_xy[:-1, 0]
+        dy = route_xy[1:, 1] - route_xy[:-1, 1]
+        np.cumsum(np.sqrt(dx * dx + dy * dy), out=measure[1:])
+    return measure
+
+class LinearReference:
+    """Shape proyectada con sus medidas acumuladas, lista para localizar paradas"""
+
+    def __init__(self, route_xy, measure=None, ring_tolerance=RING_TOLERANCE):
+        self.route_xy = np.asarray(route_xy, dtype=np.float64)[:, :2]
+        self.segments = SegmentArrays(self.route_xy, measure=measure)
+        self.measure = self.segments.measure
+        self.length = self.segments.total_length
+        self.ring_tolerance = ring_tolerance
+        closing = np.hypot(*(self.route_xy[0] - self.route_xy[-1])) if len(self.route_xy) else np.inf
+        self.is_ring = len(self.route_xy) > 2 and closing <= ring_tolerance
+
+    def locate(self, points):
+        """Distancia, segmento, lado y medida de un lote de puntos (ver project_points)"""
+        return project_points(points, self.segments)
+
+    def measures(self, points):
+        """Medida a lo largo (metros) de cada punto, sin contexto de secuencia"""
+        return self.locate(points)['along']
+
+    def _measure_within(self, point, start, end):
+        """Medida del punto proyectado solo sobre el tramo de medidas [start, end]"""
+        first = max(int(np.searchsorted(self.measure, start, side='right')) - 1, 0)
+        last = min(int(np.searchsorted(self.measure, end, side='left')), len(self.measure) - 1)
+        if last - first < 1:
+            last = min(first + 1, len(self.measure) - 1)
+            first = last - 1
+        sub = SegmentArrays(self.route_xy[first:last + 1])
+        along = project_points(point, sub)['along'][0]
+        return float(self.measure[first] + along)
+
+    def locate_sequence(self, points):
+        """
+        Medidas de una secuencia ordenada de paradas (no decrecientes)
+        Una parada que proyecta antes que la anterior (terminal de una ruta
+        circular, o shape que vuelve a pasar por el mismo tramo) se reproyecta
+        solo sobre lo que queda de la shape; la primera, si cae después de la
+        segunda, sobre el tramo inicial
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        along = self.measures(points)
+        if len(points) < 2:
+            return along
+
+        if along[0] > along[1]:
+            along[0] = min(self._measure_within(points[:1], 0.0, along[1]), along[1])
+        for i in range(1, len(points)):
+            if along[i] < along[i - 1]:
+                along[i] = max(self._measure_within(points[i:i + 1], along[i - 1], self.length), along[i - 1])
+        return along
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Manifiestos de build incremental
+Guardan, por trip, un hash de contenido de sus entradas (shape, paradas cercanas,
+parámetros) junto con el resultado calculado. En la siguiente corrida solo se
+recalculan los trips cuyo hash cambió; el resto reutiliza el resultado guardado.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+
+MANIFEST_VERSION = 1
+
+def content_hash(*parts):
+    """
+    Hash SHA-1 de una secuencia de partes
+    Acepta bytes, str, arrays NumPy y estructuras serializables a JSON
+    """
+    h = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            arr = np.ascontiguousarray(part)
+            h.update(arr.dtype.str.encode('ascii'))
+            h.update(str(arr.shape).encode('ascii'))
+            h.update(arr.tobytes())
+        elif isinstance(part, bytes):
+            h.update(part)
+        elif isinstance(part, str):
+            h.update(part.encode('utf-8'))
+        else:
+            h.update(json.dumps(part, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+class BuildManifest:
+    """
+    Manifiesto de una etapa: item_id -> {'key': hash de entradas, 'result': ...}
+    Si cambian los parámetros de la etapa (o la versión) se descarta completo
+    """
+
+    def __init__(self, path, params, enabled=True):
+        self.path = Path(path)
+        self.params = params
+        self.params_key = content_hash(MANIFEST_VERSION, params)
+        self.enabled = enabled
+        self.previous = {}
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+        if enabled and self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+            if data.get('params_key') == self.params_key:
+                self.previous = data.get('items', {})
+
+    def lookup(self, item_id, key):
+        """Resultado guardado si el hash de entradas coincide; None si hay que recalcular"""
+        entry = self.previous.get(item_id)
+        if entry is not None and entry['key'] == key:
+            self.hits += 1
+            self.entries[item_id] = entry
+            return entry['result']
+        self.misses += 1
+        return None
+
+    def record(self, item_id, key, result):
+        """Registra el resultado recién calculado para item_id"""
+        self.entries[item_id] = {'key': key, 'result': result}
+
+    def save(self):
+        """Escribe solo los items vistos en esta corrida (descarta trips eliminados)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'version': MANIFEST_VERSION,
+                'params': self.params,
+                'params_key': self.params_key,
+                'items': self.entries
+            }, f, ensure_ascii=False, separators=(',', ':'))
+        tmp_path.replace(self.path)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Capa de coordenadas proyectadas (metros)
+Proyecta (lon, lat) WGS84 a UTM zona 17S (EPSG:32717), la zona de Trujillo,
+para hacer toda la geometría con distancias euclidianas en metros en vez de
+grados × 111000.
+
+Implementa la serie de Krüger (precisión sub-milimétrica dentro de la zona)
+con NumPy, sin depender de pyproj.
+"""
+
+import math
+
+import numpy as np
+
+UTM_ZONE = 17
+UTM_SOUTH = True
+EPSG = 32717
+
+# Elipsoide WGS84
+_A = 6378137.0
+_F = 1 / 298.257223563
+_K0 = 0.9996
+_N = _F / (2 - _F)
+_A_RECT = _A / (1 + _N) * (1 + _N ** 2 / 4 + _N ** 4 / 64)
+_ALPHA = (
+    _N / 2 - 2 / 3 * _N ** 2 + 5 / 16 * _N ** 3 + 41 / 180 * _N ** 4,
+    13 / 48 * _N ** 2 - 3 / 5 * _N ** 3 + 557 / 1440 * _N ** 4,
+    61 / 240 * _N ** 3 - 103 / 140 * _N ** 4,
+    49561 / 161280 * _N ** 4
+)
+_E2N = 2 * math.sqrt(_N) / (1 + _N)
+
+def to_utm(lon, lat, zone=UTM_ZONE, south=UTM_SOUTH):
+    """
+    Proyecta longitudes/latitudes (escalares o arrays) a UTM
+
+    Returns:
+        (x, y) en metros (easting, northing) como arrays float64
+    """
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+
+    lon0 = math.radians((zone - 1) * 6 - 180 + 3)
+    phi = np.radians(lat)
+    dlam = np.radians(lon) - lon0
+
+    sin_phi = np.sin(phi)
+    t = np.sinh(np.arctanh(sin_phi) - _E2N * np.arctanh(_E2N * sin_phi))
+    xi = np.arctan2(t, np.cos(dlam))
+    eta = np.arctanh(np.sin(dlam) / np.sqrt(1 + t * t))
+
+    x_sum = eta.copy()
+    y_sum = xi.copy()
+    for j, alpha in enumerate(_ALPHA, 1):
+        x_sum += alpha * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+        y_sum += alpha * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+
+    x = 500000.0 + _K0 * _A_RECT * x_sum
+    y = _K0 * _A_RECT * y_sum
+    if south:
+        y = y + 10000000.0
+    return x, y
+
+def project_coords(coords):
+    """Proyecta un array (n, 2) de (lon, lat) a un array (n, 2) de (x, y) en metros"""
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    x, y = to_utm(coords[:, 0], coords[:, 1])
+    return np.column_stack([x, y])
+
+def project_point(lon, lat):
+    """Proyecta un solo punto; devuelve (x, y) como floats"""
+    x, y = to_utm(lon, lat)
+    return float(x), float(y)
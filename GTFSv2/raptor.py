@@ -0,0 +1,642 @@
+#!/usr/bin/env python3
+"""
+Planificador RAPTOR (Round-bAsed Public Transit Optimized Router) sobre el feed
+Compila un directorio GTFS (gtfs_feed/ por defecto) a arrays planos y responde
+consultas de llegada más temprana con hasta N transbordos, sin OTP ni JVM.
+
+Compilación:
+- patrones: trips con la misma ruta, secuencia de paradas y permisos de
+  subida/bajada; si un trip adelanta a otro del patrón (tiempos por franja),
+  se separa en otro patrón para que cada uno sea FIFO
+- tiempos de cada patrón en bloques parada-mayor (posición · trips + trip);
+  departure_keys = posición global · KEY_STRIDE + salida queda ordenado en
+  todo el array, así un searchsorted da el primer trip abordable en todas las
+  posiciones de todos los patrones a la vez
+- paradas -> (patrón, posición) y transbordos a pie (transfers.txt) en CSR
+- frequencies.txt, si existe, se expande a una salida por headway
+  (exact_times=1, como service_expansion)
+- estaciones (location_type=1) -> andenes (parent_station) en CSR: una
+  estación como origen sale de todos sus andenes y como destino llega al primero
+
+Consulta: ronda k = viajes con k-1 transbordos. Los patrones tocados por
+paradas mejoradas en la ronda anterior se recorren juntos, en lote: primer
+trip abordable por posición, mínimo acumulado por patrón = trip en el que se
+viaja al llegar a cada posición, llegadas por indexación y, por parada, la
+mínima entre todos los patrones. Cada parada guarda por ronda dos etiquetas
+separadas, la del bus y la de la caminata: una llegada en bus se guarda si es
+la más temprana en bus hasta esa ronda, aunque una caminata ya haya llegado
+antes, porque las caminatas de la ronda solo salen de llegadas en bus (o del
+origen; no hay caminata tras caminata y transfers.txt no es transitivo). Para
+subir al bus de la ronda siguiente cuenta la más temprana de las dos. Todos
+los trips del feed se consideran activos el día de la consulta (calendar.txt
+no se filtra).
+
+    timetable = load_raptor('gtfs_feed')
+    result = timetable.route('PH-102', '07:30:00', target='MAVE-357', max_transfers=2)
+    result.arrival('MAVE-357'), result.journey('MAVE-357')
+"""
+
+import argparse
+import csv
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+from array_bundle import read_bundle, read_meta, write_bundle
+from gtfs_time import format_gtfs_time, parse_gtfs_time
+from instrumentation import PROFILER, add_profile_args, configure_from_args, finish_profile
+from service_expansion import expanded_trip_id
+from shape_store import default_cache_dir
+
+CACHE_VERSION = 2
+# Tiempos del feed < KEY_STRIDE segundos (~24 días)
+KEY_STRIDE = 1 << 21
+UNREACHED = np.iinfo(np.int64).max // 4
+# Desplazamiento por patrón para el mínimo acumulado segmentado (> trips por patrón)
+SEGMENT_SHIFT = 1 << 32
+DEFAULT_MAX_TRANSFERS = 3
+
+# Origen de la etiqueta en bus de una parada en una ronda (las caminatas van aparte)
+NONE, ORIGIN, TRANSIT = 0, 1, 2
+
+SOURCE_FILES = ['stops.txt', 'trips.txt', 'stop_times.txt', 'frequencies.txt', 'transfers.txt']
+
+def _read_rows(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return list(csv.DictReader(f))
+
+def _source_stamps(feed_dir):
+    """(tamaño, mtime_ns) de los archivos fuente presentes, para validar el caché"""
+    stamps = {}
+    for name in SOURCE_FILES:
+        path = Path(feed_dir) / name
+        if path.exists():
+            stat = path.stat()
+            stamps[name] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+def _csr(keys, n, *columns):
+    """Agrupa columnas por keys (0..n-1) en CSR: offsets y columnas ordenadas"""
+    order = np.argsort(keys, kind='stable')
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n), out=offsets[1:])
+    return (offsets,) + tuple(column[order] for column in columns)
+
+def _expand(starts, ends):
+    """Concatenación de los rangos starts[i]:ends[i]"""
+    counts = ends - starts
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+def _fifo_groups(runs):
+    """
+    Reparte runs (listas de (arrivals, departures), ordenadas por salida) en
+    grupos donde ningún trip adelanta al anterior en ninguna parada
+    """
+    groups = []
+    for run in runs:
+        for group in groups:
+            last = group[-1]
+            if np.all(last[0] <= run[0]) and np.all(last[1] <= run[1]):
+                group.append(run)
+                break
+        else:
+            groups.append([run])
+    return groups
+
+class RaptorResult:
+    """Llegadas por ronda de una consulta y reconstrucción de itinerarios"""
+
+    def __init__(self, timetable, departure, arrivals, transit_arrivals, walk_arrivals, kind, pattern, trip,
+                 source, walk_edge, walk_source):
+        self.timetable = timetable
+        self.departure = departure
+        self.arrivals = arrivals
+        self.transit_arrivals = transit_arrivals
+        self.walk_arrivals = walk_arrivals
+        self.kind = kind
+        self.pattern = pattern
+        self.trip = trip
+        self.source = source
+        self.walk_edge = walk_edge
+        self.walk_source = walk_source
+
+    def arrival(self, stop_id):
+        """Llegada más temprana (segundos) a la parada o estación, o None si no se alcanza"""
+        best = int(self.arrivals[:, self.timetable.stops_of(stop_id)].min())
+        return None if best >= UNREACHED else best
+
+    def earliest_arrivals(self):
+        """Array (paradas,) de llegadas más tempranas; UNREACHED si no se alcanza"""
+        return self.arrivals.min(axis=0)
+
+    def journey(self, stop_id):
+        """
+        Itinerario hasta la parada (o el andén de la estación) con la llegada
+        más temprana (y, a igual llegada, menos transbordos): lista de tramos,
+        o None si no se alcanza
+        """
+        stops = self.timetable.stops_of(stop_id)
+        k, j = np.unravel_index(np.argmin(self.arrivals[:, stops]), (len(self.arrivals), len(stops)))
+        k, s = int(k), int(stops[j])
+        if self.arrivals[k, s] >= UNREACHED:
+            return None
+
+        tt = self.timetable
+        legs = []
+        while True:
+            # Ronda de la etiqueta que dio la llegada a la parada; si fue a
+            # pie, la caminata sale de la etiqueta en bus de esa misma ronda
+            arrival = self.arrivals[k, s]
+            while self.transit_arrivals[k, s] != arrival and self.walk_arrivals[k, s] != arrival:
+                k -= 1
+            if self.transit_arrivals[k, s] != arrival:
+                edge = self.walk_edge[k, s]
+                from_stop = self.walk_source[k, s]
+                arrival = int(arrival)
+                legs.append({
+                    'mode': 'walk',
+                    'from_stop': tt.stop_ids[from_stop],
+                    'to_stop': tt.stop_ids[s],
+                    'departure': arrival - int(tt.transfer_secs[edge]),
+                    'arrival': arrival
+                })
+                s = from_stop
+            kind = self.kind[k, s]
+            if kind == ORIGIN:
+                break
+
+            p, trip, board_pos = self.pattern[k, s], self.trip[k, s], self.source[k, s]
+            n_trips = tt.pattern_trip_offsets[p + 1] - tt.pattern_trip_offsets[p]
+            block = tt.pattern_time_offsets[p]
+            from_stop = tt.pattern_stops[tt.pattern_offsets[p] + board_pos]
+            global_trip = tt.pattern_trips[tt.pattern_trip_offsets[p] + trip]
+            legs.append({
+                'mode': 'transit',
+                'route_id': tt.route_ids[tt.trip_routes[global_trip]],
+                'trip_id': tt.trip_ids[global_trip],
+                'from_stop': tt.stop_ids[from_stop],
+                'to_stop': tt.stop_ids[s],
+                'departure': int(tt.departures[block + board_pos * n_trips + trip]),
+                'arrival': int(self.transit_arrivals[k, s])
+            })
+            s = from_stop
+            k -= 1
+        return legs[::-1]
+
+class RaptorTimetable:
+    """Feed compilado para RAPTOR (ver docstring del módulo)"""
+
+    ARRAYS = [
+        'trip_routes', 'pattern_offsets', 'pattern_stops', 'pattern_board', 'pattern_alight',
+        'pattern_trip_offsets', 'pattern_trips', 'pattern_time_offsets', 'arrivals', 'departures',
+        'departure_keys', 'stop_pattern_offsets', 'stop_patterns', 'stop_positions',
+        'transfer_offsets', 'transfer_to', 'transfer_secs', 'station_offsets', 'station_children'
+    ]
+
+    def __init__(self, stop_ids, trip_ids, route_ids, station_ids, **arrays):
+        self.stop_ids = list(stop_ids)
+        self.trip_ids = list(trip_ids)
+        self.route_ids = list(route_ids)
+        self.station_ids = list(station_ids)
+        self.stop_index = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+        self.station_index = {station_id: i for i, station_id in enumerate(self.station_ids)}
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def compile(cls, feed_dir):
+        """Compila stops/trips/stop_times (+ frequencies/transfers si existen) de feed_dir"""
+        feed_dir = Path(feed_dir)
+        stop_rows = _read_rows(feed_dir / 'stops.txt')
+        station_ids = [row['stop_id'] for row in stop_rows if (row.get('location_type') or '0').strip() == '1']
+        stop_ids = [row['stop_id'] for row in stop_rows if (row.get('location_type') or '0').strip() != '1']
+        stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+        trip_route = {row['trip_id']: row['route_id'] for row in _read_rows(feed_dir / 'trips.txt')}
+
+        # stop_times por trip, en orden de stop_sequence
+        rows_by_trip = defaultdict(list)
+        with open(feed_dir / 'stop_times.txt', 'r', encoding='utf-8', newline='') as f:
+            reader = csv.reader(f)
+            columns = {name: i for i, name in enumerate(next(reader))}
+            trip_col, stop_col, seq_col = columns['trip_id'], columns['stop_id'], columns['stop_sequence']
+            arr_col, dep_col = columns['arrival_time'], columns['departure_time']
+            pickup_col, drop_col = columns.get('pickup_type'), columns.get('drop_off_type')
+            for row in reader:
+                if row[trip_col] not in trip_route or row[stop_col] not in stop_index:
+                    continue
+                rows_by_trip[row[trip_col]].append((
+                    int(row[seq_col]), stop_index[row[stop_col]],
+                    parse_gtfs_time(row[arr_col]), parse_gtfs_time(row[dep_col]),
+                    pickup_col is None or row[pickup_col].strip() != '1',
+                    drop_col is None or row[drop_col].strip() != '1'
+                ))
+
+        # Salidas por trip: una (la de stop_times) o las de frequencies.txt
+        windows = defaultdict(list)
+        if (feed_dir / 'frequencies.txt').exists():
+            for row in _read_rows(feed_dir / 'frequencies.txt'):
+                windows[row['trip_id']].append((parse_gtfs_time(row['start_time']),
+                                                parse_gtfs_time(row['end_time']), int(row['headway_secs'])))
+
+        route_ids = sorted(set(trip_route.values()))
+        route_index = {route_id: i for i, route_id in enumerate(route_ids)}
+        trip_ids, trip_routes = [], []
+        patterns = defaultdict(list)
+        pattern_layout = {}
+        for trip_id, rows in rows_by_trip.items():
+            if len(rows) < 2:
+                continue
+            rows.sort()
+            _, stops, arrivals, departures, board, alight = (np.array(column) for column in zip(*rows))
+            key = (trip_route[trip_id], stops.tobytes(), board.tobytes(), alight.tobytes())
+            if trip_id in windows:
+                starts = np.unique(np.concatenate([np.arange(start, end, headway)
+                                                   for start, end, headway in windows[trip_id]]))
+                runs = [(expanded_trip_id(trip_id, start), int(start) - departures[0]) for start in starts.tolist()]
+            else:
+                runs = [(trip_id, 0)]
+            for run_id, shift in runs:
+                patterns[key].append((arrivals + shift, departures + shift, len(trip_ids)))
+                trip_ids.append(run_id)
+                trip_routes.append(route_index[trip_route[trip_id]])
+            pattern_layout[key] = stops, board, alight
+
+        pattern_stops, pattern_board, pattern_alight, pattern_trips = [], [], [], []
+        arrival_blocks, departure_blocks, key_blocks = [], [], []
+        pattern_offsets, trip_offsets, time_offsets = [0], [0], [0]
+        for key, (stops, board, alight) in pattern_layout.items():
+            runs = sorted(patterns[key], key=lambda run: (run[1][0], run[2]))
+            for group in _fifo_groups(runs):
+                arrivals = np.array([run[0] for run in group], dtype=np.int64).T  # posiciones × trips
+                departures = np.array([run[1] for run in group], dtype=np.int64).T
+                positions = pattern_offsets[-1] + np.arange(len(stops), dtype=np.int64)[:, None]
+                pattern_stops.append(stops)
+                pattern_board.append(board)
+                pattern_alight.append(alight)
+                pattern_trips.append([run[2] for run in group])
+                arrival_blocks.append(arrivals.ravel())
+                departure_blocks.append(departures.ravel())
+                key_blocks.append((departures + positions * KEY_STRIDE).ravel())
+                pattern_offsets.append(pattern_offsets[-1] + len(stops))
+                trip_offsets.append(trip_offsets[-1] + len(group))
+                time_offsets.append(time_offsets[-1] + arrivals.size)
+
+        n_stops = len(stop_ids)
+        flat_stops = np.concatenate(pattern_stops).astype(np.int32) if pattern_stops else np.empty(0, np.int32)
+        flat_departures = np.concatenate(departure_blocks) if departure_blocks else np.empty(0, np.int64)
+        if len(flat_departures) and max(flat_departures.max(), np.concatenate(arrival_blocks).max()) >= KEY_STRIDE:
+            raise ValueError(f"{feed_dir}: tiempos de stop_times fuera de rango (>= {KEY_STRIDE} s)")
+
+        # Parada -> (patrón, posición)
+        pattern_offsets = np.array(pattern_offsets, dtype=np.int64)
+        entry_pattern = np.repeat(np.arange(len(pattern_offsets) - 1, dtype=np.int32), np.diff(pattern_offsets))
+        entry_position = (np.arange(len(flat_stops)) - pattern_offsets[entry_pattern]).astype(np.int32)
+        stop_pattern_offsets, stop_patterns, stop_positions = _csr(flat_stops, n_stops, entry_pattern, entry_position)
+
+        # Transbordos a pie (transfers.txt, min_transfer_time); sin él solo en la misma parada
+        transfer_from, transfer_to, transfer_secs = [], [], []
+        if (feed_dir / 'transfers.txt').exists():
+            for row in _read_rows(feed_dir / 'transfers.txt'):
+                a, b = stop_index.get(row['from_stop_id']), stop_index.get(row['to_stop_id'])
+                if a is None or b is None or a == b or row.get('transfer_type', '0').strip() == '3':
+                    continue
+                transfer_from.append(a)
+                transfer_to.append(b)
+                transfer_secs.append(int(float(row.get('min_transfer_time') or 0)))
+        transfer_offsets, transfer_to, transfer_secs = _csr(
+            np.array(transfer_from, dtype=np.int64), n_stops,
+            np.array(transfer_to, dtype=np.int32), np.array(transfer_secs, dtype=np.int64)
+        )
+
+        # Estación -> andenes
+        station_index = {station_id: i for i, station_id in enumerate(station_ids)}
+        children = [row for row in stop_rows
+                    if row['stop_id'] in stop_index and row.get('parent_station') in station_index]
+        station_offsets, station_children = _csr(
+            np.array([station_index[row['parent_station']] for row in children], dtype=np.int64), len(station_ids),
+            np.array([stop_index[row['stop_id']] for row in children], dtype=np.int64)
+        )
+
+        return cls(
+            stop_ids, trip_ids, route_ids, station_ids,
+            trip_routes=np.array(trip_routes, dtype=np.int32),
+            pattern_offsets=pattern_offsets,
+            pattern_stops=flat_stops,
+            pattern_board=np.concatenate(pattern_board) if pattern_board else np.empty(0, bool),
+            pattern_alight=np.concatenate(pattern_alight) if pattern_alight else np.empty(0, bool),
+            pattern_trip_offsets=np.array(trip_offsets, dtype=np.int64),
+            pattern_trips=np.array([t for trips in pattern_trips for t in trips], dtype=np.int32),
+            pattern_time_offsets=np.array(time_offsets, dtype=np.int64),
+            arrivals=np.concatenate(arrival_blocks) if arrival_blocks else np.empty(0, np.int64),
+            departures=flat_departures,
+            departure_keys=np.concatenate(key_blocks) if key_blocks else np.empty(0, np.int64),
+            stop_pattern_offsets=stop_pattern_offsets,
+            stop_patterns=stop_patterns,
+            stop_positions=stop_positions,
+            transfer_offsets=transfer_offsets,
+            transfer_to=transfer_to,
+            transfer_secs=transfer_secs,
+            station_offsets=station_offsets,
+            station_children=station_children
+        )
+
+    @classmethod
+    def open(cls, path):
+        arrays, meta = read_bundle(path)
+        if meta.get('version') != CACHE_VERSION:
+            raise ValueError(f"{path}: versión de caché no soportada")
+        return cls(meta['stop_ids'], meta['trip_ids'], meta['route_ids'], meta['station_ids'], **arrays)
+
+    def save(self, path, stamps=None):
+        write_bundle(path, {name: getattr(self, name) for name in self.ARRAYS}, meta={
+            'version': CACHE_VERSION,
+            'stamps': stamps or {},
+            'stop_ids': self.stop_ids,
+            'trip_ids': self.trip_ids,
+            'route_ids': self.route_ids,
+            'station_ids': self.station_ids
+        })
+        return self
+
+    @property
+    def n_patterns(self):
+        return len(self.pattern_offsets) - 1
+
+    def stops_of(self, stop_id):
+        """Índices de la parada, o de los andenes si stop_id es una estación"""
+        station = self.station_index.get(stop_id)
+        if station is not None:
+            return self.station_children[self.station_offsets[station]:self.station_offsets[station + 1]]
+        s = self.stop_index.get(stop_id)
+        if s is None:
+            raise KeyError(f"Parada desconocida: {stop_id}")
+        return np.array([s], dtype=np.int64)
+
+    def _origins(self, origins, departure):
+        """origins: stop_id, lista de stop_ids o dict stop_id -> segundos hasta la parada (o estación)"""
+        if isinstance(origins, str):
+            origins = {origins: 0}
+        elif not isinstance(origins, dict):
+            origins = {stop_id: 0 for stop_id in origins}
+        stops, times = [], []
+        for stop_id, offset in origins.items():
+            platforms = self.stops_of(stop_id)
+            stops.append(platforms)
+            times.append(np.full(len(platforms), departure + int(offset), dtype=np.int64))
+        if not stops:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(stops), np.concatenate(times)
+
+    def route(self, origins, departure, target=None, max_transfers=DEFAULT_MAX_TRANSFERS):
+        """
+        Llegadas más tempranas saliendo de origins a la hora departure
+
+        Args:
+            origins: stop_id, lista de stop_ids o dict stop_id -> segundos de acceso
+                (una estación equivale a todos sus andenes)
+            departure: segundos desde el inicio del día de servicio o 'HH:MM:SS'
+            target: stop_id o estación destino opcional (poda las llegadas más tardías)
+            max_transfers: transbordos máximos (rondas = max_transfers + 1)
+        Returns:
+            RaptorResult
+        """
+        if isinstance(departure, str):
+            departure = parse_gtfs_time(departure)
+        n_stops = len(self.stop_ids)
+        rounds = max_transfers + 2
+        arrivals = np.full((rounds, n_stops), UNREACHED, dtype=np.int64)
+        transit_arrivals = np.full((rounds, n_stops), UNREACHED, dtype=np.int64)
+        walk_arrivals = np.full((rounds, n_stops), UNREACHED, dtype=np.int64)
+        kind = np.zeros((rounds, n_stops), dtype=np.int8)
+        pattern = np.full((rounds, n_stops), -1, dtype=np.int32)
+        trip = np.full((rounds, n_stops), -1, dtype=np.int32)
+        source = np.full((rounds, n_stops), -1, dtype=np.int32)
+        walk_edge = np.full((rounds, n_stops), -1, dtype=np.int32)
+        walk_source = np.full((rounds, n_stops), -1, dtype=np.int32)
+        best = np.full(n_stops, UNREACHED, dtype=np.int64)
+        best_transit = np.full(n_stops, UNREACHED, dtype=np.int64)
+        target_index = None if target is None else self.stops_of(target)
+
+        stops, times = self._origins(origins, departure)
+        np.minimum.at(arrivals[0], stops, times)
+        transit_arrivals[0] = best_transit[:] = best[:] = arrivals[0]
+        kind[0, stops] = ORIGIN
+        origin = np.zeros(n_stops, dtype=bool)
+        origin[stops] = True
+        self._relax_transfers(0, origin, arrivals, transit_arrivals, walk_arrivals, best, walk_edge, walk_source,
+                              target_index)
+        marked = arrivals[0] < UNREACHED
+
+        for k in range(1, rounds):
+            arrivals[k] = arrivals[k - 1]
+            transit = self._scan_patterns(marked, k, arrivals, transit_arrivals, best, best_transit, kind, pattern,
+                                          trip, source, target_index)
+            self._relax_transfers(k, transit, arrivals, transit_arrivals, walk_arrivals, best, walk_edge,
+                                  walk_source, target_index)
+            # En la ronda siguiente se sube desde las paradas con mejor llegada
+            marked = arrivals[k] < arrivals[k - 1]
+            if not marked.any():
+                break
+        return RaptorResult(self, departure, arrivals, transit_arrivals, walk_arrivals, kind, pattern, trip, source,
+                            walk_edge, walk_source)
+
+    def _scan_patterns(self, marked, k, arrivals, transit_arrivals, best, best_transit, kind, pattern, trip, source,
+                       target):
+        """
+        Ronda k: recorre, desde su primera parada marcada, todos los patrones
+        que pasan por paradas marcadas; devuelve la máscara de paradas con
+        nueva etiqueta en bus (la llegada en bus más temprana hasta ahora)
+        """
+        improved = np.zeros(len(best), dtype=bool)
+
+        # Primera posición marcada de cada patrón tocado
+        stops = np.flatnonzero(marked)
+        entries = _expand(self.stop_pattern_offsets[stops], self.stop_pattern_offsets[stops + 1])
+        first = np.full(self.n_patterns, np.iinfo(np.int32).max, dtype=np.int64)
+        np.minimum.at(first, self.stop_patterns[entries], self.stop_positions[entries])
+        patterns = np.flatnonzero(first < np.iinfo(np.int32).max)
+        if not len(patterns):
+            return improved
+
+        # Posiciones globales a recorrer (segmento = patrón)
+        seg_start = self.pattern_offsets[patterns] + first[patterns]
+        seg_length = self.pattern_offsets[patterns + 1] - seg_start
+        gpos = _expand(seg_start, seg_start + seg_length)
+        segment = np.repeat(np.arange(len(patterns)), seg_length)
+        p = patterns[segment]
+        position = gpos - self.pattern_offsets[p]
+        n_trips = (self.pattern_trip_offsets[p + 1] - self.pattern_trip_offsets[p]).astype(np.int64)
+        column = self.pattern_time_offsets[p] + position * n_trips
+        stop = self.pattern_stops[gpos]
+
+        # Primer trip abordable en cada posición (n_trips = ninguno)
+        ready = arrivals[k - 1, stop]
+        boardable = self.pattern_board[gpos] & (ready < UNREACHED)
+        first_trip = n_trips.copy()
+        first_trip[boardable] = np.searchsorted(self.departure_keys,
+                                                gpos[boardable] * KEY_STRIDE + ready[boardable]) - column[boardable]
+
+        # Trip en uso al llegar a cada posición: mínimo acumulado por segmento
+        # (restar segment · SEGMENT_SHIFT hace que cada segmento arranque de cero)
+        shift = segment * SEGMENT_SHIFT
+        riding_min = np.minimum.accumulate(first_trip - shift) + shift
+        boarded_at = np.maximum.accumulate(np.where(first_trip == riding_min, gpos, -1))
+        seg_first = np.r_[True, segment[1:] != segment[:-1]]
+        riding = np.where(seg_first, n_trips, np.r_[0, riding_min[:-1]])
+        boarded_at = np.r_[-1, boarded_at[:-1]] - self.pattern_offsets[p]
+
+        can_alight = self.pattern_alight[gpos] & (riding < n_trips)
+        candidate = np.full(len(gpos), UNREACHED, dtype=np.int64)
+        candidate[can_alight] = self.arrivals[column[can_alight] + riding[can_alight]]
+        bound = UNREACHED if target is None else best[target].min()
+        # Contra la mejor llegada en bus, no contra best: de una llegada en bus
+        # posterior a una caminata todavía pueden salir otras caminatas
+        better = np.flatnonzero(candidate < np.minimum(best_transit[stop], bound))
+        if not len(better):
+            return improved
+
+        # Una parada alcanzada por varios patrones (o repetida en uno): gana la llegada mínima
+        better = better[np.argsort(candidate[better], kind='stable')]
+        _, winner = np.unique(stop[better], return_index=True)
+        better = better[winner]
+        s = stop[better]
+        best_transit[s] = transit_arrivals[k, s] = candidate[better]
+        arrivals[k, s] = np.minimum(arrivals[k, s], candidate[better])
+        best[s] = np.minimum(best[s], candidate[better])
+        kind[k, s] = TRANSIT
+        pattern[k, s] = p[better]
+        trip[k, s] = riding[better]
+        source[k, s] = boarded_at[better]
+        improved[s] = True
+        return improved
+
+    def _relax_transfers(self, k, from_mask, arrivals, transit_arrivals, walk_arrivals, best, walk_edge, walk_source,
+                         target):
+        """
+        Caminatas desde las paradas de from_mask (un solo tramo a pie, desde su
+        etiqueta en bus u origen de la ronda k); devuelve las mejoradas
+        """
+        improved = np.zeros(len(best), dtype=bool)
+        stops = np.flatnonzero(from_mask)
+        starts, ends = self.transfer_offsets[stops], self.transfer_offsets[stops + 1]
+        edges = _expand(starts, ends)
+        if not len(edges):
+            return improved
+        origin = np.repeat(stops, ends - starts)
+        to = self.transfer_to[edges]
+        # Desde la llegada en bus (u origen), aunque otra caminata de esta
+        # misma ronda mejore después la parada de salida
+        candidate = transit_arrivals[k, origin] + self.transfer_secs[edges]
+        bound = UNREACHED if target is None else best[target].min()
+        better = np.flatnonzero(candidate < np.minimum(best[to], bound))
+        if not len(better):
+            return improved
+
+        # Por destino, la caminata que llega antes
+        better = better[np.argsort(candidate[better], kind='stable')]
+        _, winner = np.unique(to[better], return_index=True)
+        better = better[winner]
+        s = to[better]
+        best[s] = arrivals[k, s] = walk_arrivals[k, s] = candidate[better]
+        walk_edge[k, s] = edges[better]
+        walk_source[k, s] = origin[better]
+        improved[s] = True
+        return improved
+
+def default_cache_file(feed_dir, cache_dir=None):
+    return Path(cache_dir or default_cache_dir()) / f"raptor_{Path(feed_dir).resolve().name}.bin"
+
+def load_raptor(feed_dir, cache_dir=None):
+    """
+    Timetable compilado de feed_dir, desde cache/raptor_<dir>.bin si los
+    archivos fuente no cambiaron (tamaño y mtime); si no, compila y guarda
+    """
+    feed_dir = Path(feed_dir)
+    cache_file = default_cache_file(feed_dir, cache_dir)
+    stamps = _source_stamps(feed_dir)
+    if cache_file.exists():
+        try:
+            meta = read_meta(cache_file)
+        except (OSError, ValueError):
+            meta = None
+        if meta and meta.get('version') == CACHE_VERSION and meta.get('stamps') == stamps:
+            return RaptorTimetable.open(cache_file)
+    return RaptorTimetable.compile(feed_dir).save(cache_file, stamps)
+
+def describe_journey(legs):
+    lines = []
+    for leg in legs:
+        span = f"{format_gtfs_time(leg['departure'])} → {format_gtfs_time(leg['arrival'])}"
+        if leg['mode'] == 'walk':
+            lines.append(f"   🚶 {span}  {leg['from_stop']} → {leg['to_stop']}")
+        else:
+            lines.append(f"   🚌 {span}  {leg['route_id']} ({leg['trip_id']}): {leg['from_stop']} → {leg['to_stop']}")
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultas RAPTOR de llegada más temprana sobre el feed GTFS")
+    parser.add_argument('--feed', type=Path, default=Path(__file__).parent / 'gtfs_feed',
+                        help="Directorio GTFS (default: gtfs_feed/)")
+    parser.add_argument('--from', dest='origin', help="stop_id (o estación) de origen")
+    parser.add_argument('--to', dest='target', help="stop_id (o estación) de destino")
+    parser.add_argument('--at', default='06:00:00', help="Hora de salida HH:MM:SS (default: 06:00:00)")
+    parser.add_argument('--transfers', type=int, default=DEFAULT_MAX_TRANSFERS,
+                        help=f"Transbordos máximos (default: {DEFAULT_MAX_TRANSFERS})")
+    parser.add_argument('--benchmark', type=int, metavar='N', help="Medir N consultas origen-destino aleatorias")
+    parser.add_argument('--rebuild', action='store_true', help="Recompilar ignorando el caché")
+    add_profile_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args, 'raptor')
+
+    start = time.perf_counter()
+    with PROFILER.stage('compile'):
+        if args.rebuild:
+            cache_file = default_cache_file(args.feed)
+            timetable = RaptorTimetable.compile(args.feed).save(cache_file, _source_stamps(args.feed))
+        else:
+            timetable = load_raptor(args.feed)
+    print(f"📁 {args.feed.name}: {len(timetable.stop_ids)} paradas, {len(timetable.trip_ids)} trips, "
+          f"{timetable.n_patterns} patrones, {len(timetable.transfer_to)} transbordos a pie, "
+          f"{len(timetable.station_ids)} estaciones "
+          f"({(time.perf_counter() - start) * 1000:.0f} ms)")
+
+    if args.origin:
+        with PROFILER.stage('query'):
+            start = time.perf_counter()
+            result = timetable.route(args.origin, args.at, target=args.target, max_transfers=args.transfers)
+            elapsed = (time.perf_counter() - start) * 1000
+        if args.target:
+            legs = result.journey(args.target)
+            if legs is None:
+                print(f"\n❌ {args.target} no se alcanza desde {args.origin} con {args.transfers} transbordos")
+            else:
+                print(f"\n🧭 {args.origin} → {args.target}: llegada {format_gtfs_time(result.arrival(args.target))} "
+                      f"({elapsed:.1f} ms)")
+                print(describe_journey(legs))
+        else:
+            reached = int((result.earliest_arrivals() < UNREACHED).sum())
+            print(f"\n🧭 {reached} paradas alcanzables desde {args.origin} ({elapsed:.1f} ms)")
+
+    if args.benchmark:
+        rng = np.random.default_rng(0)
+        served = np.flatnonzero(np.diff(timetable.stop_pattern_offsets))
+        pairs = rng.choice(served, size=(args.benchmark, 2))
+        depart = parse_gtfs_time(args.at)
+        with PROFILER.stage('benchmark'):
+            start = time.perf_counter()
+            reached = 0
+            for a, b in pairs.tolist():
+                result = timetable.route(timetable.stop_ids[a], depart, target=timetable.stop_ids[b],
+                                         max_transfers=args.transfers)
+                reached += result.arrival(timetable.stop_ids[b]) is not None
+            elapsed = time.perf_counter() - start
+        print(f"\n⏱️  {args.benchmark} consultas en {elapsed:.2f} s "
+              f"({elapsed / args.benchmark * 1000:.2f} ms/consulta, {reached} con itinerario)")
+
+    print()
+    finish_profile()
+
+if __name__ == "__main__":
+    main()
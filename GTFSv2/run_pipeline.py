@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Ejecuta todas las etapas de GTFSv2 en un solo proceso sobre un Feed en memoria:
+stop_ids → asignación de paradas → stop_times → corrección de rutas → índice → transbordos → estaciones
+→ validación (validate_feed.py; con errores el pipeline termina con código 1 y no deja el zip)
+Solo escribe los archivos finales (gtfs_feed/*.txt, o el zip con --zip,
+stops_to_trips_index.json y stops_to_trips.bin); los intermedios de los scripts por etapa se escriben
+con --write-intermediate.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from assign_stops_to_trips import SIMPLIFY_TOLERANCE
+from cluster_stations import DEFAULT_STATION_RADIUS
+from feed import SERVICE_MODES, Feed
+from generate_transfers import DEFAULT_RADIUS
+from instrumentation import PROFILER, add_profile_args, configure_from_args, finish_profile
+from service_expansion import HeadwayPlan
+from stops_trips_csr import default_index_path
+from validate_feed import print_report, validate_feed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Genera el feed GTFS completo en un solo proceso")
+    parser.add_argument('--stops-geojson', type=Path,
+                        help="Generar los stop_ids desde este GeoJSON de paraderos "
+                             "(default: usar stops_with_ids_clean.json)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Procesos para la asignación por trip (default: 1, serial)")
+    parser.add_argument('--speed', type=float, default=20,
+                        help="Velocidad en km/h para stop_times fuera de las franjas del perfil (default: 20)")
+    parser.add_argument('--speed-profile', type=Path,
+                        help="CSV de velocidades por franja horaria (default: speed_profile.csv si existe)")
+    parser.add_argument('--full', action='store_true',
+                        help="Ignorar el manifiesto de asignación y recalcular todos los trips")
+    parser.add_argument('--simplify-tolerance', type=float, default=SIMPLIFY_TOLERANCE,
+                        help="Filtrar las paradas candidatas con las shapes simplificadas (Douglas-Peucker) "
+                             f"con esta tolerancia en metros; mismo resultado (default: {SIMPLIFY_TOLERANCE:.0f}, "
+                             f"0 = sin filtro)")
+    parser.add_argument('--zip', nargs='?', type=Path, const=Path(__file__).parent / 'gtfs_trujillo.zip',
+                        help="Escribir el feed (con shapes.txt) directo a un zip en vez de gtfs_feed/*.txt "
+                             "(default: gtfs_trujillo.zip)")
+    parser.add_argument('--service', choices=SERVICE_MODES,
+                        help="Expandir el servicio con headways por ruta: frequencies.txt o una "
+                             "fila de trips/stop_times por salida (default: una salida por trip)")
+    parser.add_argument('--headways', type=Path,
+                        help="CSV route_id,start_time,end_time,headway_secs para --service "
+                             "(default: headways.csv)")
+    parser.add_argument('--transfer-radius', type=float, default=DEFAULT_RADIUS,
+                        help=f"Radio de caminata en metros para transfers.txt; 0 = sin transfers.txt "
+                             f"(default: {DEFAULT_RADIUS:.0f})")
+    parser.add_argument('--station-radius', type=float, default=DEFAULT_STATION_RADIUS,
+                        help=f"Distancia en metros para agrupar andenes en estaciones (parent_station); "
+                             f"0 = sin estaciones (default: {DEFAULT_STATION_RADIUS:.0f})")
+    parser.add_argument('--no-validate', action='store_true',
+                        help="No validar el feed escrito (validate_feed.py) antes de terminar")
+    parser.add_argument('--write-intermediate', action='store_true',
+                        help="Escribir también stops_with_ids*.json y trip_sequences.bin")
+    add_profile_args(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    configure_from_args(args, 'run_pipeline')
+    base_path = Path(__file__).parent
+    gtfs_dir = base_path.parent / 'GTFS/out/trujillo/gtfs'
+    output_dir = base_path / 'gtfs_feed'
+
+    print("=" * 80)
+    print("🚌 PIPELINE GTFSv2 (EN MEMORIA)")
+    print("=" * 80)
+
+    timings = []
+
+    def stage(name, func, *func_args, **func_kwargs):
+        print(f"\n▶ {name}...")
+        start = time.perf_counter()
+        with PROFILER.stage(func.__name__):
+            result = func(*func_args, **func_kwargs)
+        timings.append((name, time.perf_counter() - start))
+        return result
+
+    feed = stage("Carga de paradas, trips, rutas y shapes", Feed.from_files, gtfs_dir,
+                 stops_file=base_path / 'stops_with_ids_clean.json',
+                 stops_geojson=args.stops_geojson)
+    print(f"   ✅ {len(feed.stops)} paradas, {len(feed.trips)} trips, {len(feed.routes)} rutas, {len(feed.shapes)} shapes")
+
+    result = stage("Asignación de paradas a trips", feed.assign_stops, workers=args.workers, full=args.full,
+                   simplify_tolerance=args.simplify_tolerance)
+    if not args.zip:
+        stage("Cálculo de stop_times", feed.build_stop_times, avg_speed_kmh=args.speed,
+              speed_profile=args.speed_profile)
+    stage("Corrección de route_ids duplicados", feed.dedupe_routes)
+    if args.service:
+        plan = HeadwayPlan.load(args.headways)
+        feed.plan_service(plan, args.service)
+        print(f"\n▶ Servicio por headways ({args.service}): {plan.total_trips(feed.trips)} salidas")
+    stage("Índice paradas → trips", feed.build_stops_to_trips_index)
+    if args.transfer_radius > 0:
+        transfers = stage("Transbordos a pie (transfers.txt)", feed.build_transfers, args.transfer_radius)
+        print(f"   ✅ {len(transfers)} transbordos (radio {args.transfer_radius:.0f} m)")
+    if args.station_radius > 0:
+        stations = stage("Agrupación de paradas en estaciones", feed.build_stations, args.station_radius)
+        print(f"   ✅ {len(stations)} estaciones con {len(stations.parents)} andenes")
+
+    if args.zip:
+        # stop_times se genera mientras se escribe el zip (memoria acotada)
+        tables = stage(f"Cálculo de stop_times y escritura de {args.zip.name}", feed.write_gtfs_zip,
+                       args.zip, output_dir, avg_speed_kmh=args.speed, speed_profile=args.speed_profile)
+        total_stop_times = tables['stop_times.txt']
+    else:
+        total_stop_times = stage("Escritura de gtfs_feed/", feed.write_gtfs, output_dir)
+    if not args.no_validate:
+        report = stage("Validación del feed", validate_feed, args.zip or output_dir)
+        print_report(report)
+        if report.errors:
+            if args.zip:
+                args.zip.unlink()
+            print(f"\n❌ Feed inválido: {len(report.errors)} errores (python3 validate_feed.py para el detalle)")
+            sys.exit(1)
+    stage("Escritura de stops_to_trips_index.json", feed.write_stops_to_trips_index,
+          base_path / 'stops_to_trips_index.json')
+    stage("Escritura de stops_to_trips.bin", feed.write_stop_trip_csr, default_index_path(base_path),
+          None if args.zip else output_dir)
+    if args.write_intermediate:
+        stage("Escritura de intermedios", feed.write_intermediate, base_path)
+
+    print("\n" + "=" * 80)
+    print("✅ PIPELINE COMPLETADO")
+    print("=" * 80)
+    print(f"\n📊 Resumen:")
+    print(f"   • Trips con secuencia: {len(feed.sequences)} ({len(result['failed_trips'])} fallidos)")
+    print(f"   • Paradas: {len(feed.stops)} ({feed.synthetic_stops} sintéticas)")
+    print(f"   • stop_times: {total_stop_times}")
+    print(f"   • Rutas: {len(feed.routes)}")
+    print(f"\n⏱️  Tiempo por etapa:")
+    for name, seconds in timings:
+        print(f"   • {name}: {seconds:.2f} s")
+    print(f"   • Total: {sum(seconds for _, seconds in timings):.2f} s")
+
+    finish_profile()
+
+if __name__ == "__main__":
+    main()
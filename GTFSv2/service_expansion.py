@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Expansión del servicio por headways
+Cada trip de GTFSv2 tiene una sola salida (06:00). Con ventanas de headway por
+ruta (headways.csv: route_id, start_time, end_time, headway_secs; '*' aplica a
+las rutas sin ventana propia) el servicio se expande de dos formas:
+
+- frequencies: filas compactas de frequencies.txt (exact_times=1); stop_times
+  queda como plantilla de tiempos relativos
+- expand: cada trip se clona en todas sus salidas; con el TripTimetable del
+  pipeline cada salida se recalcula con las franjas de speed_model (la hora
+  pico alarga el recorrido), y desde un stop_times.txt ya escrito se suma cada
+  salida a los tiempos relativos del trip. El texto CSV de todas las salidas
+  de un trip se arma en lote, en streaming y sin dicts por fila
+
+Las salidas de una ventana son start_time + k·headway_secs mientras sean
+menores que end_time (misma semántica que frequencies.txt con exact_times=1).
+"""
+
+import argparse
+import csv
+import shutil
+from itertools import groupby
+from pathlib import Path
+
+import numpy as np
+
+from gtfs_time import TimeTable, format_gtfs_time, parse_gtfs_time
+from gtfs_writer import TextBlocks, csv_line, write_table_file
+from instrumentation import PROFILER, add_profile_args, configure_from_args, finish_profile
+from trip_store import TripSequenceStore
+
+HEADWAYS_FIELDNAMES = ['route_id', 'start_time', 'end_time', 'headway_secs']
+FREQUENCIES_FIELDNAMES = ['trip_id', 'start_time', 'end_time', 'headway_secs', 'exact_times']
+ALL_ROUTES = '*'
+
+# Servicio del feed v1 (GTFS/out/gtfs/frequencies.txt): cada 5 min de 05:00 a 23:00
+DEFAULT_HEADWAYS = [
+    {'route_id': ALL_ROUTES, 'start_time': '05:00:00', 'end_time': '23:00:00', 'headway_secs': '300'}
+]
+
+def default_headways_file():
+    return Path(__file__).parent / 'headways.csv'
+
+class HeadwayPlan:
+    """Ventanas de headway por route_id (con ventana por defecto '*')"""
+
+    def __init__(self, headway_rows):
+        self.windows = {}
+        for row in headway_rows:
+            start = parse_gtfs_time(row['start_time'])
+            end = parse_gtfs_time(row['end_time'])
+            headway = int(row['headway_secs'])
+            if headway <= 0:
+                raise ValueError(f"headway_secs debe ser positivo (ruta {row['route_id']}: {headway})")
+            if end <= start:
+                raise ValueError(f"end_time debe ser mayor que start_time (ruta {row['route_id']})")
+            self.windows.setdefault(row['route_id'], []).append((start, end, headway))
+        for windows in self.windows.values():
+            windows.sort()
+        self._departures = {}
+
+    @classmethod
+    def from_csv(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            missing = [name for name in HEADWAYS_FIELDNAMES if name not in (reader.fieldnames or [])]
+            if missing:
+                raise ValueError(f"{path}: faltan columnas {', '.join(missing)}")
+            return cls(reader)
+
+    @classmethod
+    def load(cls, path=None):
+        """headways.csv indicado, o el de GTFSv2/ si existe, o DEFAULT_HEADWAYS"""
+        if path is None and default_headways_file().exists():
+            path = default_headways_file()
+        return cls.from_csv(path) if path is not None else cls(DEFAULT_HEADWAYS)
+
+    def windows_for(self, route_id):
+        return self.windows.get(route_id, self.windows.get(ALL_ROUTES, []))
+
+    def departures(self, route_id):
+        """Salidas (segundos, ordenadas) de la ruta en todas sus ventanas"""
+        departures = self._departures.get(route_id)
+        if departures is None:
+            windows = self.windows_for(route_id)
+            departures = np.unique(np.concatenate(
+                [np.arange(start, end, headway, dtype=np.int64) for start, end, headway in windows]
+            )) if windows else np.empty(0, dtype=np.int64)
+            self._departures[route_id] = departures
+        return departures
+
+    def frequency_rows(self, trips):
+        """Filas de frequencies.txt (una por trip y ventana)"""
+        for trip in trips:
+            for start, end, headway in self.windows_for(trip['route_id']):
+                yield (trip['trip_id'], format_gtfs_time(start), format_gtfs_time(end), headway, 1)
+
+    def total_trips(self, trips):
+        return sum(len(self.departures(trip['route_id'])) for trip in trips)
+
+def expanded_trip_id(trip_id, departure):
+    """trip_id de una salida: <trip plantilla>_<HHMMSS de salida>"""
+    return f"{trip_id}_{format_gtfs_time(departure).replace(':', '')}"
+
+def expand_sequences(sequences, plan):
+    """
+    TripSequenceStore con un trip por salida (trip_ids de expanded_trip_id):
+    cada salida repite la secuencia de paradas de su trip plantilla
+    """
+    departures = [plan.departures(route_id).tolist() for route_id in sequences.route_ids]
+    counts = np.array([len(trip_departures) for trip_departures in departures], dtype=np.int64)
+    template = np.repeat(np.arange(len(counts)), counts)
+
+    offsets = np.asarray(sequences.offsets, dtype=np.int64)
+    lengths = np.diff(offsets)[template]
+    expanded_offsets = np.zeros(len(template) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=expanded_offsets[1:])
+    # Posición en el store plantilla de cada parada de cada salida
+    positions = np.repeat(offsets[template] - expanded_offsets[:-1], lengths) + np.arange(expanded_offsets[-1])
+
+    distance_along = sequences.distance_along
+    return TripSequenceStore(
+        [expanded_trip_id(trip_id, departure)
+         for trip_id, trip_departures in zip(sequences.trip_ids, departures) for departure in trip_departures],
+        np.repeat(np.array(sequences.route_ids, dtype=object), counts).tolist(),
+        np.repeat(np.array(sequences.shape_ids, dtype=object), counts).tolist(),
+        sequences.stop_ids,
+        expanded_offsets,
+        np.asarray(sequences.stop_index)[positions],
+        None if distance_along is None else np.asarray(distance_along)[positions]
+    )
+
+def iter_expanded_trip_rows(trips, plan, fieldnames):
+    """Filas de trips.txt (listas en el orden de fieldnames) con una fila por salida"""
+    trip_col = fieldnames.index('trip_id')
+    for trip in trips:
+        template = [trip[name] for name in fieldnames]
+        for departure in plan.departures(trip['route_id']).tolist():
+            row = list(template)
+            row[trip_col] = expanded_trip_id(trip['trip_id'], departure)
+            yield row
+
+def expand_stop_times(stop_time_rows, trips_routes, plan, time_table=None):
+    """
+    stop_times de todas las salidas (TextBlocks, un bloque por trip plantilla),
+    a partir de las filas plantilla (listas en el orden de STOP_TIMES_FIELDNAMES,
+    agrupadas por trip como las genera TripTimetable.iter_rows)
+
+    Por trip: tiempos relativos a su primera salida (array de n paradas), matriz
+    salidas × paradas con una suma NumPy, textos por indexación en TimeTable y
+    líneas CSV armadas con sumas sobre arrays de objetos (las columnas fijas de
+    cada parada se codifican una sola vez)
+    """
+    return TextBlocks(_iter_template_blocks(stop_time_rows, trips_routes, plan, time_table or TimeTable()))
+
+def expand_timetable(timetable, plan, time_table=None):
+    """
+    stop_times de todas las salidas (TextBlocks) a partir de un TripTimetable:
+    cada salida se recalcula con el SpeedModel del timetable, así los tiempos
+    de recorrido siguen las franjas horarias de su hora de salida
+    """
+    return TextBlocks(_iter_timetable_blocks(timetable, plan, time_table or TimeTable()))
+
+def _iter_template_blocks(stop_time_rows, trips_routes, plan, time_table):
+    for trip_id, rows in groupby(stop_time_rows, key=lambda row: row[0]):
+        rows = list(rows)
+        departures = plan.departures(trips_routes.get(trip_id))
+        if not len(departures):
+            continue
+        with PROFILER.item('expand_trip', trip_id):
+            arrivals = np.array([parse_gtfs_time(row[1]) for row in rows], dtype=np.int64)
+            departures_at_stop = np.array([parse_gtfs_time(row[2]) for row in rows], dtype=np.int64)
+            origin = arrivals[0]
+            block = _expanded_block(trip_id, departures,
+                                    departures[:, None] + (arrivals - origin),
+                                    departures[:, None] + (departures_at_stop - origin),
+                                    [row[3:] for row in rows], time_table)
+        yield block
+
+def _iter_timetable_blocks(timetable, plan, time_table):
+    fixed = np.column_stack([timetable.stop_sequences, timetable.pickup_type, timetable.drop_off_type]).tolist()
+    for i, trip_id in enumerate(timetable.trip_ids):
+        departures = plan.departures(timetable.route_ids[i])
+        if not len(departures):
+            continue
+        with PROFILER.item('expand_trip', trip_id):
+            part = timetable.trip_slice(i)
+            arrivals, departures_at_stop = timetable.trip_times(i, departures)
+            stop_columns = [[stop_id] + rest for stop_id, rest in zip(timetable.stop_ids[part], fixed[part])]
+            block = _expanded_block(trip_id, departures, arrivals, departures_at_stop, stop_columns, time_table)
+        yield block
+
+def _expanded_block(trip_id, departures, arrivals, departures_at_stop, stop_columns, time_table):
+    """
+    Texto CSV de todas las salidas de un trip
+    arrivals / departures_at_stop: matrices salidas × paradas (segundos)
+    stop_columns: stop_id, stop_sequence, pickup_type, drop_off_type por parada
+    """
+    arrival_text = time_table.format(arrivals)
+    departure_text = time_table.format(departures_at_stop)
+
+    # "<trip_id>," por salida y ",stop_id,stop_sequence,pickup,drop_off\r\n" por parada
+    prefixes = np.array([csv_line([expanded_trip_id(trip_id, d)])[:-2] + ','
+                         for d in departures.tolist()], dtype=object)
+    suffixes = np.array([',' + csv_line(columns) for columns in stop_columns], dtype=object)
+    lines = prefixes[:, None] + arrival_text + ',' + departure_text + suffixes
+    PROFILER.count('expanded_trips', len(departures))
+    PROFILER.count('expanded_stop_times', lines.size)
+    return ''.join(lines.ravel().tolist()), lines.size
+
+def read_stop_time_rows(path):
+    """Filas de stop_times.txt como listas (sin cabecera)"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        fieldnames = next(reader)
+        return fieldnames, list(reader)
+
+def main():
+    parser = argparse.ArgumentParser(description="Expande el servicio con headways por ruta")
+    parser.add_argument('mode', choices=['frequencies', 'expand'],
+                        help="frequencies: escribe frequencies.txt; expand: una fila de trips/stop_times por salida")
+    parser.add_argument('--headways', type=Path,
+                        help="CSV route_id,start_time,end_time,headway_secs (default: headways.csv "
+                             "o 05:00-23:00 cada 300 s)")
+    parser.add_argument('--feed-dir', type=Path, default=Path(__file__).parent / 'gtfs_feed',
+                        help="Feed con los trips plantilla (default: gtfs_feed/)")
+    parser.add_argument('--output-dir', type=Path,
+                        help="Destino (default: --feed-dir para frequencies, gtfs_feed_expanded/ para expand)")
+    add_profile_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args, 'service_expansion')
+
+    feed_dir = args.feed_dir
+    output_dir = args.output_dir or (feed_dir if args.mode == 'frequencies'
+                                     else Path(__file__).parent / 'gtfs_feed_expanded')
+    if args.mode == 'expand' and output_dir.resolve() == feed_dir.resolve():
+        raise SystemExit("❌ expand no puede escribir sobre los trips plantilla: usar otro --output-dir")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    print("=" * 80)
+    print("🕐 EXPANSIÓN DEL SERVICIO POR HEADWAYS")
+    print("=" * 80)
+    print()
+
+    plan = HeadwayPlan.load(args.headways)
+    with open(feed_dir / 'trips.txt', 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        trip_fieldnames = reader.fieldnames
+        trips = list(reader)
+    print(f"   📁 {len(trips)} trips plantilla, {sum(len(w) for w in plan.windows.values())} ventanas de headway")
+
+    if args.mode == 'frequencies':
+        with PROFILER.stage('frequencies'):
+            total = write_table_file(output_dir / 'frequencies.txt', FREQUENCIES_FIELDNAMES,
+                                     plan.frequency_rows(trips))
+        print(f"   ✅ {total} filas en {output_dir / 'frequencies.txt'}")
+    else:
+        with PROFILER.stage('load_stop_times'):
+            stop_time_fieldnames, stop_time_rows = read_stop_time_rows(feed_dir / 'stop_times.txt')
+        trips_routes = {trip['trip_id']: trip['route_id'] for trip in trips}
+
+        with PROFILER.stage('expand_trips'):
+            total_trips = write_table_file(output_dir / 'trips.txt', trip_fieldnames,
+                                           iter_expanded_trip_rows(trips, plan, trip_fieldnames))
+        with PROFILER.stage('expand_stop_times'):
+            total_stop_times = write_table_file(output_dir / 'stop_times.txt', stop_time_fieldnames,
+                                                expand_stop_times(stop_time_rows, trips_routes, plan))
+
+        # El resto de las tablas se copia tal cual (sin frequencies.txt: el servicio ya está expandido)
+        for table in sorted(feed_dir.glob('*.txt')):
+            if table.name not in ('trips.txt', 'stop_times.txt', 'frequencies.txt'):
+                shutil.copyfile(table, output_dir / table.name)
+
+        print(f"   ✅ {total_trips} trips, {total_stop_times} stop_times en {output_dir}")
+
+    print()
+    finish_profile()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Simplificación multirresolución de las shapes (Douglas-Peucker)
+Las shapes de OSM traen todos los vértices de cada way (duplicados, puntos
+colineales). Una sola pasada de Douglas-Peucker, en lote para todas las
+shapes, asigna a cada vértice su importancia: la desviación con la que DP lo
+conserva, acotada por la de los vértices que partieron su tramo antes. Así el
+nivel de tolerancia t es simplemente importance > t (los mismos vértices que
+DP con tolerancia t) y los niveles quedan anidados.
+
+- importance = inf en los extremos de cada shape, 0 en duplicados y colineales
+  entre sus vecinos; el nivel CLEAN_TOLERANCE es la shape limpia
+- todo vértice original queda a menos de t metros de la shape del nivel t
+- los vértices conservados guardan su medida original (metros desde el
+  inicio de la shape): una distancia a lo largo de la shape simplificada se
+  lleva a la original interpolando entre ellos (SimplifiedShape.to_original)
+
+La importancia se guarda en cache/shape_levels.bin (mmap), alineada con los
+arrays del caché de shapes e invalidada por el hash de sus coordenadas.
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from array_bundle import read_bundle, read_meta, write_bundle
+from geometry_kernel import project_points
+from instrumentation import PROFILER, add_profile_args, configure_from_args, finish_profile
+from linear_ref import cumulative_measures
+from manifest import content_hash
+from shape_store import default_cache_dir, load_shape_store
+
+CACHE_VERSION = 1
+# Nivel base: quita duplicados y colineales (holgura numérica en metros)
+CLEAN_TOLERANCE = 0.01
+# Niveles del reporte y del visualizador (metros)
+DEFAULT_TOLERANCES = (CLEAN_TOLERANCE, 1.0, 5.0, 20.0)
+
+def _segment_distance(xy, points, a, b):
+    """Distancia de xy[points] al segmento xy[a]-xy[b] (por elemento)"""
+    ax, ay = xy[a, 0], xy[a, 1]
+    dx, dy = xy[b, 0] - ax, xy[b, 1] - ay
+    px, py = xy[points, 0] - ax, xy[points, 1] - ay
+    len2 = dx * dx + dy * dy
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = np.clip((px * dx + py * dy) / len2, 0.0, 1.0)
+    # Segmento degenerado (shape circular): distancia al punto
+    r = np.where(len2 == 0, 0.0, r)
+    return np.hypot(px - r * dx, py - r * dy)
+
+def douglas_peucker_importance(xy, offsets):
+    """
+    Importancia de cada vértice de las shapes (xy en metros, CSR por offsets)
+
+    Cada ronda parte a la vez todos los tramos pendientes de todas las
+    shapes por su vértice más alejado; su importancia es esa distancia,
+    acotada por la del tramo padre
+    """
+    importance = np.zeros(len(xy), dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    nonempty = np.flatnonzero(np.diff(offsets) > 0)
+    a, b = offsets[nonempty], offsets[nonempty + 1] - 1
+    importance[a] = importance[b] = np.inf
+    cap = np.full(len(a), np.inf)
+
+    while True:
+        inner = b - a - 1
+        pending = inner > 0
+        a, b, cap, inner = a[pending], b[pending], cap[pending], inner[pending]
+        if not len(a):
+            break
+        owner = np.repeat(np.arange(len(a)), inner)
+        first = np.cumsum(inner) - inner
+        points = a[owner] + 1 + (np.arange(inner.sum()) - first[owner])
+        distance = _segment_distance(xy, points, a[owner], b[owner])
+
+        # Vértice más alejado de cada tramo (el primero si hay empate)
+        farthest = np.maximum.reduceat(distance, first)
+        is_max = np.flatnonzero(distance == farthest[owner])
+        split = points[is_max[np.unique(owner[is_max], return_index=True)[1]]]
+        value = np.minimum(farthest, cap)
+        importance[split] = value
+
+        # Un tramo sin desviación no se sigue partiendo (todo queda en 0)
+        grow = farthest > 0
+        a, b = np.concatenate([a[grow], split[grow]]), np.concatenate([split[grow], b[grow]])
+        cap = np.concatenate([value[grow], value[grow]])
+    return importance
+
+class SimplifiedShape:
+    """
+    Shape de un nivel: índices de los vértices conservados (en la shape
+    original), coordenadas (lon, lat) y xy, y sus medidas originales
+    """
+
+    def __init__(self, index, coords, xy, measure):
+        self.index = index
+        self.coords = coords
+        self.xy = xy
+        self.measure = measure
+        self.own_measure = cumulative_measures(xy)
+
+    def __len__(self):
+        return len(self.index)
+
+    def to_original(self, along):
+        """Distancias a lo largo de esta shape -> medidas sobre la shape original"""
+        return np.interp(along, self.own_measure, self.measure)
+
+class ShapeLevels:
+    """Importancia por vértice alineada con un ShapeStore (ver docstring del módulo)"""
+
+    def __init__(self, store, importance):
+        self.store = store
+        self.importance = importance
+
+    @classmethod
+    def build(cls, store):
+        return cls(store, douglas_peucker_importance(store.xy_array, store.offsets))
+
+    @staticmethod
+    def store_key(store):
+        return content_hash(np.asarray(store.offsets), np.asarray(store.xy_array))
+
+    @classmethod
+    def open(cls, store, cache_dir=None):
+        """Niveles de store desde cache/shape_levels.bin, o calculados (y guardados) si no es válido"""
+        cache_file = default_cache_file(cache_dir)
+        key = cls.store_key(store)
+        if cache_file.exists():
+            try:
+                meta = read_meta(cache_file)
+            except (OSError, ValueError):
+                meta = None
+            if meta and meta.get('version') == CACHE_VERSION and meta.get('key') == key:
+                arrays, _ = read_bundle(cache_file)
+                return cls(store, arrays['importance'])
+        return cls.build(store).save(cache_file)
+
+    def save(self, cache_file):
+        write_bundle(cache_file, {'importance': self.importance},
+                     meta={'version': CACHE_VERSION, 'key': self.store_key(self.store)})
+        return self
+
+    def indices(self, shape_id, tolerance):
+        """Índices (en la shape) de los vértices del nivel tolerance, o None si no existe"""
+        span = self.store.span(shape_id)
+        if span is None:
+            return None
+        start, end = span
+        return np.flatnonzero(self.importance[start:end] > tolerance)
+
+    def simplified(self, shape_id, tolerance):
+        """SimplifiedShape del nivel tolerance, o None si la shape no existe"""
+        index = self.indices(shape_id, tolerance)
+        if index is None:
+            return None
+        return SimplifiedShape(index, self.store.coords(shape_id)[index], self.store.coords_xy(shape_id)[index],
+                               self.store.measures(shape_id)[index])
+
+    def level_size(self, tolerance):
+        """Vértices totales del nivel tolerance (todas las shapes)"""
+        return int((self.importance > tolerance).sum())
+
+def default_cache_file(cache_dir=None):
+    return Path(cache_dir or default_cache_dir()) / 'shape_levels.bin'
+
+def load_shape_levels(shapes_file, cache_dir=None):
+    """Atajo: niveles del store de shapes_file con el caché por defecto"""
+    return ShapeLevels.open(load_shape_store(shapes_file), cache_dir)
+
+def max_deviation(levels, tolerance):
+    """Distancia máxima de un vértice original a la shape del nivel (todas las shapes)"""
+    worst = 0.0
+    for shape_id in levels.store.shape_ids:
+        level = levels.simplified(shape_id, tolerance)
+        if level is None or len(level) < 2:
+            continue
+        worst = max(worst, float(project_points(levels.store.coords_xy(shape_id), level.xy)['distance'].max()))
+    return worst
+
+def main():
+    parser = argparse.ArgumentParser(description="Niveles Douglas-Peucker de las shapes (cache/shape_levels.bin)")
+    parser.add_argument('--shapes', type=Path,
+                        default=Path(__file__).parent.parent / 'GTFS/out/trujillo/gtfs/shapes.txt',
+                        help="shapes.txt de origen (default: GTFS/out/trujillo/gtfs/shapes.txt)")
+    parser.add_argument('--tolerances', type=float, nargs='+', default=list(DEFAULT_TOLERANCES),
+                        help="Tolerancias a reportar en metros")
+    parser.add_argument('--check', action='store_true',
+                        help="Verificar la desviación máxima de cada nivel (proyecta todos los vértices)")
+    add_profile_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args, 'shape_simplify')
+
+    print("=" * 80)
+    print("📐 NIVELES DE SIMPLIFICACIÓN DE SHAPES (DOUGLAS-PEUCKER)")
+    print("=" * 80)
+    print()
+
+    with PROFILER.stage('load_shapes'):
+        store = load_shape_store(args.shapes)
+    start = time.perf_counter()
+    with PROFILER.stage('importance'):
+        levels = ShapeLevels.build(store).save(default_cache_file())
+    elapsed = time.perf_counter() - start
+
+    total = len(store.xy_array)
+    print(f"   ✅ {len(store)} shapes, {total} vértices ({elapsed * 1000:.0f} ms)")
+    for tolerance in args.tolerances:
+        size = levels.level_size(tolerance)
+        line = f"   • {tolerance:>6.2f} m: {size:>7} vértices ({size / max(total, 1) * 100:5.1f}%)"
+        if args.check:
+            with PROFILER.stage('check'):
+                line += f", desviación máx. {max_deviation(levels, tolerance):.2f} m"
+        print(line)
+    print(f"\n📁 Caché: {default_cache_file()}")
+    print()
+
+    finish_profile()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Almacén de shapes compartido por todas las etapas de GTFSv2
+Parsea shapes.txt una sola vez y guarda un caché binario (mmap)
+que se invalida cuando cambia el archivo fuente (mtime/tamaño/hash).
+Junto a (lon, lat) guarda las coordenadas proyectadas en metros (UTM 17S) y
+la medida acumulada de cada vértice (referenciación lineal, ver linear_ref).
+"""
+
+import csv
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+from array_bundle import read_bundle, read_meta, write_bundle
+from linear_ref import LinearReference, cumulative_measures
+from projection import EPSG, project_coords
+
+CACHE_VERSION = 3
+
+# Un store por archivo y proceso: evita reabrir el caché en cada trip
+_open_stores = {}
+
+def file_sha1(path, chunk_size=1 << 20):
+    """Hash SHA-1 del contenido de un archivo"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+def default_cache_dir():
+    """cache/ junto a los scripts, o GTFSV2_CACHE_DIR si está definido"""
+    return Path(os.environ.get('GTFSV2_CACHE_DIR') or Path(__file__).parent / 'cache')
+
+class ShapeStore:
+    """
+    Shapes en arrays contiguos: coords (N, 2) en (lon, lat), xy (N, 2) en metros,
+    measure (N,) en metros desde el inicio de cada shape y offsets por shape.
+    La shape i ocupa coords[offsets[i]:offsets[i+1]], ya ordenada por secuencia
+    """
+
+    def __init__(self, shape_ids, offsets, coords, seqs, xy=None, measure=None):
+        self.shape_ids = list(shape_ids)
+        self.offsets = offsets
+        self.coords_array = coords
+        self.seqs = seqs
+        self.xy_array = xy if xy is not None else project_coords(coords)
+        self.measure_array = measure if measure is not None else self._compute_measures()
+        self._index = {sid: i for i, sid in enumerate(self.shape_ids)}
+        self._linear_refs = {}
+
+    def _compute_measures(self):
+        measure = np.zeros(len(self.xy_array), dtype=np.float64)
+        for i in range(len(self.shape_ids)):
+            start, end = self.offsets[i], self.offsets[i + 1]
+            measure[start:end] = cumulative_measures(self.xy_array[start:end])
+        return measure
+
+    @classmethod
+    def from_shapes_txt(cls, shapes_file):
+        """Parsea shapes.txt completo en una sola pasada"""
+        shapes = {}
+        with open(shapes_file, 'r', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                sid = row['shape_id']
+                if sid not in shapes:
+                    shapes[sid] = []
+                shapes[sid].append((
+                    int(row['shape_pt_sequence']),
+                    float(row['shape_pt_lon']),
+                    float(row['shape_pt_lat'])
+                ))
+
+        shape_ids = list(shapes.keys())
+        offsets = np.zeros(len(shape_ids) + 1, dtype=np.int64)
+        total = sum(len(points) for points in shapes.values())
+        coords = np.empty((total, 2), dtype=np.float64)
+        seqs = np.empty(total, dtype=np.int64)
+
+        pos = 0
+        for i, sid in enumerate(shape_ids):
+            # sorted() es estable: mismo orden que la carga original por trip
+            points = sorted(shapes[sid], key=lambda p: p[0])
+            n = len(points)
+            if n:
+                block = np.array(points, dtype=np.float64)
+                coords[pos:pos + n] = block[:, 1:3]
+                seqs[pos:pos + n] = [p[0] for p in points]
+            pos += n
+            offsets[i + 1] = pos
+
+        return cls(shape_ids, offsets, coords, seqs)
+
+    @classmethod
+    def open(cls, shapes_file, cache_dir=None):
+        """
+        Abre el store para shapes_file usando el caché binario si es válido
+        Si el caché no existe o está desactualizado, parsea y lo regenera
+        """
+        shapes_file = Path(shapes_file)
+        key = (str(shapes_file.resolve()), str(cache_dir))
+        if key in _open_stores:
+            store, stamp = _open_stores[key]
+            if stamp == _file_stamp(shapes_file):
+                return store
+
+        cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        cache_file = cache_dir / 'shapes.bin'
+        stamp = _file_stamp(shapes_file)
+
+        store = None
+        if cache_file.exists():
+            try:
+                meta = read_meta(cache_file)
+            except (OSError, ValueError):
+                meta = None
+            if meta and _cache_matches(meta, shapes_file, stamp):
+                arrays, meta = read_bundle(cache_file)
+                store = cls(meta['shape_ids'], arrays['offsets'], arrays['coords'], arrays['seqs'],
+                            arrays['xy'], arrays['measure'])
+
+        if store is None:
+            store = cls.from_shapes_txt(shapes_file)
+            store.save(cache_file, shapes_file, stamp)
+
+        _open_stores[key] = (store, stamp)
+        return store
+
+    def save(self, cache_file, shapes_file, stamp=None):
+        """Guarda el caché binario asociado a shapes_file"""
+        size, mtime_ns = stamp or _file_stamp(shapes_file)
+        write_bundle(cache_file, {
+            'offsets': self.offsets,
+            'coords': self.coords_array,
+            'seqs': self.seqs,
+            'xy': self.xy_array,
+            'measure': self.measure_array
+        }, meta={
+            'version': CACHE_VERSION,
+            'crs': f'EPSG:{EPSG}',
+            'source': str(Path(shapes_file).resolve()),
+            'size': size,
+            'mtime_ns': mtime_ns,
+            'sha1': file_sha1(shapes_file),
+            'shape_ids': self.shape_ids
+        })
+
+    def __len__(self):
+        return len(self.shape_ids)
+
+    def __contains__(self, shape_id):
+        return shape_id in self._index
+
+    def span(self, shape_id):
+        """(inicio, fin) de la shape en los arrays contiguos, o None si no existe"""
+        i = self._index.get(shape_id)
+        if i is None:
+            return None
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def coords(self, shape_id):
+        """Vista (n, 2) de solo lectura en (lon, lat), o None si no existe"""
+        i = self._index.get(shape_id)
+        if i is None:
+            return None
+        return self.coords_array[self.offsets[i]:self.offsets[i + 1]]
+
+    def coords_xy(self, shape_id):
+        """Vista (n, 2) de solo lectura en metros (UTM 17S), o None si no existe"""
+        i = self._index.get(shape_id)
+        if i is None:
+            return None
+        return self.xy_array[self.offsets[i]:self.offsets[i + 1]]
+
+    def measures(self, shape_id):
+        """Vista de la medida acumulada (metros) en cada vértice, o None si no existe"""
+        i = self._index.get(shape_id)
+        if i is None:
+            return None
+        return self.measure_array[self.offsets[i]:self.offsets[i + 1]]
+
+    def linear_ref(self, shape_id):
+        """LinearReference de la shape (una por shape y store), o None si no existe o es vacía"""
+        ref = self._linear_refs.get(shape_id)
+        if ref is None:
+            xy = self.coords_xy(shape_id)
+            if xy is None or len(xy) < 2:
+                return None
+            ref = self._linear_refs[shape_id] = LinearReference(xy, self.measures(shape_id))
+        return ref
+
+    def sequences(self, shape_id):
+        """Vista de los shape_pt_sequence de la shape, o None si no existe"""
+        i = self._index.get(shape_id)
+        if i is None:
+            return None
+        return self.seqs[self.offsets[i]:self.offsets[i + 1]]
+
+    def get(self, shape_id):
+        """Coordenadas como lista [[lon, lat], ...] (formato de load_shape_from_gtfs)"""
+        coords = self.coords(shape_id)
+        if coords is None or len(coords) == 0:
+            return None
+        return coords.tolist()
+
+    def points(self, shape_id):
+        """Puntos como lista de dicts {'lat', 'lon', 'seq'} (formato del visualizador)"""
+        i = self._index.get(shape_id)
+        if i is None:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return [
+            {'lat': lat, 'lon': lon, 'seq': seq}
+            for (lon, lat), seq in zip(self.coords_array[start:end].tolist(), self.seqs[start:end].tolist())
+        ]
+
+def _file_stamp(path):
+    st = Path(path).stat()
+    return st.st_size, st.st_mtime_ns
+
+def _cache_matches(meta, shapes_file, stamp):
+    if meta.get('version') != CACHE_VERSION:
+        return False
+    if meta.get('source') != str(shapes_file.resolve()):
+        return False
+    if meta.get('size') != stamp[0]:
+        return False
+    if meta.get('mtime_ns') == stamp[1]:
+        return True
+    # mtime distinto (p.ej. checkout o copia): confirmar por contenido
+    return meta.get('sha1') == file_sha1(shapes_file)
+
+def load_shape_store(shapes_file):
+    """Atajo para ShapeStore.open con el directorio de caché por defecto"""
+    return ShapeStore.open(shapes_file)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Índice espacial de paradas (grilla uniforme)
+Permite obtener solo las paradas cercanas a una shape en vez de recorrer todas.
+Trabaja en coordenadas proyectadas (metros, UTM 17S).
+"""
+
+import math
+from collections import defaultdict
+
+import numpy as np
+
+from projection import project_point, to_utm
+
+DEFAULT_CELL_SIZE = 200.0  # metros
+
+class StopGrid:
+    """
+    Grilla uniforme sobre las posiciones proyectadas (x, y) de las paradas
+    Los resultados se devuelven en orden de inserción, igual que recorrer el
+    diccionario de paradas original, para no alterar desempates posteriores
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        self.stop_ids = []
+        self.positions = []
+        self._index = {}
+
+    @classmethod
+    def from_stops_dict(cls, stops_dict, cell_size=DEFAULT_CELL_SIZE):
+        """Construye la grilla desde un diccionario stop_id -> datos de parada"""
+        grid = cls(cell_size)
+        stop_ids = list(stops_dict.keys())
+        lons = [stops_dict[stop_id]['stop_lon'] for stop_id in stop_ids]
+        lats = [stops_dict[stop_id]['stop_lat'] for stop_id in stop_ids]
+        # Proyección de todas las paradas en una sola llamada
+        xs, ys = to_utm(lons, lats)
+        for stop_id, x, y in zip(stop_ids, xs.tolist(), ys.tolist()):
+            grid.insert_xy(stop_id, x, y)
+        return grid
+
+    @classmethod
+    def from_stop_table(cls, stops, cell_size=DEFAULT_CELL_SIZE):
+        """Construye la grilla desde un StopTable (en el orden de sus filas)"""
+        grid = cls(cell_size)
+        xs, ys = to_utm(stops.lon, stops.lat)
+        for stop_id, x, y in zip(stops.stop_ids, xs.tolist(), ys.tolist()):
+            grid.insert_xy(stop_id, x, y)
+        return grid
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    def __contains__(self, stop_id):
+        return stop_id in self._index
+
+    def _cell(self, x, y):
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def insert(self, stop_id, lon, lat):
+        """Agrega una parada en (lon, lat), o actualiza su posición si ya existe"""
+        x, y = project_point(lon, lat)
+        self.insert_xy(stop_id, x, y)
+
+    def insert_xy(self, stop_id, x, y):
+        """Agrega una parada ya proyectada (metros)"""
+        idx = self._index.get(stop_id)
+        if idx is not None:
+            old_cell = self._cell(*self.positions[idx])
+            self.cells[old_cell].remove(idx)
+            self.positions[idx] = (x, y)
+        else:
+            idx = len(self.stop_ids)
+            self._index[stop_id] = idx
+            self.stop_ids.append(stop_id)
+            self.positions.append((x, y))
+        self.cells[self._cell(x, y)].append(idx)
+
+    def position(self, stop_id):
+        """Posición proyectada (x, y) de una parada"""
+        return self.positions[self._index[stop_id]]
+
+    def positions_of(self, stop_ids):
+        """Array (m, 2) con las posiciones proyectadas de las paradas dadas"""
+        return np.array([self.positions[self._index[stop_id]] for stop_id in stop_ids], dtype=np.float64).reshape(-1, 2)
+
+    def _collect_bbox(self, minx, miny, maxx, maxy, found):
+        ix0, iy0 = self._cell(minx, miny)
+        ix1, iy1 = self._cell(maxx, maxy)
+        for ix in range(ix0, ix1 + 1):
+            for iy in range(iy0, iy1 + 1):
+                cell = self.cells.get((ix, iy))
+                if cell:
+                    found.update(cell)
+
+    def query_bbox(self, minx, miny, maxx, maxy):
+        """stop_ids dentro de las celdas que tocan el bbox (en orden de inserción)"""
+        found = set()
+        self._collect_bbox(minx, miny, maxx, maxy, found)
+        return [self.stop_ids[i] for i in sorted(found)]
+
+    def query_line(self, coords, margin):
+        """
+        Candidatas a estar a menos de `margin` metros de la polilínea (en metros)
+
+        Se consulta el bbox ampliado de cada segmento (partido en tramos no
+        mayores a una celda), así una ruta larga y diagonal no arrastra
+        todas las paradas de su bbox global
+        """
+        if not self.stop_ids:
+            return []
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        if len(coords) == 1:
+            coords = np.vstack([coords, coords])
+
+        # Partir cada segmento en tramos de largo <= cell_size (vectorizado)
+        a = coords[:-1]
+        b = coords[1:]
+        seg_len = np.hypot(b[:, 0] - a[:, 0], b[:, 1] - a[:, 1])
+        pieces = np.maximum(1, np.ceil(seg_len / self.cell_size)).astype(np.int64)
+        seg_of_piece = np.repeat(np.arange(len(a)), pieces)
+        k = np.arange(len(seg_of_piece)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        n = pieces[seg_of_piece]
+        delta = b[seg_of_piece] - a[seg_of_piece]
+        start = a[seg_of_piece] + delta * (k / n)[:, None]
+        end = a[seg_of_piece] + delta * ((k + 1) / n)[:, None]
+
+        # Rango de celdas del bbox ampliado de cada tramo
+        lo = np.floor((np.minimum(start, end) - margin) / self.cell_size).astype(np.int64)
+        hi = np.floor((np.maximum(start, end) + margin) / self.cell_size).astype(np.int64)
+        span = hi - lo
+        cells = set()
+        for dx in range(int(span[:, 0].max()) + 1):
+            for dy in range(int(span[:, 1].max()) + 1):
+                mask = (span[:, 0] >= dx) & (span[:, 1] >= dy)
+                if mask.any():
+                    cells.update(zip((lo[mask, 0] + dx).tolist(), (lo[mask, 1] + dy).tolist()))
+
+        found = []
+        for cell in cells:
+            members = self.cells.get(cell)
+            if members:
+                found.extend(members)
+        found.sort()
+        return [self.stop_ids[i] for i in found]
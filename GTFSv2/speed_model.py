@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Modelo de velocidades por franja horaria para stop_times
+speed_profile.csv define franjas (start_time, end_time, speed_kmh) globales
+(scope '*') y, opcionalmente, franjas propias de un distrito (scope 'distrito',
+key = distrito de la parada) o de un corredor (scope 'route_id', key = ruta):
+
+    scope,key,start_time,end_time,speed_kmh
+    *,,06:30:00,09:00:00,14
+    *,,17:00:00,20:00:00,13
+    distrito,Trujillo (Base),07:00:00,09:00:00,11
+    route_id,C-01 B,00:00:00,24:00:00,22
+
+Cada tramo (parada i → i+1) usa el corredor de su trip si tiene franjas, si no
+el distrito de la parada de origen, si no las franjas globales; las horas que
+un perfil no cubre caen a las globales y, fuera de ellas, a default_speed_kmh.
+La franja se elige con la hora de salida de la parada de origen (las franjas
+se repiten cada 24 h).
+
+Los tiempos se calculan en segundos (sin truncar por tramo) para todos los
+trips a la vez: un barrido por posición de parada, vectorizado sobre trips.
+"""
+
+import csv
+from pathlib import Path
+
+import numpy as np
+
+from gtfs_time import DAY_SECONDS, parse_gtfs_time
+
+SPEED_PROFILE_FIELDNAMES = ['scope', 'key', 'start_time', 'end_time', 'speed_kmh']
+GLOBAL_SCOPE = '*'
+OVERRIDE_SCOPES = ('distrito', 'route_id')
+GLOBAL_PROFILE = 0
+
+def default_speed_profile_file():
+    return Path(__file__).parent / 'speed_profile.csv'
+
+class SpeedModel:
+    """
+    Velocidades (m/s) en una matriz perfiles × intervalos del día
+    Los intervalos salen de la unión de los bordes de todas las franjas
+    """
+
+    def __init__(self, bands=(), default_speed_kmh=20):
+        if default_speed_kmh <= 0:
+            raise ValueError(f"La velocidad por defecto debe ser positiva ({default_speed_kmh})")
+        self.default_speed_kmh = default_speed_kmh
+
+        by_profile = {(GLOBAL_SCOPE, ''): []}
+        for band in bands:
+            scope = band['scope'].strip()
+            key = band.get('key', '').strip() if scope != GLOBAL_SCOPE else ''
+            if scope != GLOBAL_SCOPE and scope not in OVERRIDE_SCOPES:
+                raise ValueError(f"scope desconocido en el perfil de velocidades: {scope}")
+            start = parse_gtfs_time(band['start_time'])
+            end = parse_gtfs_time(band['end_time'])
+            speed = float(band['speed_kmh'])
+            if not 0 <= start < end <= DAY_SECONDS:
+                raise ValueError(f"Franja inválida {band['start_time']}-{band['end_time']} ({scope} {key})")
+            if speed <= 0:
+                raise ValueError(f"speed_kmh debe ser positiva ({scope} {key}: {speed})")
+            by_profile.setdefault((scope, key), []).append((start, end, speed))
+
+        self.profiles = {name: i for i, name in enumerate(by_profile)}
+        self.edges = np.unique(np.array(
+            [0, DAY_SECONDS] + [edge for bands in by_profile.values() for s, e, _ in bands for edge in (s, e)],
+            dtype=np.int64
+        ))
+
+        # Globales sobre la velocidad por defecto; cada perfil sobre las globales
+        n_intervals = len(self.edges) - 1
+        speeds_kmh = np.full((len(by_profile), n_intervals), float(default_speed_kmh))
+        starts = self.edges[:-1]
+        for name, i in self.profiles.items():
+            if i != GLOBAL_PROFILE:
+                speeds_kmh[i] = speeds_kmh[GLOBAL_PROFILE]
+            for start, end, speed in by_profile[name]:
+                speeds_kmh[i, (starts >= start) & (starts < end)] = speed
+        self.speeds = speeds_kmh / 3.6
+        # True si la velocidad no depende de la hora (ni del perfil)
+        self.is_constant = bool(np.all(self.speeds == self.speeds[0, 0]))
+
+    @classmethod
+    def from_csv(cls, path, default_speed_kmh=20):
+        with open(path, 'r', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            missing = [name for name in SPEED_PROFILE_FIELDNAMES if name not in (reader.fieldnames or [])]
+            if missing:
+                raise ValueError(f"{path}: faltan columnas {', '.join(missing)}")
+            return cls(list(reader), default_speed_kmh)
+
+    @classmethod
+    def load(cls, path=None, default_speed_kmh=20):
+        """speed_profile.csv indicado, o el de GTFSv2/ si existe, o velocidad constante"""
+        if path is None and default_speed_profile_file().exists():
+            path = default_speed_profile_file()
+        if path is None:
+            return cls(default_speed_kmh=default_speed_kmh)
+        return cls.from_csv(path, default_speed_kmh)
+
+    def params(self):
+        """Descripción serializable del modelo (para manifiestos y reportes)"""
+        return {
+            'default_speed_kmh': self.default_speed_kmh,
+            'profiles': [list(name) for name in self.profiles],
+            'edges': self.edges.tolist(),
+            'speeds_kmh': np.round(self.speeds * 3.6, 6).tolist()
+        }
+
+    def hop_profiles(self, route_ids, districts):
+        """
+        Perfil de cada tramo: corredor si la ruta tiene franjas, si no distrito
+        de la parada de origen, si no global
+        route_ids / districts: un valor por parada (array plano)
+        """
+        profiles = np.full(len(districts), GLOBAL_PROFILE, dtype=np.int32)
+        if len(self.profiles) == 1:
+            return profiles
+        by_district = {key: i for (scope, key), i in self.profiles.items() if scope == 'distrito'}
+        by_route = {key: i for (scope, key), i in self.profiles.items() if scope == 'route_id'}
+        for j, (route_id, district) in enumerate(zip(route_ids, districts)):
+            profile = by_route.get(route_id)
+            if profile is None:
+                profile = by_district.get(district, GLOBAL_PROFILE)
+            profiles[j] = profile
+        return profiles
+
+    def speed_at(self, profiles, seconds):
+        """Velocidad (m/s) de cada perfil a la hora indicada (segundos, cualquier día)"""
+        interval = np.searchsorted(self.edges, np.mod(seconds, DAY_SECONDS), side='right') - 1
+        return self.speeds[profiles, interval]
+
+    def schedule(self, offsets, distances, profiles, starts, dwell_secs=0.0):
+        """
+        Llegada y salida (segundos, float) en cada parada de todos los trips
+
+        Args:
+            offsets: CSR de trips (las paradas del trip i son offsets[i]:offsets[i+1])
+            distances: distancia a lo largo de la shape (metros) por parada
+            profiles: perfil del tramo que sale de cada parada (hop_profiles)
+            starts: salida de la primera parada de cada trip (segundos), escalar o array
+            dwell_secs: detención en las paradas intermedias
+
+        Returns:
+            (arrival, departure): arrays planos alineados con distances
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        distances = np.asarray(distances, dtype=np.float64)
+        lengths = np.diff(offsets)
+        arrival = np.empty(len(distances), dtype=np.float64)
+        departure = np.empty(len(distances), dtype=np.float64)
+
+        has_stops = lengths > 0
+        first = offsets[:-1][has_stops]
+        trip_starts = np.broadcast_to(np.asarray(starts, dtype=np.float64), lengths.shape)[has_stops]
+
+        if self.is_constant:
+            # Sin franjas: tiempo acumulado directo, sin barrido
+            trip_of = np.repeat(np.arange(len(first)), lengths[has_stops])
+            position = np.arange(len(distances)) - first[trip_of]
+            hops = np.maximum(np.diff(distances, prepend=0.0), 0.0)
+            hops[first] = 0.0
+            travelled = np.cumsum(hops)
+            travelled -= travelled[first][trip_of]
+            arrival[:] = trip_starts[trip_of] + travelled / self.speeds[0, 0] + np.maximum(position - 1, 0) * dwell_secs
+            departure[:] = arrival + np.where(position > 0, dwell_secs, 0.0)
+            departure[offsets[1:][has_stops] - 1] = arrival[offsets[1:][has_stops] - 1]
+            return arrival, departure
+
+        arrival[first] = trip_starts
+        departure[first] = arrival[first]
+
+        # Barrido por posición k, vectorizado sobre los trips con más de k paradas
+        for k in range(1, int(lengths.max()) if len(lengths) else 0):
+            idx = offsets[:-1][lengths > k] + k
+            prev = idx - 1
+            hop = np.maximum(distances[idx] - distances[prev], 0.0)
+            arrival[idx] = departure[prev] + hop / self.speed_at(profiles[prev], departure[prev])
+            last = lengths[lengths > k] == k + 1
+            departure[idx] = arrival[idx] + np.where(last, 0.0, dwell_secs)
+
+        return arrival, departure
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+"""
+Consultas espaciales sobre la tabla de paradas: radio y k vecinos más cercanos
+Las paradas se proyectan a UTM (metros) y se ordenan por celda de una grilla
+uniforme (CSR: inicio de las paradas de cada celda). Las consultas reciben
+arrays de puntos y se resuelven en lote con NumPy: por cada columna de la
+grilla que toca el círculo, la cuerda del círculo es un rango contiguo de
+celdas (y de paradas) para todos los puntos a la vez; se expanden los pares
+punto-parada y se filtra por distancia exacta. Para radios grandes se usan
+grillas más gruesas (niveles creados al primer uso).
+
+k-NN: cada punto recibe una lista de paradas candidatas que contiene a sus
+k más cercanas, y las k se eligen con una matriz punto × candidata
+(argpartition). Los puntos con k paradas a menos de cell_size usan las de
+ese radio; los demás (lejos de la red) comparten la lista de su celda,
+armada desde la celda LEVEL_FACTOR veces más grande que la contiene. Así un
+punto lejano cuesta lo mismo que uno en la red, sin crecer el radio hasta
+cubrir la ciudad.
+
+    query = StopQuery.from_stops_file('stops_with_ids_final.json')
+    result = query.radius(lonlat, 300)            # RadiusResult (CSR por punto)
+    idx, dist = query.knn(lonlat, k=5)            # (n, k), -1 / inf si faltan
+"""
+
+import argparse
+import math
+import time
+from pathlib import Path
+
+import numpy as np
+
+from projection import project_coords
+from stop_table import StopTable
+
+DEFAULT_CELL_SIZE = 250.0  # metros
+# Grillas más gruesas (×LEVEL_FACTOR por nivel) para radios grandes
+LEVEL_FACTOR = 4
+# k-NN: máximo de pares punto-parada por matriz (y de fuerza bruta)
+CHUNK_PAIRS = 250_000
+
+def _ranges(starts, counts):
+    """Concatenación de arange(start, start + count) para cada par (vectorizado)"""
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+class RadiusResult:
+    """
+    Paradas dentro del radio de cada punto (CSR): las del punto i son
+    indices[offsets[i]:offsets[i+1]] con sus distances (metros), de la más
+    cercana a la más lejana
+    """
+
+    def __init__(self, stop_ids, offsets, indices, distances):
+        self.stop_ids = stop_ids
+        self.offsets = offsets
+        self.indices = indices
+        self.distances = distances
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def stops_of(self, i):
+        """[(stop_id, distancia en metros), ...] del punto i"""
+        part = slice(self.offsets[i], self.offsets[i + 1])
+        return [(self.stop_ids[j], d) for j, d in zip(self.indices[part].tolist(), self.distances[part].tolist())]
+
+class StopQuery:
+    """Grilla CSR sobre las paradas proyectadas (ver docstring del módulo)"""
+
+    def __init__(self, stop_ids, stops_xy, cell_size=DEFAULT_CELL_SIZE):
+        self.stop_ids = list(stop_ids)
+        self.xy = np.asarray(stops_xy, dtype=np.float64).reshape(-1, 2)
+        self.cell_size = float(cell_size)
+
+        if len(self.xy):
+            cells = np.floor(self.xy / self.cell_size).astype(np.int64)
+            self.origin = cells.min(axis=0)
+            self.ny = int(cells[:, 1].max() - self.origin[1]) + 1
+            self.nx = int(cells[:, 0].max() - self.origin[0]) + 1
+            keys = self._keys(cells[:, 0], cells[:, 1])
+        else:
+            self.origin = np.zeros(2, dtype=np.int64)
+            self.nx = self.ny = 0
+            keys = np.empty(0, dtype=np.int64)
+
+        # Paradas ordenadas por celda; las de la celda c son cell_start[c]:cell_start[c+1]
+        self.order = np.argsort(keys, kind='stable')
+        self.cell_start = np.zeros(self.nx * self.ny + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=self.nx * self.ny), out=self.cell_start[1:])
+        self._x = np.ascontiguousarray(self.xy[:, 0])
+        self._y = np.ascontiguousarray(self.xy[:, 1])
+        self.sorted_xy = self.xy[self.order]
+        self._sorted_x = np.ascontiguousarray(self.sorted_xy[:, 0])
+        self._sorted_y = np.ascontiguousarray(self.sorted_xy[:, 1])
+        self._levels = {0: self}
+
+    @classmethod
+    def from_stops_dict(cls, stops_dict, cell_size=DEFAULT_CELL_SIZE):
+        """Desde un diccionario stop_id -> parada (stop_lat, stop_lon)"""
+        stop_ids = list(stops_dict)
+        lonlat = [[stops_dict[s]['stop_lon'], stops_dict[s]['stop_lat']] for s in stop_ids]
+        return cls(stop_ids, project_coords(lonlat), cell_size)
+
+    @classmethod
+    def from_stop_table(cls, stops, rows=None, cell_size=DEFAULT_CELL_SIZE):
+        """Desde un StopTable (solo las filas rows, si se indican)"""
+        stop_ids = stops.stop_ids if rows is None else [stops.stop_ids[row] for row in rows.tolist()]
+        return cls(stop_ids, project_coords(stops.lonlat(rows)), cell_size)
+
+    @classmethod
+    def from_stops_file(cls, path, cell_size=DEFAULT_CELL_SIZE):
+        """Desde stops_with_ids*.json (lista 'stops')"""
+        return cls.from_stop_table(StopTable.from_json(path), cell_size=cell_size)
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    def _keys(self, ix, iy):
+        return (ix - self.origin[0]) * self.ny + (iy - self.origin[1])
+
+    def _points_xy(self, points, projected):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        return points if projected else project_coords(points)
+
+    def _grid_for(self, radius):
+        """
+        Grilla para consultar a radius metros: la de celdas de cell_size·4^j más
+        grande que no supera el radio (columnas recorridas acotadas para radios grandes)
+        """
+        level = int(math.log(max(radius, self.cell_size) / self.cell_size, LEVEL_FACTOR))
+        grid = self._levels.get(level)
+        if grid is None:
+            grid = self._levels[level] = StopQuery(self.stop_ids, self.xy, self.cell_size * LEVEL_FACTOR ** level)
+        return grid
+
+    def _pairs(self, points_xy, radius):
+        """
+        Todos los pares (punto, parada) a distancia <= radius
+        radius: metros, escalar o uno por punto
+        Returns: (query, stop, distance) con stop como índice en self.stop_ids
+        """
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0))
+        if not len(self.xy) or not len(points_xy):
+            return empty
+
+        radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), (len(points_xy),))
+        px, py = points_xy[:, 0], points_xy[:, 1]
+        # Columnas que toca el círculo de cada punto
+        ix_lo = np.maximum(np.floor((px - radius) / self.cell_size).astype(np.int64), self.origin[0])
+        ix_hi = np.minimum(np.floor((px + radius) / self.cell_size).astype(np.int64), self.origin[0] + self.nx - 1)
+        active = ix_lo <= ix_hi
+        if not active.any():
+            return empty
+        span = int((ix_hi - ix_lo)[active].max()) + 1
+        query_parts, stop_parts = [], []
+        for dx in range(span):
+            queries = np.flatnonzero(active & (ix_lo + dx <= ix_hi))
+            if not len(queries):
+                continue
+            # En la columna ix el círculo cubre una cuerda de semialto half; sus
+            # celdas iy_lo..iy_hi son un rango contiguo de claves, y sus paradas
+            # un rango contiguo de sorted_xy
+            ix = ix_lo[queries] + dx
+            x = px[queries]
+            gap = np.maximum(np.maximum(ix * self.cell_size - x, x - (ix + 1) * self.cell_size), 0)
+            half = np.sqrt(np.maximum(radius[queries] ** 2 - gap * gap, 0))
+            y = py[queries]
+            iy_lo = np.maximum(np.floor((y - half) / self.cell_size).astype(np.int64), self.origin[1])
+            iy_hi = np.minimum(np.floor((y + half) / self.cell_size).astype(np.int64), self.origin[1] + self.ny - 1)
+            rows = iy_lo <= iy_hi
+            queries, ix, iy_lo, iy_hi = queries[rows], ix[rows], iy_lo[rows], iy_hi[rows]
+
+            first = self._keys(ix, iy_lo)
+            start = self.cell_start[first]
+            counts = self.cell_start[first + (iy_hi - iy_lo) + 1] - start
+            hit = counts > 0
+            queries, start, counts = queries[hit], start[hit], counts[hit]
+            if not len(queries):
+                continue
+            # Expandir cada (punto, rango) a sus paradas
+            query_parts.append(np.repeat(queries, counts))
+            stop_parts.append(_ranges(start, counts))
+
+        if not query_parts:
+            return empty
+        query = np.concatenate(query_parts)
+        sorted_stop = np.concatenate(stop_parts)
+        # Filtro con la distancia al cuadrado; la raíz solo para los pares que quedan
+        dx = self._sorted_x[sorted_stop] - px[query]
+        dy = self._sorted_y[sorted_stop] - py[query]
+        squared = dx * dx + dy * dy
+        within = squared <= (radius * radius)[query]
+        return query[within], self.order[sorted_stop[within]], np.sqrt(squared[within])
+
+    @staticmethod
+    def _by_query_and_distance(query, stop, distance, n_queries):
+        order = np.lexsort((distance, query))
+        offsets = np.zeros(n_queries + 1, dtype=np.int64)
+        np.cumsum(np.bincount(query, minlength=n_queries), out=offsets[1:])
+        return offsets, stop[order], distance[order]
+
+    def radius(self, points, radius, projected=False):
+        """
+        Paradas a menos de radius metros de cada punto
+
+        Args:
+            points: array (n, 2) de (lon, lat), o de (x, y) UTM con projected=True
+            radius: metros
+        Returns:
+            RadiusResult (CSR por punto, ordenado por distancia)
+        """
+        points_xy = self._points_xy(points, projected)
+        query, stop, distance = self._grid_for(float(radius))._pairs(points_xy, float(radius))
+        offsets, indices, distances = self._by_query_and_distance(query, stop, distance, len(points_xy))
+        return RadiusResult(self.stop_ids, offsets, indices, distances)
+
+    def knn(self, points, k=1, max_radius=None, projected=False):
+        """
+        k paradas más cercanas a cada punto
+
+        Args:
+            points: array (n, 2) de (lon, lat), o de (x, y) UTM con projected=True
+            k: vecinos por punto
+            max_radius: no buscar más allá (metros); default: sin límite
+        Returns:
+            (indices, distances): arrays (n, k) con índices en stop_ids y metros;
+            -1 / inf donde no hay k paradas (o no dentro de max_radius)
+        """
+        points_xy = self._points_xy(points, projected)
+        n = len(points_xy)
+        indices = np.full((n, k), -1, dtype=np.int64)
+        distances = np.full((n, k), np.inf)
+        if not len(self.stop_ids) or not n or k <= 0:
+            return indices, distances
+
+        found = min(k, len(self))
+        lists, offsets, candidates = self._candidates(points_xy, found, self.cell_size)
+        nearest, nearest_distance = self._knn_candidates(points_xy, lists, offsets, candidates, found)
+        if max_radius is not None:
+            outside = nearest_distance > float(max_radius)
+            nearest[outside] = -1
+            nearest_distance[outside] = np.inf
+        indices[:, :found] = nearest
+        distances[:, :found] = nearest_distance
+        return indices, distances
+
+    def _candidates(self, points_xy, k, cell_size, margin=0.0):
+        """
+        Paradas candidatas de cada punto: todas las que están a menos de
+        d_k(p) + margin (d_k = distancia a su k-ésima más cercana), como
+        (lists, offsets, candidates); la lista del punto i es
+        candidates[offsets[lists[i]]:offsets[lists[i] + 1]]
+
+        Una ronda de radio margin + cell_size resuelve los puntos con k paradas
+        a menos de cell_size (su lista es la de la ronda). Los demás (lejos de
+        la red) comparten la lista de su celda de cell_size: las paradas a
+        menos de d_k(c) + diagonal + margin de su centro c, que salen de la
+        lista del centro en celdas LEVEL_FACTOR veces más grandes. Con pocos
+        puntos, la lista es de todas las paradas
+        """
+        n = len(points_xy)
+        if n * len(self) <= CHUNK_PAIRS:
+            return np.zeros(n, dtype=np.int64), np.array([0, len(self)]), np.arange(len(self))
+
+        radius = margin + cell_size
+        query, stop, distance = self._grid_for(radius)._pairs(points_xy, radius)
+        near = np.bincount(query[distance <= cell_size], minlength=n) >= k
+        keep = near[query]
+        query, stop = query[keep], stop[keep]
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(query, minlength=n), out=offsets[1:])
+        candidates = [stop[np.argsort(query, kind='stable')]]
+        lists = np.arange(n)
+
+        far = np.flatnonzero(~near)
+        if len(far):
+            cells = np.floor(points_xy[far] / cell_size).astype(np.int64)
+            low = cells.min(axis=0)
+            height = int(cells[:, 1].max() - low[1]) + 1
+            keys, inverse = np.unique((cells[:, 0] - low[0]) * height + (cells[:, 1] - low[1]),
+                                      return_inverse=True)
+            centers = (np.stack([keys // height, keys % height], axis=1) + low + 0.5) * cell_size
+            reach = cell_size * math.sqrt(2) + margin
+            cell_lists = self._candidates(centers, k, cell_size * LEVEL_FACTOR, reach)
+
+            counts = np.zeros(len(centers), dtype=np.int64)
+            center_parts, stop_parts = [], []
+            for chunk, stop, squared in self._candidate_matrices(centers, *cell_lists):
+                kth = np.sqrt(np.partition(squared, k - 1, axis=1)[:, k - 1])
+                # Holgura numérica: la k-ésima vecina de un punto puede estar justo en el borde
+                keep = squared <= (((kth + reach) * (1 + 1e-9)) ** 2)[:, None]
+                counts[chunk] = keep.sum(axis=1)
+                center_parts.append(np.repeat(chunk, counts[chunk]))
+                stop_parts.append(stop[keep])
+            order = np.argsort(np.concatenate(center_parts), kind='stable')
+            candidates.append(np.concatenate(stop_parts)[order])
+            offsets = np.concatenate([offsets, offsets[-1] + np.cumsum(counts)])
+            lists[far] = n + inverse.ravel()
+        return lists, offsets, np.concatenate(candidates)
+
+    def _candidate_matrices(self, points_xy, lists, offsets, candidates):
+        """
+        Distancias al cuadrado de cada punto a su lista de candidatas, en
+        matrices (puntos, paradas, distancias²) de a lo más CHUNK_PAIRS
+        elementos; los puntos van ordenados por largo de lista y las filas
+        más cortas se completan con inf
+        """
+        starts = offsets[lists]
+        counts = offsets[lists + 1] - starts
+        by_count = np.argsort(counts, kind='stable')
+        rows = max(1, CHUNK_PAIRS // int(counts.max()))
+        for first in range(0, len(points_xy), rows):
+            chunk = by_count[first:first + rows]
+            column = np.arange(int(counts[chunk[-1]]))
+            valid = column < counts[chunk, None]
+            stop = candidates[starts[chunk, None] + np.where(valid, column, 0)]
+            dx = self._x[stop] - points_xy[chunk, 0, None]
+            dy = self._y[stop] - points_xy[chunk, 1, None]
+            yield chunk, stop, np.where(valid, dx * dx + dy * dy, np.inf)
+
+    def _knn_candidates(self, points_xy, lists, offsets, candidates, k):
+        """k más cercanas de cada punto entre sus candidatas (al menos k), ordenadas por distancia"""
+        indices = np.empty((len(points_xy), k), dtype=np.int64)
+        distances = np.empty((len(points_xy), k))
+        for chunk, stop, squared in self._candidate_matrices(points_xy, lists, offsets, candidates):
+            if squared.shape[1] > k:
+                nearest = np.argpartition(squared, k - 1, axis=1)[:, :k]
+                squared = np.take_along_axis(squared, nearest, axis=1)
+                stop = np.take_along_axis(stop, nearest, axis=1)
+            order = np.argsort(squared, axis=1, kind='stable')
+            indices[chunk] = np.take_along_axis(stop, order, axis=1)
+            distances[chunk] = np.sqrt(np.take_along_axis(squared, order, axis=1))
+        return indices, distances
+
+    def ids(self, indices):
+        """Índices (cualquier forma, -1 = vacío) a stop_ids (None = vacío)"""
+        lookup = np.array(self.stop_ids + [None], dtype=object)
+        return lookup[np.asarray(indices)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultas de paradas cercanas (radio / k vecinos)")
+    parser.add_argument('--lat', type=float, help="Latitud del punto a consultar")
+    parser.add_argument('--lon', type=float, help="Longitud del punto a consultar")
+    parser.add_argument('--radius', type=float, default=300, help="Radio en metros (default: 300)")
+    parser.add_argument('-k', type=int, default=5, help="Vecinos más cercanos (default: 5)")
+    parser.add_argument('--stops', type=Path, default=Path(__file__).parent / 'stops_with_ids_final.json',
+                        help="Tabla de paradas (default: stops_with_ids_final.json)")
+    parser.add_argument('--benchmark', type=int, metavar='N',
+                        help="Medir N puntos aleatorios (en la red, sobre el bbox de las paradas y mitad fuera)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    query = StopQuery.from_stops_file(args.stops)
+    print(f"📁 {len(query)} paradas indexadas en {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if args.lat is not None and args.lon is not None:
+        point = [[args.lon, args.lat]]
+        print(f"\n📍 A menos de {args.radius:.0f} m:")
+        for stop_id, distance in query.radius(point, args.radius).stops_of(0):
+            print(f"   {stop_id:24s} {distance:8.1f} m")
+        indices, distances = query.knn(point, args.k)
+        print(f"\n📍 {args.k} más cercanas:")
+        for stop_id, distance in zip(query.ids(indices[0]), distances[0].tolist()):
+            if stop_id is not None:
+                print(f"   {stop_id:24s} {distance:8.1f} m")
+
+    if args.benchmark:
+        rng = np.random.default_rng(0)
+        n = args.benchmark
+        low, high = query.xy.min(axis=0), query.xy.max(axis=0)
+        network = query.xy[rng.integers(0, len(query), n)] + rng.normal(0, 500, size=(n, 2))
+        samples = {
+            # Puntos en el área servida (paradas al azar + ruido de 500 m), sobre todo el
+            # bbox, y la mitad en la red y la mitad hasta 50 km fuera del bbox
+            'en la red': network,
+            'bbox': rng.uniform(low, high, size=(n, 2)),
+            'mitad fuera de la red': np.vstack([network[:n // 2],
+                                                rng.uniform(low - 50000, high + 50000, size=(n - n // 2, 2))])
+        }
+        for name, points in samples.items():
+            start = time.perf_counter()
+            result = query.radius(points, args.radius, projected=True)
+            radius_secs = time.perf_counter() - start
+            start = time.perf_counter()
+            query.knn(points, args.k, projected=True)
+            knn_secs = time.perf_counter() - start
+            print(f"\n⏱️  {n} puntos ({name}): radio {args.radius:.0f} m en {radius_secs:.3f} s "
+                  f"({len(result.indices)} pares), {args.k}-NN en {knn_secs:.3f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Tabla columnar de paradas
+Reemplaza los dicts por parada ({'stop_id', 'stop_code', 'stop_lat', ...})
+que recorrían todas las etapas por arrays paralelos, una fila por parada:
+
+- stop_ids / codes / names: listas de strings internados (el nombre y el
+  código de las paradas base son el mismo objeto que el stop_id o el nombre
+  del paradero)
+- lat / lon: float64
+- district: código int32 sobre el diccionario districts
+- synthetic: bool (paradas SYNTH_* creadas en la asignación)
+- original_index: índice en el GeoJSON de paraderos (-1 si no tiene)
+- parent_station: stop_id de la estación ('' si no tiene, ver cluster_stations)
+
+y un mapa stop_id -> fila. Las paradas nuevas se agregan al final (append),
+así que el orden de las filas es el de inserción, igual que el diccionario
+anterior. to_records() devuelve los mismos dicts (mismas claves, en el mismo
+orden) que se escriben en stops_with_ids*.json.
+"""
+
+import sys
+
+import numpy as np
+
+from instrumentation import load_json
+
+class StopTable:
+    """Paradas en columnas (ver docstring del módulo)"""
+
+    def __init__(self, capacity=0):
+        self.stop_ids = []
+        self.codes = []
+        self.names = []
+        self.districts = []
+        self.parent_station = []
+        self._lat = np.empty(capacity, dtype=np.float64)
+        self._lon = np.empty(capacity, dtype=np.float64)
+        self._district = np.empty(capacity, dtype=np.int32)
+        self._synthetic = np.empty(capacity, dtype=bool)
+        self._original_index = np.empty(capacity, dtype=np.int64)
+        self._district_code = {}
+        self._index = {}
+
+    @classmethod
+    def from_columns(cls, stop_ids, codes, names, lat, lon, distritos, synthetic=None, original_index=None,
+                     parent_station=None):
+        """
+        Desde columnas completas (listas o arrays del mismo largo), en una pasada
+        Si hay stop_ids repetidos se agregan fila por fila (el último reemplaza al anterior)
+        """
+        n = len(stop_ids)
+        synthetic = np.zeros(n, dtype=bool) if synthetic is None else synthetic
+        original_index = np.full(n, -1, dtype=np.int64) if original_index is None else original_index
+        parent_station = [''] * n if parent_station is None else parent_station
+        table = cls(n)
+        stop_ids = [sys.intern(stop_id) for stop_id in stop_ids]
+        index = dict(zip(stop_ids, range(n)))
+        if len(index) < n:
+            for row in range(n):
+                table.append(stop_ids[row], codes[row], names[row], lat[row], lon[row], distritos[row],
+                             synthetic[row], original_index[row], parent_station[row])
+            return table
+
+        table.stop_ids = stop_ids
+        table.codes = [sys.intern(code) for code in codes]
+        table.names = [sys.intern(name) for name in names]
+        table.parent_station = list(parent_station)
+        table._lat[:] = lat
+        table._lon[:] = lon
+        table._district[:] = [table.district_code(distrito) for distrito in distritos]
+        table._synthetic[:] = synthetic
+        table._original_index[:] = original_index
+        table._index = index
+        return table
+
+    @classmethod
+    def from_records(cls, records):
+        """Desde una lista de dicts de parada (lista 'stops' de stops_with_ids*.json)"""
+        return cls.from_columns(
+            [stop['stop_id'] for stop in records],
+            [stop['stop_code'] for stop in records],
+            [stop['stop_name'] for stop in records],
+            [stop['stop_lat'] for stop in records],
+            [stop['stop_lon'] for stop in records],
+            [stop.get('distrito', '') for stop in records],
+            [stop.get('synthetic', False) for stop in records],
+            [stop.get('original_index', -1) for stop in records],
+            [stop.get('parent_station', '') for stop in records]
+        )
+
+    @classmethod
+    def from_json(cls, path):
+        """Desde stops_with_ids*.json"""
+        return cls.from_records(load_json(path)['stops'])
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    def __contains__(self, stop_id):
+        return stop_id in self._index
+
+    @property
+    def lat(self):
+        return self._lat[:len(self)]
+
+    @property
+    def lon(self):
+        return self._lon[:len(self)]
+
+    @property
+    def district(self):
+        return self._district[:len(self)]
+
+    @property
+    def synthetic(self):
+        return self._synthetic[:len(self)]
+
+    @property
+    def original_index(self):
+        return self._original_index[:len(self)]
+
+    def _reserve(self, size):
+        """Crece los arrays (al doble) para que quepan size filas"""
+        capacity = len(self._lat)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 16)
+        for name in ('_lat', '_lon', '_district', '_synthetic', '_original_index'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:len(self)] = old[:len(self)]
+            setattr(self, name, new)
+
+    def district_code(self, distrito):
+        """Código del distrito (se agrega al diccionario si es nuevo)"""
+        code = self._district_code.get(distrito)
+        if code is None:
+            code = self._district_code[distrito] = len(self.districts)
+            self.districts.append(sys.intern(distrito))
+        return code
+
+    def append(self, stop_id, stop_code, stop_name, stop_lat, stop_lon, distrito='', synthetic=False,
+               original_index=-1, parent_station=''):
+        """Agrega una parada al final, o la reemplaza si el stop_id ya existe; devuelve su fila"""
+        row = self._index.get(stop_id)
+        if row is None:
+            row = len(self)
+            self._reserve(row + 1)
+            stop_id = sys.intern(stop_id)
+            self._index[stop_id] = row
+            self.stop_ids.append(stop_id)
+            self.codes.append(None)
+            self.names.append(None)
+            self.parent_station.append('')
+        self.codes[row] = sys.intern(stop_code)
+        self.names[row] = sys.intern(stop_name)
+        self.parent_station[row] = parent_station
+        self._lat[row] = stop_lat
+        self._lon[row] = stop_lon
+        self._district[row] = self.district_code(distrito)
+        self._synthetic[row] = synthetic
+        self._original_index[row] = original_index
+        return row
+
+    def index_of(self, stop_id):
+        """Fila de la parada, o None si no existe"""
+        return self._index.get(stop_id)
+
+    def rows(self, stop_ids):
+        """Array con la fila de cada stop_id (-1 si no existe)"""
+        index = self._index
+        return np.fromiter((index.get(stop_id, -1) for stop_id in stop_ids), dtype=np.int64, count=len(stop_ids))
+
+    def lonlat(self, rows=None):
+        """Array (n, 2) de (lon, lat) de las filas dadas (todas por defecto)"""
+        if rows is None:
+            return np.column_stack([self.lon, self.lat])
+        return np.column_stack([self._lon[rows], self._lat[rows]])
+
+    def district_names(self, rows=None):
+        """Nombre del distrito de cada fila (todas por defecto)"""
+        codes = self.district if rows is None else self._district[rows]
+        return [self.districts[code] for code in codes.tolist()]
+
+    def set_parents(self, parents):
+        """parent_station de cada parada desde stop_id -> estación (las demás quedan sin)"""
+        self.parent_station = [parents.get(stop_id, '') for stop_id in self.stop_ids]
+
+    def copy(self):
+        """Copia independiente (los strings internados se comparten)"""
+        table = StopTable()
+        table.stop_ids = list(self.stop_ids)
+        table.codes = list(self.codes)
+        table.names = list(self.names)
+        table.districts = list(self.districts)
+        table.parent_station = list(self.parent_station)
+        for name in ('_lat', '_lon', '_district', '_synthetic', '_original_index'):
+            setattr(table, name, getattr(self, name)[:len(self)].copy())
+        table._district_code = dict(self._district_code)
+        table._index = dict(self._index)
+        return table
+
+    def record(self, row):
+        """Dict de la parada de la fila row (estructura de stops_with_ids*.json)"""
+        return self.to_records([row])[0]
+
+    def to_records(self, rows=None):
+        """Dicts de las paradas (todas por defecto), con las claves en el orden del JSON"""
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.int64)
+        columns = zip(rows.tolist(), self._lat[rows].tolist(), self._lon[rows].tolist(),
+                      self._district[rows].tolist(), self._synthetic[rows].tolist(),
+                      self._original_index[rows].tolist())
+        records = []
+        for row, lat, lon, district, synthetic, original_index in columns:
+            stop = {
+                'stop_id': self.stop_ids[row],
+                'stop_code': self.codes[row],
+                'stop_name': self.names[row],
+                'stop_lat': lat,
+                'stop_lon': lon,
+                'distrito': self.districts[district]
+            }
+            if original_index >= 0:
+                stop['original_index'] = original_index
+            if synthetic:
+                stop['synthetic'] = True
+            if self.parent_station[row]:
+                stop['parent_station'] = self.parent_station[row]
+            records.append(stop)
+        return records
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Índice parada -> trips compacto (CSR) para consultas sin parsear JSON
+stops_to_trips_index.json hay que leerlo entero antes de responder una sola
+consulta. stops_to_trips.bin guarda lo mismo como arrays de array_bundle
+(abiertos con mmap):
+
+- stop_ids / trip_ids / route_ids: diccionarios ordenados (búsqueda binaria)
+- stop_offsets + stop_trips + stop_sequences: trips de la parada s (con su
+  stop_sequence) en stop_trips[stop_offsets[s]:stop_offsets[s+1]], ordenados
+  por (route_id, trip_id) como en el JSON
+- trip_offsets + trip_stops: secuencia de paradas de cada trip
+- trip_routes: ruta de cada trip
+
+Abrir el índice solo lee la cabecera; cada consulta cuesta una búsqueda
+binaria del id más O(grado) sobre los arrays.
+
+La cabecera guarda además (tamaño, mtime_ns) de gtfs_feed/trips.txt y
+stop_times.txt al momento de escribirlo: open_index() lo reconstruye si el
+feed cambió desde entonces, igual que raptor.load_raptor con su caché.
+"""
+
+import argparse
+from bisect import bisect_left
+from pathlib import Path
+
+import numpy as np
+
+from array_bundle import read_bundle, read_meta, write_bundle
+from instrumentation import PROFILER, add_profile_args, configure_from_args, finish_profile
+from trip_store import load_trip_sequences
+
+INDEX_VERSION = 2
+DEFAULT_FILENAME = 'stops_to_trips.bin'
+# Archivos del feed que se sirven junto al índice (para detectar uno viejo)
+SOURCE_FILES = ('trips.txt', 'stop_times.txt')
+
+def default_index_path(base_path=None):
+    return Path(base_path or Path(__file__).parent) / DEFAULT_FILENAME
+
+def default_feed_dir(base_path=None):
+    return Path(base_path or Path(__file__).parent) / 'gtfs_feed'
+
+def feed_stamps(feed_dir):
+    """(tamaño, mtime_ns) de los archivos del feed presentes, para validar el índice"""
+    stamps = {}
+    for name in SOURCE_FILES:
+        path = Path(feed_dir) / name
+        if path.exists():
+            stat = path.stat()
+            stamps[name] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+def _find(sorted_ids, value):
+    """Posición de value en una lista ordenada, o None"""
+    i = bisect_left(sorted_ids, value)
+    if i < len(sorted_ids) and sorted_ids[i] == value:
+        return i
+    return None
+
+class StopTripIndex:
+    """Índice CSR parada -> trips y trip -> paradas (ver docstring del módulo)"""
+
+    def __init__(self, stop_ids, trip_ids, route_ids, stop_offsets, stop_trips, stop_sequences,
+                 trip_offsets, trip_stops, trip_routes):
+        self.stop_ids = stop_ids
+        self.trip_ids = trip_ids
+        self.route_ids = route_ids
+        self.stop_offsets = stop_offsets
+        self.stop_trips = stop_trips
+        self.stop_sequences = stop_sequences
+        self.trip_offsets = trip_offsets
+        self.trip_stops = trip_stops
+        self.trip_routes = trip_routes
+
+    @classmethod
+    def from_sequences(cls, trip_sequences):
+        """Construye el índice desde un TripSequenceStore (vectorizado)"""
+        stop_ids = sorted(trip_sequences.stop_ids)
+        trip_ids = sorted(trip_sequences.trip_ids)
+        route_ids = sorted(set(trip_sequences.route_ids))
+
+        # Posiciones del store -> posiciones en los diccionarios ordenados
+        stop_rank = np.empty(len(stop_ids), dtype=np.int32)
+        stop_rank[np.argsort(np.array(trip_sequences.stop_ids, dtype=object), kind='stable')] = \
+            np.arange(len(stop_ids), dtype=np.int32)
+        trip_rank = np.array([_find(trip_ids, t) for t in trip_sequences.trip_ids], dtype=np.int32)
+        route_of_trip = np.array([_find(route_ids, r) for r in trip_sequences.route_ids], dtype=np.int32)
+
+        offsets = np.asarray(trip_sequences.offsets, dtype=np.int64)
+        lengths = np.diff(offsets)
+        entry_trip = np.repeat(np.arange(len(lengths)), lengths)
+        entry_stop = stop_rank[np.asarray(trip_sequences.stop_index, dtype=np.int64)]
+        entry_sequence = (np.arange(offsets[-1]) - offsets[entry_trip] + 1).astype(np.int32)
+        entry_trip_rank = trip_rank[entry_trip]
+
+        # Parada -> trips, ordenados por (route_id, trip_id, stop_sequence)
+        order = np.lexsort((entry_sequence, entry_trip_rank, route_of_trip[entry_trip], entry_stop))
+        stop_offsets = np.zeros(len(stop_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(entry_stop, minlength=len(stop_ids)), out=stop_offsets[1:])
+
+        # Trip -> paradas, en el orden de los trip_ids ordenados
+        trip_order = np.lexsort((entry_sequence, entry_trip_rank))
+        trip_offsets = np.zeros(len(trip_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(entry_trip_rank, minlength=len(trip_ids)), out=trip_offsets[1:])
+        trip_routes = np.empty(len(trip_ids), dtype=np.int32)
+        trip_routes[trip_rank] = route_of_trip
+
+        return cls(
+            stop_ids, trip_ids, route_ids,
+            stop_offsets,
+            entry_trip_rank[order].astype(np.int32),
+            entry_sequence[order],
+            trip_offsets,
+            entry_stop[trip_order].astype(np.int32),
+            trip_routes
+        )
+
+    @classmethod
+    def open(cls, path):
+        """Abre el índice con mmap (solo se lee la cabecera)"""
+        arrays, meta = read_bundle(path)
+        if meta.get('version') != INDEX_VERSION:
+            raise ValueError(f"{path}: versión de índice no soportada")
+        return cls(meta['stop_ids'], meta['trip_ids'], meta['route_ids'],
+                   arrays['stop_offsets'], arrays['stop_trips'], arrays['stop_sequences'],
+                   arrays['trip_offsets'], arrays['trip_stops'], arrays['trip_routes'])
+
+    def save(self, path, stamps=None):
+        """Escribe el índice en path (formato de array_bundle), con los stamps del feed"""
+        write_bundle(path, {
+            'stop_offsets': self.stop_offsets,
+            'stop_trips': self.stop_trips,
+            'stop_sequences': self.stop_sequences,
+            'trip_offsets': self.trip_offsets,
+            'trip_stops': self.trip_stops,
+            'trip_routes': self.trip_routes
+        }, meta={
+            'version': INDEX_VERSION,
+            'stop_ids': self.stop_ids,
+            'trip_ids': self.trip_ids,
+            'route_ids': self.route_ids,
+            'stamps': stamps or {}
+        })
+        return self
+
+    @property
+    def total_connections(self):
+        return len(self.stop_trips)
+
+    def __contains__(self, stop_id):
+        return _find(self.stop_ids, stop_id) is not None
+
+    def trips_at(self, stop_id):
+        """
+        Trips que pasan por la parada, ordenados por (route_id, trip_id):
+        lista de dicts trip_id, route_id, stop_sequence (vacía si no hay)
+        """
+        s = _find(self.stop_ids, stop_id)
+        if s is None:
+            return []
+        part = slice(self.stop_offsets[s], self.stop_offsets[s + 1])
+        trips = self.stop_trips[part].tolist()
+        routes = self.trip_routes[self.stop_trips[part]].tolist()
+        return [
+            {'trip_id': self.trip_ids[t], 'route_id': self.route_ids[r], 'stop_sequence': seq}
+            for t, r, seq in zip(trips, routes, self.stop_sequences[part].tolist())
+        ]
+
+    def routes_at(self, stop_id):
+        """route_ids (ordenados, sin repetir) que pasan por la parada"""
+        s = _find(self.stop_ids, stop_id)
+        if s is None:
+            return []
+        routes = self.trip_routes[self.stop_trips[self.stop_offsets[s]:self.stop_offsets[s + 1]]]
+        if not len(routes):
+            return []
+        # Los trips de la parada ya vienen agrupados por ruta
+        first = np.r_[True, routes[1:] != routes[:-1]]
+        return [self.route_ids[r] for r in routes[first].tolist()]
+
+    def stops_of(self, trip_id):
+        """Lista de stop_ids del trip en orden de secuencia (None si no existe)"""
+        t = _find(self.trip_ids, trip_id)
+        if t is None:
+            return None
+        return [self.stop_ids[s] for s in self.trip_stops[self.trip_offsets[t]:self.trip_offsets[t + 1]].tolist()]
+
+    def route_of(self, trip_id):
+        t = _find(self.trip_ids, trip_id)
+        return None if t is None else self.route_ids[self.trip_routes[t]]
+
+def build_stop_trip_index(trip_sequences, path=None, stamps=None):
+    """Construye el índice CSR y, si se indica path, lo escribe (con los stamps del feed)"""
+    index = StopTripIndex.from_sequences(trip_sequences)
+    if path is not None:
+        index.save(path, stamps)
+    return index
+
+def open_index(base_path=None):
+    """
+    Abre stops_to_trips.bin si corresponde al gtfs_feed/ actual; si no existe,
+    es de otra versión o el feed cambió, lo reconstruye desde trip_sequences.bin
+    """
+    path = default_index_path(base_path)
+    stamps = feed_stamps(default_feed_dir(base_path))
+    if path.exists():
+        try:
+            meta = read_meta(path)
+        except (OSError, ValueError):
+            meta = None
+        if meta and meta.get('version') == INDEX_VERSION and meta.get('stamps') == stamps:
+            return StopTripIndex.open(path)
+        print(f"⚠️  {path.name} no corresponde al feed actual; reconstruyendo desde trip_sequences.bin")
+    return build_stop_trip_index(load_trip_sequences(base_path), path, stamps)
+
+def load_stop_trip_index(base_path=None):
+    """Abre stops_to_trips.bin de base_path (o de GTFSv2/)"""
+    path = default_index_path(base_path)
+    if not path.exists():
+        raise FileNotFoundError(f"No se encontró {path.name}; ejecutar generate_stops_to_trips_index.py")
+    return StopTripIndex.open(path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Consulta el índice CSR paradas → trips (stops_to_trips.bin)")
+    parser.add_argument('--stop', action='append', default=[], help="stop_id a consultar (repetible)")
+    parser.add_argument('--trip', action='append', default=[], help="trip_id a consultar (repetible)")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Reconstruir stops_to_trips.bin desde trip_sequences.bin")
+    add_profile_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args, 'stops_trips_csr')
+
+    base_path = Path(__file__).parent
+
+    if args.rebuild or not default_index_path(base_path).exists():
+        with PROFILER.stage('build_index'):
+            index = build_stop_trip_index(load_trip_sequences(base_path), default_index_path(base_path),
+                                          feed_stamps(default_feed_dir(base_path)))
+        print(f"✅ {default_index_path(base_path).name}: {len(index.stop_ids)} paradas, "
+              f"{len(index.trip_ids)} trips, {index.total_connections} conexiones")
+
+    with PROFILER.stage('open_index'):
+        index = open_index(base_path)
+
+    with PROFILER.stage('queries'):
+        for stop_id in args.stop:
+            trips = index.trips_at(stop_id)
+            print(f"\n🚏 {stop_id}: {len(trips)} trips, rutas: {', '.join(index.routes_at(stop_id)) or '-'}")
+            for trip in trips:
+                print(f"   {trip['route_id']:12s} {trip['trip_id']:>12s}  (parada #{trip['stop_sequence']})")
+        for trip_id in args.trip:
+            stops = index.stops_of(trip_id)
+            if stops is None:
+                print(f"\n🚌 {trip_id}: no existe")
+                continue
+            print(f"\n🚌 {trip_id} ({index.route_of(trip_id)}): {len(stops)} paradas")
+            print(f"   {' → '.join(stops)}")
+
+    print()
+    finish_profile()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Generador de ciudades sintéticas para benchmarks
+Produce paradas y shapes/trips/routes parametrizables en los mismos formatos que
+leen los scripts de GTFSv2: paraderos_consolidados.geojson, stops_with_ids_clean.json
+y gtfs/{shapes,trips,routes}.txt.
+
+La ciudad es una grilla de calles (cuadras de BLOCK_M metros) centrada en
+Trujillo. Cada ruta es un recorrido aleatorio por la grilla con ida y vuelta
+(un trip y una shape por sentido); las paradas se ubican a ambos lados de las
+cuadras, primero sobre las recorridas por rutas y el resto dispersas. El tamaño
+de la grilla se ajusta para que la cantidad de paradas por trip sea parecida a
+la de Trujillo.
+"""
+
+import argparse
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+
+from generate_stop_ids import build_stop_ids
+from gtfs_writer import SHAPES_FIELDNAMES, write_table_file
+
+CENTER_LON = -79.03
+CENTER_LAT = -8.11
+BLOCK_M = 150.0
+VERTEX_SPACING_M = 25.0
+STOP_OFFSET_M = 6.0
+ROUTE_BLOCKS = (60, 110)  # largo de ruta en cuadras (~9 a 16 km)
+TRIPS_PER_ROUTE = 2       # ida y vuelta
+DUPLICATE_NAME_RATE = 0.02
+STOPS_PER_KM2 = 10.0      # ~2,180 paradas en ~220 km² (Trujillo)
+STOP_SLOT_FILL = 0.6      # paradas por lado de cuadra recorrida
+
+ROUTE_FIELDNAMES = ['route_id', 'agency_id', 'route_short_name', 'route_long_name', 'route_color', 'route_type']
+TRIP_FIELDNAMES = ['trip_id', 'route_id', 'service_id', 'shape_id', 'trip_headsign']
+
+# Vecinos en la grilla: este, norte, oeste, sur
+_DIRECTIONS = np.array([(1, 0), (0, 1), (-1, 0), (0, -1)], dtype=np.int64)
+
+def meters_to_lonlat(x, y):
+    """Metros locales (respecto del centro) a (lon, lat); aproximación equirectangular"""
+    lon = CENTER_LON + np.asarray(x) / (111320.0 * math.cos(math.radians(CENTER_LAT)))
+    lat = CENTER_LAT + np.asarray(y) / 110574.0
+    return lon, lat
+
+def grid_size_for(n_stops, n_routes):
+    """
+    Intersecciones por lado de la grilla
+    Se elige k para que las cuadras recorridas por rutas alcancen para ubicar las
+    paradas con ~STOP_SLOT_FILL paradas por lado de cuadra (≈ una cada 250 m por
+    sentido, como en Trujillo). Si las rutas no alcanzan, se usa la densidad por área
+    """
+    area_k = max(8, int(math.sqrt(n_stops / STOPS_PER_KM2) * 1000 / BLOCK_M))
+    target_edges = n_stops / (2 * STOP_SLOT_FILL)
+    route_edges = n_routes * sum(ROUTE_BLOCKS) / 2
+    if route_edges <= target_edges:
+        return area_k
+
+    # Cuadras distintas cubiertas por route_edges cuadras al azar en 2k² cuadras
+    def covered(k):
+        total = 2 * k * k
+        return total * (1 - math.exp(-route_edges / total))
+
+    lo, hi = 8, max(area_k, 16)
+    while covered(hi) < target_edges:
+        hi *= 2
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if covered(mid) < target_edges:
+            lo = mid + 1
+        else:
+            hi = mid
+    return max(lo, ROUTE_BLOCKS[1] // 4)
+
+def random_walk(rng, k, n_blocks):
+    """
+    Recorrido por la grilla de k × k intersecciones: sigue de largo con más
+    probabilidad que girar y nunca vuelve sobre la cuadra recién recorrida
+    """
+    node = rng.integers(0, k, size=2)
+    heading = int(rng.integers(0, 4))
+    nodes = [node.copy()]
+    for _ in range(n_blocks):
+        options = [heading, (heading + 1) % 4, (heading + 3) % 4]
+        weights = np.array([0.7, 0.15, 0.15])
+        order = rng.choice(3, size=3, replace=False, p=weights)
+        for choice in order:
+            d = options[choice]
+            nxt = node + _DIRECTIONS[d]
+            if 0 <= nxt[0] < k and 0 <= nxt[1] < k:
+                node, heading = nxt, d
+                break
+        else:
+            # Esquina sin salida hacia adelante: dar la vuelta
+            heading = (heading + 2) % 4
+            node = node + _DIRECTIONS[heading]
+        nodes.append(node.copy())
+    return np.array(nodes, dtype=np.int64)
+
+def densify(nodes, offset_m):
+    """Polilínea en metros con un vértice cada VERTEX_SPACING_M sobre las cuadras"""
+    steps = int(BLOCK_M // VERTEX_SPACING_M)
+    a = nodes[:-1].astype(np.float64) * BLOCK_M
+    b = nodes[1:].astype(np.float64) * BLOCK_M
+    t = np.arange(steps, dtype=np.float64) / steps
+    points = (a[:, None, :] + (b - a)[:, None, :] * t[None, :, None]).reshape(-1, 2)
+    points = np.vstack([points, b[-1:]])
+    return points - offset_m
+
+def _edge_key(a, b, k):
+    """Id de cuadra (sin sentido) entre dos intersecciones vecinas"""
+    lo = np.minimum(a[:, 0] * k + a[:, 1], b[:, 0] * k + b[:, 1])
+    hi = np.maximum(a[:, 0] * k + a[:, 1], b[:, 0] * k + b[:, 1])
+    return lo * (k * k) + hi
+
+def _edge_nodes(keys, k):
+    lo, hi = np.divmod(keys, k * k)
+    return np.column_stack(np.divmod(lo, k)), np.column_stack(np.divmod(hi, k))
+
+def place_stops(rng, route_edges, k, n_stops):
+    """
+    Posiciones (m) de n_stops paradas a ambos lados de las cuadras
+    Primero las cuadras recorridas por rutas (mezcladas), luego cuadras al azar
+    """
+    slots = np.concatenate([route_edges * 2, route_edges * 2 + 1])
+    rng.shuffle(slots)
+    slots = slots[:n_stops]
+    while len(slots) < n_stops:
+        # Cuadras al azar (hacia el este o el norte de una intersección), lado al azar
+        missing = n_stops - len(slots)
+        a = rng.integers(0, k, size=(missing * 2, 2))
+        b = a + _DIRECTIONS[rng.integers(0, 2, size=missing * 2)]
+        inside = (b < k).all(axis=1)
+        extra = _edge_key(a[inside], b[inside], k) * 2 + rng.integers(0, 2, size=int(inside.sum()))
+        extra = np.setdiff1d(np.unique(extra), slots)
+        rng.shuffle(extra)
+        slots = np.concatenate([slots, extra[:missing]])
+
+    edges, side = np.divmod(slots, 2)
+    a, b = _edge_nodes(edges, k)
+    a = a.astype(np.float64) * BLOCK_M
+    b = b.astype(np.float64) * BLOCK_M
+    along = rng.uniform(0.2, 0.8, size=(len(slots), 1))
+    pos = a + (b - a) * along
+    # Normal de la cuadra (a la izquierda de a→b) con signo según el lado
+    direction = (b - a) / BLOCK_M
+    normal = np.column_stack([-direction[:, 1], direction[:, 0]])
+    sign = np.where(side == 0, 1.0, -1.0)[:, None]
+    return pos + normal * sign * STOP_OFFSET_M
+
+def generate_city(out_dir, n_stops, n_trips, seed=0):
+    """
+    Genera una ciudad sintética en out_dir
+
+    Returns:
+        Diccionario con rutas de archivos y tamaños generados
+    """
+    out_dir = Path(out_dir)
+    gtfs_dir = out_dir / 'gtfs'
+    gtfs_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    n_routes = max(1, math.ceil(n_trips / TRIPS_PER_ROUTE))
+    k = grid_size_for(n_stops, n_routes)
+    origin = (k - 1) * BLOCK_M / 2
+
+    routes = []
+    trips = []
+    shape_rows_count = 0
+    route_edges = []
+
+    def shape_rows():
+        nonlocal shape_rows_count
+        trip_index = 0
+        for r in range(n_routes):
+            route_id = f'R-{r + 1:05d}'
+            nodes = random_walk(rng, k, int(rng.integers(*ROUTE_BLOCKS)))
+            route_edges.append(_edge_key(nodes[:-1], nodes[1:], k))
+            routes.append({
+                'route_id': route_id,
+                'agency_id': str(r % 37),
+                'route_short_name': route_id,
+                'route_long_name': f'Ruta sintética {r + 1}',
+                'route_color': '',
+                'route_type': 3
+            })
+            for direction in range(TRIPS_PER_ROUTE):
+                if trip_index >= n_trips:
+                    break
+                trip_id = str(30000000 + trip_index)
+                trip_index += 1
+                path = nodes if direction == 0 else nodes[::-1]
+                lon, lat = meters_to_lonlat(*(densify(path, origin).T))
+                trips.append({
+                    'trip_id': trip_id,
+                    'route_id': route_id,
+                    'service_id': 'Mo-Su',
+                    'shape_id': trip_id,
+                    'trip_headsign': 'Ida' if direction == 0 else 'Vuelta'
+                })
+                shape_rows_count += len(lon)
+                for seq, (pt_lat, pt_lon) in enumerate(zip(lat.tolist(), lon.tolist()), 1):
+                    yield (trip_id, pt_lat, pt_lon, seq)
+
+    write_table_file(gtfs_dir / 'shapes.txt', SHAPES_FIELDNAMES, shape_rows())
+    write_table_file(gtfs_dir / 'routes.txt', ROUTE_FIELDNAMES, (list(r.values()) for r in routes))
+    write_table_file(gtfs_dir / 'trips.txt', TRIP_FIELDNAMES, (list(t.values()) for t in trips))
+
+    # Paradas
+    stops_xy = place_stops(rng, np.unique(np.concatenate(route_edges)), k, n_stops)
+    lon, lat = meters_to_lonlat(stops_xy[:, 0] - origin, stops_xy[:, 1] - origin)
+    names = [f'SC-{i + 1}' for i in range(n_stops)]
+    # Algunos nombres repetidos, para ejercitar los sufijos de generate_stop_ids
+    n_dup = int(n_stops * DUPLICATE_NAME_RATE)
+    if n_dup and n_stops > 1:
+        dup_from = rng.choice(n_stops, size=n_dup, replace=False)
+        dup_to = rng.choice(n_stops, size=n_dup, replace=False)
+        for src, dst in zip(dup_from.tolist(), dup_to.tolist()):
+            names[dst] = names[src]
+    quadrant = (stops_xy[:, 0] > origin).astype(int) + 2 * (stops_xy[:, 1] > origin).astype(int)
+    districts = ['Distrito NO', 'Distrito NE', 'Distrito SO', 'Distrito SE']
+
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [pt_lon, pt_lat]},
+            'properties': {'nombre': name, 'distrito': districts[q]}
+        }
+        for pt_lon, pt_lat, name, q in zip(lon.tolist(), lat.tolist(), names, quadrant.tolist())
+    ]
+    geojson_file = out_dir / 'paraderos_consolidados.geojson'
+    with open(geojson_file, 'w', encoding='utf-8') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f, ensure_ascii=False)
+
+    stops, grupos, duplicados = build_stop_ids(features)
+    stops_file = out_dir / 'stops_with_ids_clean.json'
+    with open(stops_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            'total_stops': len(stops),
+            'unique_names': len(grupos),
+            'duplicated_names': len(duplicados),
+            'stops': stops.to_records()
+        }, f, ensure_ascii=False)
+
+    return {
+        'dir': str(out_dir),
+        'gtfs_dir': str(gtfs_dir),
+        'stops_geojson': str(geojson_file),
+        'stops_file': str(stops_file),
+        'stops': len(stops),
+        'trips': len(trips),
+        'routes': len(routes),
+        'shape_points': shape_rows_count,
+        'grid_side_km': round(k * BLOCK_M / 1000, 2),
+        'seed': seed
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera una ciudad sintética en los formatos de GTFSv2")
+    parser.add_argument('out_dir', type=Path)
+    parser.add_argument('--stops', type=int, default=2000)
+    parser.add_argument('--trips', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    info = generate_city(args.out_dir, args.stops, args.trips, args.seed)
+    print(f"✅ {info['stops']} paradas, {info['trips']} trips, {info['routes']} rutas, "
+          f"{info['shape_points']} puntos de shape ({info['grid_side_km']} km de lado) en {info['dir']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+"""Los módulos de GTFSv2 se importan como scripts sueltos (sin paquete)"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,47 @@
+"""Paridad exacta de project_points contra el camino original con shapely"""
+
+import numpy as np
+import pytest
+
+from geometry_kernel import check_parity, project_points, shapely_reference
+
+pytest.importorskip('shapely')
+
+SHAPES = {
+    # Vértices repetidos (segmentos de largo 0) al inicio, en medio y al final
+    'degenerate': [(0, 0), (0, 0), (4, 0), (4, 0), (4, 3), (8, 3), (8, 3)],
+    # Un solo punto repetido: toda la shape mide 0
+    'point': [(2, 2), (2, 2)],
+    # V simétrica: los puntos sobre el eje quedan a la misma distancia de los dos brazos
+    'tie': [(-4, 4), (0, 0), (4, 4)],
+    # Ida y vuelta sobre la misma recta: cada punto empata con el tramo de vuelta
+    'overlap': [(0, 0), (6, 0), (2, 0), (2, 5)],
+    # Anillo cerrado (primer y último vértice iguales)
+    'ring': [(0, 0), (5, 0), (5, 5), (0, 5), (0, 0)],
+}
+
+def grid_points(coords):
+    """Puntos de grilla alrededor de la shape: sobre vértices, sobre los tramos y más allá de los extremos"""
+    coords = np.asarray(coords, dtype=np.float64)
+    (x0, y0), (x1, y1) = coords.min(axis=0) - 3, coords.max(axis=0) + 3
+    xs, ys = np.meshgrid(np.arange(x0, x1 + 0.5, 0.5), np.arange(y0, y1 + 0.5, 0.5))
+    return np.column_stack([xs.ravel(), ys.ravel()])
+
+@pytest.mark.parametrize('name', sorted(SHAPES))
+def test_parity_on_synthetic_shapes(name):
+    coords = SHAPES[name]
+    points = grid_points(coords)
+    fast = project_points(points, coords)
+    ref = shapely_reference(points, coords)
+    for key in ('distance', 'segment', 'cross', 'along'):
+        np.testing.assert_array_equal(fast[key], ref[key], err_msg=f"{name}: {key}")
+
+def test_parity_on_random_shapes():
+    rng = np.random.default_rng(7)
+    for _ in range(20):
+        coords = np.cumsum(rng.normal(0, 50, size=(rng.integers(2, 30), 2)), axis=0)
+        # Algunos vértices repetidos
+        repeat = rng.integers(0, len(coords), size=2)
+        coords = np.insert(coords, repeat, coords[repeat], axis=0).tolist()
+        points = np.asarray(coords)[rng.integers(0, len(coords), 40)] + rng.normal(0, 80, size=(40, 2))
+        assert check_parity(points, coords) == []
@@ -0,0 +1,14 @@
+"""GTFSZipWriter: el nivel de compresión llega a cada entrada del zip"""
+
+from gtfs_writer import GTFSZipWriter
+
+def test_compresslevel_applies_to_entries(tmp_path):
+    rows = [(f"T{i // 50}", f"{6 + i % 18:02d}:{i % 60:02d}:00", f"S{i * 31 % 2000}", i % 50) for i in range(50_000)]
+    sizes = {}
+    for level in (1, 9):
+        path = tmp_path / f"feed_{level}.zip"
+        with GTFSZipWriter(path, compresslevel=level) as feed_zip:
+            assert feed_zip.write_table('stop_times.txt', ['trip_id', 'arrival_time', 'stop_id', 'stop_sequence'],
+                                        rows) == len(rows)
+        sizes[level] = path.stat().st_size
+    assert sizes[1] > sizes[9]
@@ -0,0 +1,134 @@
+"""
+RAPTOR contra un connection scan de referencia sobre feeds sintéticos
+El connection scan recorre todas las conexiones (tramo parada -> parada de
+un trip) por hora de salida, con las mismas reglas que el planificador: se
+camina un solo tramo, desde el origen o desde una bajada del bus.
+"""
+
+import csv
+
+import numpy as np
+import pytest
+
+from gtfs_time import format_gtfs_time
+from raptor import UNREACHED, RaptorTimetable
+
+def write_feed(feed_dir, stop_ids, trips, transfers):
+    """
+    trips: dict trip_id -> (route_id, [(stop_id, llegada, salida), ...]) en segundos
+    transfers: lista de (from_stop_id, to_stop_id, segundos)
+    """
+    def write(name, fieldnames, rows):
+        with open(feed_dir / name, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(fieldnames)
+            writer.writerows(rows)
+
+    write('stops.txt', ['stop_id', 'stop_name', 'stop_lat', 'stop_lon'],
+          [(stop_id, stop_id, '-8.1', '-79.0') for stop_id in stop_ids])
+    write('trips.txt', ['route_id', 'service_id', 'trip_id'],
+          [(route_id, 'WD', trip_id) for trip_id, (route_id, _) in trips.items()])
+    write('stop_times.txt', ['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence'],
+          [(trip_id, format_gtfs_time(arrival), format_gtfs_time(departure), stop_id, i + 1)
+           for trip_id, (_, stops) in trips.items()
+           for i, (stop_id, arrival, departure) in enumerate(stops)])
+    write('transfers.txt', ['from_stop_id', 'to_stop_id', 'transfer_type', 'min_transfer_time'],
+          [(a, b, 2, secs) for a, b, secs in transfers])
+    return RaptorTimetable.compile(feed_dir)
+
+def connection_scan(tt, origin, departure):
+    """Llegadas más tempranas (array por parada) desde origin a la hora departure"""
+    connections = []
+    for p in range(tt.n_patterns):
+        first, last = tt.pattern_offsets[p], tt.pattern_offsets[p + 1]
+        n_trips = tt.pattern_trip_offsets[p + 1] - tt.pattern_trip_offsets[p]
+        block = tt.pattern_time_offsets[p]
+        for trip in range(n_trips):
+            for i in range(last - first - 1):
+                connections.append((
+                    int(tt.departures[block + i * n_trips + trip]),
+                    int(tt.arrivals[block + (i + 1) * n_trips + trip]),
+                    int(tt.pattern_stops[first + i]), int(tt.pattern_stops[first + i + 1]),
+                    bool(tt.pattern_board[first + i]), bool(tt.pattern_alight[first + i + 1]),
+                    (p, trip)
+                ))
+    connections.sort(key=lambda connection: connection[:2])
+
+    arrival = np.full(len(tt.stop_ids), UNREACHED, dtype=np.int64)
+    transit = arrival.copy()
+
+    def walk(stop, time):
+        for edge in range(tt.transfer_offsets[stop], tt.transfer_offsets[stop + 1]):
+            to = tt.transfer_to[edge]
+            arrival[to] = min(arrival[to], time + int(tt.transfer_secs[edge]))
+
+    s = tt.stop_index[origin]
+    arrival[s] = transit[s] = departure
+    walk(s, departure)
+    riding = set()
+    for dep, arr, a, b, can_board, can_alight, trip in connections:
+        if trip not in riding and not (can_board and arrival[a] <= dep):
+            continue
+        riding.add(trip)
+        if can_alight and arr < transit[b]:
+            transit[b] = arr
+            arrival[b] = min(arrival[b], arr)
+            walk(b, arr)
+    return arrival
+
+def check_journey(result, stop_id):
+    """El itinerario encadena los tramos y termina a la hora de llegada"""
+    legs = result.journey(stop_id)
+    clock = result.departure
+    for leg, previous in zip(legs, [None] + legs[:-1]):
+        assert leg['departure'] >= clock
+        assert leg['arrival'] >= leg['departure']
+        if previous is not None:
+            assert leg['from_stop'] == previous['to_stop']
+            assert not (leg['mode'] == previous['mode'] == 'walk')
+        clock = leg['arrival']
+    assert clock == result.arrival(stop_id)
+
+def test_walk_from_transit_arrival_later_than_a_walk(tmp_path):
+    """
+    A llega a P antes a pie (08:01) que en bus (08:10); la caminata P -> Q solo
+    sale de la llegada en bus, así que esa llegada no se puede descartar
+    """
+    t = 8 * 3600
+    tt = write_feed(tmp_path, ['A', 'X', 'P', 'Q', 'D'], {
+        'bus_ax': ('R1', [('A', t, t), ('X', t + 300, t + 300)]),
+        'bus_xp': ('R2', [('X', t + 360, t + 360), ('P', t + 600, t + 600)]),
+        'bus_qd': ('R3', [('Q', t + 720, t + 720), ('D', t + 1200, t + 1200)]),
+    }, [('A', 'P', 60), ('P', 'Q', 60)])
+
+    result = tt.route('A', t, target='D')
+    assert result.arrival('P') == t + 60
+    assert result.arrival('Q') == t + 660
+    assert result.arrival('D') == t + 1200
+    assert [leg['mode'] for leg in result.journey('D')] == ['transit', 'transit', 'walk', 'transit']
+    check_journey(result, 'D')
+
+@pytest.mark.parametrize('seed', range(6))
+def test_matches_connection_scan(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    stop_ids = [f"S{i}" for i in range(30)]
+    trips = {}
+    for route in range(8):
+        path = rng.choice(len(stop_ids), size=rng.integers(4, 10), replace=False)
+        runs = np.cumsum(rng.integers(60, 400, size=len(path)))
+        dwell = rng.integers(0, 40, size=len(path))
+        for start in range(6 * 3600, 8 * 3600, int(rng.integers(600, 1500))):
+            trips[f"T{route}_{start}"] = (f"R{route}", [
+                (stop_ids[s], start + int(run), start + int(run) + int(wait))
+                for s, run, wait in zip(path, runs - runs[0], dwell)
+            ])
+    pairs = rng.choice(len(stop_ids), size=(60, 2))
+    transfers = [(stop_ids[a], stop_ids[b], int(rng.integers(60, 600))) for a, b in pairs if a != b]
+    tt = write_feed(tmp_path, stop_ids, trips, transfers)
+
+    for origin in stop_ids:
+        departure = int(rng.integers(6 * 3600, 7 * 3600))
+        result = tt.route(origin, departure, max_transfers=len(stop_ids))
+        np.testing.assert_array_equal(result.earliest_arrivals(), connection_scan(tt, origin, departure))
+        for s in np.flatnonzero(result.earliest_arrivals() < UNREACHED).tolist():
+            check_journey(result, tt.stop_ids[s])
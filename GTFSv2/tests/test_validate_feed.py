@@ -0,0 +1,46 @@
+"""Valores ilegibles en los campos que leen los chequeos de validate_feed"""
+
+from validate_feed import ERROR, validate_feed
+
+STOPS = """stop_id,stop_name,stop_lat,stop_lon
+A,A,-8.10,-79.00
+B,B,-8.11,-79.01
+C,C,nan,-79.02
+"""
+
+TRIPS = """route_id,service_id,trip_id
+R1,WD,T1
+"""
+
+def write_feed(feed_dir, stop_times):
+    (feed_dir / 'stops.txt').write_text(STOPS, encoding='utf-8')
+    (feed_dir / 'trips.txt').write_text(TRIPS, encoding='utf-8')
+    (feed_dir / 'stop_times.txt').write_text(
+        "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n" + stop_times, encoding='utf-8')
+    return feed_dir
+
+def test_malformed_values_are_reported(tmp_path):
+    feed = write_feed(tmp_path, (
+        "T1,06:00:00,06:00:00,A,1\n"
+        "T1,06:05:00,06:05:00,B,x3\n"
+        "T1,06:10:00,bad,C,3\n"
+        "T1,06:00:99,06:12:00,A,4\n"
+    ))
+    report = validate_feed(feed)
+    found = {(n['code'], n['file'], n['row'], n['value']) for n in report.notices}
+    assert ('invalid_integer', 'stop_times.txt', 2, 'x3') in found
+    assert ('invalid_time', 'stop_times.txt', 3, 'bad') in found
+    assert ('invalid_time', 'stop_times.txt', 4, '06:00:99') in found
+    assert ('invalid_float', 'stops.txt', 3, 'nan') in found
+    assert all(n['severity'] == ERROR for n in report.notices)
+    # Las filas ilegibles no entran en el chequeo de orden: 06:00:99 quedaría antes de 06:10
+    assert not any(n['code'].startswith('stop_time_with') for n in report.notices)
+
+def test_quoted_table_uses_the_same_checks(tmp_path):
+    feed = write_feed(tmp_path, (
+        '"T1","06:00:00","06:00:00","A","1"\n'
+        '"T1","6:05:00","06:05:00","B","02"\n'
+        '"T1","06:04:00","06:04:00","A","+3"\n'
+    ))
+    codes = [(n['code'], n['row']) for n in validate_feed(feed).notices if n['file'] == 'stop_times.txt']
+    assert codes == [('invalid_integer', 3)]
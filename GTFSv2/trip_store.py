@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Almacén único de secuencias de paradas por trip
+Reemplaza los 210 archivos trip_*_stops.json por un solo archivo columnar:
+diccionario de stop_ids + offsets por trip sobre un array plano de índices,
+con la distancia a lo largo de la shape (metros) de cada parada, calculada una
+sola vez en la asignación
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+from array_bundle import read_bundle, write_bundle
+
+STORE_VERSION = 2
+# La versión 1 no guardaba distance_along (se recalcula desde la shape)
+READABLE_VERSIONS = (1, 2)
+DEFAULT_FILENAME = 'trip_sequences.bin'
+
+def default_store_path(base_path=None):
+    return Path(base_path or Path(__file__).parent) / DEFAULT_FILENAME
+
+def legacy_sort_key(trip_id):
+    """Orden de sorted(glob('trip_*.json')), que usan las etapas siguientes"""
+    return f'trip_{trip_id}_stops.json'
+
+class TripSequenceStore:
+    """
+    Secuencias de paradas de todos los trips
+    La secuencia del trip i es stop_ids[stop_index[offsets[i]:offsets[i+1]]] y
+    sus distancias a lo largo de la shape distance_along[offsets[i]:offsets[i+1]]
+    (None si el store viene de una versión sin distancias)
+    """
+
+    def __init__(self, trip_ids, route_ids, shape_ids, stop_ids, offsets, stop_index, distance_along=None):
+        self.trip_ids = list(trip_ids)
+        self.route_ids = list(route_ids)
+        self.shape_ids = list(shape_ids)
+        self.stop_ids = list(stop_ids)
+        self.offsets = offsets
+        self.stop_index = stop_index
+        self.distance_along = distance_along
+        self._index = {trip_id: i for i, trip_id in enumerate(self.trip_ids)}
+
+    @classmethod
+    def open(cls, path):
+        """Abre el store con mmap (una sola lectura de cabecera)"""
+        arrays, meta = read_bundle(path)
+        if meta.get('version') not in READABLE_VERSIONS:
+            raise ValueError(f"{path}: versión de store no soportada")
+        return cls(meta['trip_ids'], meta['route_ids'], meta['shape_ids'], meta['stop_ids'],
+                   arrays['offsets'], arrays['stop_index'], arrays.get('distance_along'))
+
+    @classmethod
+    def from_trip_files(cls, trip_files):
+        """Construye el store desde archivos trip_*_stops.json (formato anterior)"""
+        writer = TripSequenceWriter()
+        for trip_file in trip_files:
+            with open(trip_file, 'r', encoding='utf-8') as f:
+                trip_data = json.load(f)
+            writer.add(
+                trip_data['trip_id'],
+                trip_data['route_id'],
+                trip_data['shape_id'],
+                [s['stop_id'] for s in trip_data['stops_sequence']]
+            )
+        return writer.build()
+
+    def __len__(self):
+        return len(self.trip_ids)
+
+    def __contains__(self, trip_id):
+        return trip_id in self._index
+
+    def stops_of(self, trip_id):
+        """Lista de stop_ids del trip en orden de secuencia (None si no existe)"""
+        i = self._index.get(trip_id)
+        if i is None:
+            return None
+        idx = self.stop_index[self.offsets[i]:self.offsets[i + 1]]
+        return [self.stop_ids[j] for j in idx.tolist()]
+
+    def distances_of(self, trip_id):
+        """Distancias a lo largo de la shape (metros) del trip, o None si no hay"""
+        i = self._index.get(trip_id)
+        if i is None or self.distance_along is None:
+            return None
+        return self.distance_along[self.offsets[i]:self.offsets[i + 1]]
+
+    def get(self, trip_id):
+        """Secuencia del trip con la misma estructura que trip_*_stops.json"""
+        i = self._index.get(trip_id)
+        if i is None:
+            return None
+        return self._trip_dict(i)
+
+    def _trip_dict(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        stops = [self.stop_ids[j] for j in self.stop_index[start:end].tolist()]
+        stops_sequence = [
+            {'stop_sequence': seq, 'stop_id': stop_id}
+            for seq, stop_id in enumerate(stops, 1)
+        ]
+        if self.distance_along is not None:
+            for stop, distance_along in zip(stops_sequence, self.distance_along[start:end].tolist()):
+                stop['distance_along'] = distance_along
+        return {
+            'trip_id': self.trip_ids[i],
+            'route_id': self.route_ids[i],
+            'shape_id': self.shape_ids[i],
+            'total_stops': len(stops),
+            'stops_sequence': stops_sequence
+        }
+
+    def save(self, path):
+        """Escribe el store en path (formato de array_bundle)"""
+        arrays = {
+            'offsets': self.offsets,
+            'stop_index': self.stop_index
+        }
+        if self.distance_along is not None:
+            arrays['distance_along'] = self.distance_along
+        write_bundle(path, arrays, meta={
+            'version': STORE_VERSION if self.distance_along is not None else 1,
+            'trip_ids': self.trip_ids,
+            'route_ids': self.route_ids,
+            'shape_ids': self.shape_ids,
+            'stop_ids': self.stop_ids
+        })
+        return self
+
+    def iter_trips(self):
+        """Itera los trips (dicts como trip_*_stops.json) en el orden guardado"""
+        for i in range(len(self.trip_ids)):
+            yield self._trip_dict(i)
+
+class TripSequenceWriter:
+    """Acumula secuencias y las escribe en un solo archivo"""
+
+    def __init__(self):
+        self.trips = []
+
+    def add(self, trip_id, route_id, shape_id, stop_ids, distances=None):
+        """distances: distancia a lo largo de la shape (metros) de cada parada"""
+        self.trips.append((trip_id, route_id, shape_id, list(stop_ids),
+                           None if distances is None else list(distances)))
+
+    def build(self):
+        """
+        Construye el TripSequenceStore en memoria (orden de archivos legados)
+        Las distancias se guardan solo si todos los trips las tienen
+        """
+        trips = sorted(self.trips, key=lambda t: legacy_sort_key(t[0]))
+        with_distances = all(t[4] is not None for t in trips)
+
+        stop_ids = []
+        stop_pos = {}
+        offsets = np.zeros(len(trips) + 1, dtype=np.int64)
+        flat = []
+        distances = []
+        for i, (_, _, _, sequence, trip_distances) in enumerate(trips):
+            for stop_id in sequence:
+                j = stop_pos.get(stop_id)
+                if j is None:
+                    j = stop_pos[stop_id] = len(stop_ids)
+                    stop_ids.append(stop_id)
+                flat.append(j)
+            if with_distances:
+                distances.extend(trip_distances)
+            offsets[i + 1] = len(flat)
+
+        return TripSequenceStore(
+            [t[0] for t in trips],
+            [t[1] for t in trips],
+            [t[2] for t in trips],
+            stop_ids,
+            offsets,
+            np.array(flat, dtype=np.int32),
+            np.array(distances, dtype=np.float64) if with_distances else None
+        )
+
+    def save(self, path):
+        """Escribe el store y lo devuelve"""
+        return self.build().save(path)
+
+def load_trip_sequences(base_path=None):
+    """
+    Abre trip_sequences.bin; si no existe pero hay trip_*_stops.json de una
+    corrida anterior, los migra a un store en memoria
+    """
+    base_path = Path(base_path or Path(__file__).parent)
+    path = default_store_path(base_path)
+    if path.exists():
+        return TripSequenceStore.open(path)
+
+    trip_files = sorted(base_path.glob('trip_*.json'))
+    if trip_files:
+        return TripSequenceStore.from_trip_files(trip_files)
+
+    raise FileNotFoundError(f"No se encontró {path.name}; ejecutar assign_stops_to_trips.py")
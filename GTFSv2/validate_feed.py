@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+"""
+Validador rápido del feed GTFS (en proceso, sin el validador JVM)
+Cubre los avisos que el validador de MobilityData nos reportó
+(ANALISIS_VALIDACION_GTFS.md), con los mismos códigos y severidades:
+
+- invalid_row_length (ERROR): fila con otra cantidad de campos que el
+  encabezado (no entra en los demás chequeos)
+- empty_row (WARNING): fila vacía (se salta)
+- invalid_integer / invalid_time / invalid_float (ERROR): stop_sequence,
+  arrival_time / departure_time (minutos y segundos < 60) o stop_lat /
+  stop_lon que no se pueden leer; la fila queda fuera de los chequeos de
+  orden y velocidad
+- duplicate_key (ERROR): clave primaria repetida en una tabla
+- foreign_key_violation (ERROR): referencia a un id que no existe
+- stop_time_with_departure_before_arrival_time (ERROR)
+- stop_time_with_arrival_before_previous_departure_time (ERROR): tiempos
+  que retroceden dentro de un trip (ordenado por stop_sequence)
+- fast_travel_between_consecutive_stops (WARNING): velocidad entre paradas
+  consecutivas (haversine) sobre el umbral; los tiempos se toman con
+  precisión de minuto (un tramo de 0 s cuenta como 60 s)
+
+Las tablas se leen por columnas codificadas por diccionario (textos
+distintos + un código por fila) y cada chequeo es vectorizado sobre los
+códigos (lexsort, isin sobre los textos distintos), así el feed expandido
+se valida en segundos. Acepta el directorio gtfs_feed/ o el zip. Con ERROR la salida es
+1, para usarlo como compuerta antes de empaquetar (run_pipeline.py lo corre
+al final).
+"""
+
+import argparse
+import csv
+import io
+import json
+import sys
+import zipfile
+from pathlib import Path
+
+import numpy as np
+
+from gtfs_time import parse_gtfs_time
+from instrumentation import PROFILER, add_profile_args, configure_from_args, finish_profile
+
+ERROR, WARNING = 'ERROR', 'WARNING'
+MAX_SPEED_KMH = 150.0  # umbral de MobilityData para buses (route_type 3)
+MIN_ELAPSED_SECONDS = 60
+EARTH_RADIUS_M = 6371008.8
+
+# Claves primarias por tabla
+PRIMARY_KEYS = {
+    'agency.txt': ('agency_id',),
+    'stops.txt': ('stop_id',),
+    'routes.txt': ('route_id',),
+    'trips.txt': ('trip_id',),
+    'stop_times.txt': ('trip_id', 'stop_sequence'),
+    'calendar.txt': ('service_id',),
+    'shapes.txt': ('shape_id', 'shape_pt_sequence'),
+    'frequencies.txt': ('trip_id', 'start_time'),
+    'transfers.txt': ('from_stop_id', 'to_stop_id'),
+}
+
+# (tabla, columna) -> (tabla, columna) referenciada; los valores vacíos no se revisan
+FOREIGN_KEYS = [
+    ('routes.txt', 'agency_id', 'agency.txt', 'agency_id'),
+    ('trips.txt', 'route_id', 'routes.txt', 'route_id'),
+    ('trips.txt', 'service_id', 'calendar.txt', 'service_id'),
+    ('trips.txt', 'shape_id', 'shapes.txt', 'shape_id'),
+    ('stop_times.txt', 'trip_id', 'trips.txt', 'trip_id'),
+    ('stop_times.txt', 'stop_id', 'stops.txt', 'stop_id'),
+    ('stops.txt', 'parent_station', 'stops.txt', 'stop_id'),
+    ('frequencies.txt', 'trip_id', 'trips.txt', 'trip_id'),
+    ('transfers.txt', 'from_stop_id', 'stops.txt', 'stop_id'),
+    ('transfers.txt', 'to_stop_id', 'stops.txt', 'stop_id'),
+]
+
+class Column:
+    """
+    Columna codificada por diccionario: values son los textos distintos y
+    codes el índice en values de cada fila. Los chequeos comparan códigos y
+    parsean cada texto distinto una sola vez
+    """
+
+    def __init__(self, values, codes):
+        self.values = values
+        self.codes = codes
+        self._parsed = {}
+
+    @classmethod
+    def encode(cls, texts):
+        index = {}
+        codes = np.fromiter((index.setdefault(text, len(index)) for text in texts), dtype=np.int64,
+                            count=len(texts))
+        return cls(np.array(list(index), dtype=str), codes)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def text(self, rows):
+        return self.values[self.codes[rows]]
+
+    def parse(self, func, dtype):
+        """
+        func aplicada a cada texto distinto, expandida a las filas: (valores,
+        máscara de filas con un texto que func rechaza con ValueError)
+        """
+        parsed = self._parsed.get(func)
+        if parsed is None:
+            values = np.zeros(len(self.values), dtype=dtype)
+            invalid = np.zeros(len(self.values), dtype=bool)
+            for i, text in enumerate(self.values.tolist()):
+                try:
+                    values[i] = func(text)
+                except (ValueError, OverflowError):
+                    invalid[i] = True
+            parsed = self._parsed[func] = values, invalid
+        values, invalid = parsed
+        return values[self.codes], invalid[self.codes]
+
+    def row_of(self, texts):
+        """Última fila con cada texto (-1 si no está): para columnas de ids"""
+        row_of_value = np.full(len(self.values), -1, dtype=np.int64)
+        row_of_value[self.codes] = np.arange(len(self.codes))
+        position = {text: i for i, text in enumerate(self.values.tolist())}
+        found = np.array([position.get(text, -1) for text in texts.tolist()], dtype=np.int64)
+        return np.where(found >= 0, row_of_value[found], -1)
+
+class Table(dict):
+    """
+    Columnas de una tabla (nombre -> Column) más rows, la fila del archivo de
+    cada posición (1 = primera después del encabezado, contando las vacías y
+    las descartadas), e issues: (código, severidad, filas) de las filas
+    vacías o de largo irregular
+    """
+
+    def __init__(self, columns=(), rows=None, issues=()):
+        super().__init__(columns)
+        self.rows = np.arange(1, table_length(self) + 1) if rows is None else rows
+        self.issues = list(issues)
+
+def _split_columns(data):
+    """
+    Camino rápido para tablas sin comillas: separadores ubicados sobre los
+    bytes con NumPy y cada columna como array de ancho fijo codificado con
+    np.unique. None si la tabla tiene comillas, filas vacías o de largo irregular
+    """
+    if b'"' in data:
+        return None
+    data = data.replace(b'\r\n', b'\n')
+    if not data.endswith(b'\n'):
+        data += b'\n'
+    if b'\n\n' in data:
+        return None
+    header_end = data.index(b'\n')
+    header = data[:header_end].decode('utf-8').split(',')
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    body = buffer[header_end + 1:]
+    separators = np.flatnonzero((body == ord(',')) | (body == ord('\n')))
+    k = len(header)
+    if not len(separators) or len(separators) % k or not (body[separators[k - 1::k]] == ord('\n')).all():
+        return None
+    ends = separators.reshape(-1, k)
+    starts = np.concatenate([[0], separators[:-1] + 1]).reshape(-1, k)
+
+    columns = {}
+    for j, name in enumerate(header):
+        start, length = starts[:, j], ends[:, j] - starts[:, j]
+        width = max(int(length.max(initial=0)), 1)
+        # Hasta 8 bytes el campo cabe en un uint64 (np.unique sobre enteros es más rápido)
+        if width <= 8:
+            width = 8
+        offset = np.arange(width)
+        index = np.minimum(start[:, None] + offset, len(body) - 1)
+        fixed = np.where(offset < length[:, None], body[index], 0).astype(np.uint8)
+        keys = fixed.view(np.uint64 if width == 8 else f'S{width}').ravel()
+        values, codes = np.unique(keys, return_inverse=True)
+        columns[name] = Column(np.char.decode(values.view(f'S{width}'), 'utf-8'), codes.ravel())
+    return Table(columns)
+
+def _read_columns(data):
+    """Tabla CSV (bytes) como Table; una tabla con encabezado siempre conserva sus columnas"""
+    if data.startswith(b'\xef\xbb\xbf'):
+        data = data[3:]
+    if not data.strip():
+        return Table()
+    columns = _split_columns(data)
+    if columns is not None:
+        return columns
+    reader = csv.reader(io.StringIO(data.decode('utf-8'), newline=''))
+    header = next(reader, [])
+    rows, kept, empty, ragged = [], [], [], []
+    for number, row in enumerate(reader, 1):
+        if not any(field.strip() for field in row):
+            empty.append(number)
+        elif len(row) != len(header):
+            ragged.append(number)
+        else:
+            rows.append(row)
+            kept.append(number)
+    columns = {name: Column.encode([row[j] for row in rows]) for j, name in enumerate(header)}
+    issues = [('empty_row', WARNING, empty), ('invalid_row_length', ERROR, ragged)]
+    return Table(columns, np.array(kept, dtype=np.int64), [issue for issue in issues if issue[2]])
+
+def load_tables(feed_path):
+    """Tablas del feed (directorio o zip) por nombre de archivo; solo las presentes"""
+    feed_path = Path(feed_path)
+    tables = {}
+    if feed_path.suffix == '.zip':
+        with zipfile.ZipFile(feed_path) as archive:
+            for name in archive.namelist():
+                if name.endswith('.txt'):
+                    tables[name] = _read_columns(archive.read(name))
+    else:
+        for path in sorted(feed_path.glob('*.txt')):
+            tables[path.name] = _read_columns(path.read_bytes())
+    for name, columns in tables.items():
+        PROFILER.count('rows_read', table_length(columns))
+    return tables
+
+def table_length(columns):
+    return len(next(iter(columns.values()))) if columns else 0
+
+def _parse_integer(text):
+    """Entero no negativo (solo dígitos)"""
+    text = text.strip()
+    if not (text.isascii() and text.isdigit()):
+        raise ValueError(f"entero inválido: {text!r}")
+    return int(text)
+
+def _parse_time(text):
+    """'HH:MM:SS' (o H:MM:SS) a segundos, -1 si está vacío"""
+    text = text.strip()
+    if not text:
+        return -1
+    parts = text.split(':')
+    if (len(parts) != 3 or not all(part.isascii() and part.isdigit() for part in parts)
+            or len(parts[1]) != 2 or len(parts[2]) != 2 or int(parts[1]) > 59 or int(parts[2]) > 59):
+        raise ValueError(f"tiempo inválido: {text!r}")
+    return parse_gtfs_time(text)
+
+def _parse_float(text):
+    """Número finito"""
+    value = float(text)
+    if not np.isfinite(value):
+        raise ValueError(f"número inválido: {text!r}")
+    return value
+
+# Campos que leen los chequeos: (tabla, columna, tipo); tipo -> (parser, dtype)
+FIELD_FORMATS = [
+    ('stop_times.txt', 'stop_sequence', 'integer'),
+    ('stop_times.txt', 'arrival_time', 'time'),
+    ('stop_times.txt', 'departure_time', 'time'),
+    ('stops.txt', 'stop_lat', 'float'),
+    ('stops.txt', 'stop_lon', 'float'),
+]
+PARSERS = {
+    'integer': (_parse_integer, np.int64),
+    'time': (_parse_time, np.int64),
+    'float': (_parse_float, np.float64),
+}
+
+def parse_field(table, name, kind):
+    """(valores, máscara de inválidos) de la columna name leída como kind"""
+    return table[name].parse(*PARSERS[kind])
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Distancia en metros entre pares de puntos (arrays en grados)"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+class ValidationReport:
+    """Avisos del validador: dicts con code, severity, file, row y detalles"""
+
+    def __init__(self):
+        self.notices = []
+
+    def add(self, code, severity, file, rows, **details):
+        """Un aviso por fila (rows: filas de datos, 1 = primera después del encabezado)"""
+        # En el orden del archivo; detalles escalares (mismo valor en todos) o alineados con rows
+        order = np.argsort(rows, kind='stable')
+        rows = np.asarray(rows)[order].tolist()
+        columns = {key: np.broadcast_to(np.asarray(value), order.shape)[order].tolist()
+                   for key, value in details.items()}
+        for i, row in enumerate(rows):
+            notice = {'code': code, 'severity': severity, 'file': file, 'row': row}
+            notice.update((key, value[i]) for key, value in columns.items())
+            self.notices.append(notice)
+        PROFILER.count(code, len(rows))
+
+    @property
+    def errors(self):
+        return [notice for notice in self.notices if notice['severity'] == ERROR]
+
+    @property
+    def warnings(self):
+        return [notice for notice in self.notices if notice['severity'] == WARNING]
+
+    def summary(self):
+        """(código, severidad) -> cantidad, errores primero"""
+        counts = {}
+        for notice in self.notices:
+            key = (notice['code'], notice['severity'])
+            counts[key] = counts.get(key, 0) + 1
+        return dict(sorted(counts.items(), key=lambda item: (item[0][1] != ERROR, item[0][0])))
+
+    def to_json(self):
+        return {
+            'errors': len(self.errors),
+            'warnings': len(self.warnings),
+            'summary': [{'code': code, 'severity': severity, 'count': count}
+                        for (code, severity), count in self.summary().items()],
+            'notices': self.notices
+        }
+
+def check_rows(tables, report):
+    """Filas vacías y de largo irregular encontradas al leer las tablas"""
+    for name, table in tables.items():
+        for code, severity, rows in table.issues:
+            report.add(code, severity, name, rows)
+
+def check_field_formats(tables, report):
+    """Valores que no se pueden leer en los campos de FIELD_FORMATS"""
+    for name, column, kind in FIELD_FORMATS:
+        table = tables.get(name)
+        if not table or column not in table:
+            continue
+        _, invalid = parse_field(table, column, kind)
+        rows = np.flatnonzero(invalid)
+        if len(rows):
+            report.add(f'invalid_{kind}', ERROR, name, table.rows[rows], field=column,
+                       value=table[column].text(rows))
+
+def check_duplicate_keys(tables, report):
+    for name, key_columns in PRIMARY_KEYS.items():
+        columns = tables.get(name)
+        if not columns or any(column not in columns for column in key_columns):
+            continue
+        # Clave compuesta como un entero por fila (códigos de cada columna)
+        combined = np.zeros(table_length(columns), dtype=np.int64)
+        for column in key_columns:
+            combined = combined * len(columns[column].values) + columns[column].codes
+        order = np.argsort(combined, kind='stable')
+        repeated = np.flatnonzero(combined[order][1:] == combined[order][:-1])
+        first, duplicate = order[repeated], order[repeated + 1]
+        if len(duplicate):
+            value = columns[key_columns[0]].text(duplicate)
+            for column in key_columns[1:]:
+                value = np.char.add(np.char.add(value, ' / '), columns[column].text(duplicate))
+            report.add('duplicate_key', ERROR, name, columns.rows[duplicate], field=', '.join(key_columns),
+                       value=value, first_row=columns.rows[first])
+
+def check_foreign_keys(tables, report):
+    for child, column, parent, parent_column in FOREIGN_KEYS:
+        if child not in tables or parent not in tables:
+            continue
+        values = tables[child].get(column)
+        parent_values = tables[parent].get(parent_column)
+        if values is None or parent_values is None:
+            continue
+        # Basta con revisar los textos distintos
+        dangling = (values.values != '') & ~np.isin(values.values, parent_values.values)
+        missing = np.flatnonzero(dangling[values.codes])
+        if len(missing):
+            report.add('foreign_key_violation', ERROR, child, tables[child].rows[missing], field=column,
+                       value=values.text(missing), parent=f"{parent}:{parent_column}")
+
+class OrderedStopTimes:
+    """
+    stop_times ordenado por trip y stop_sequence (order: filas originales);
+    las filas con stop_sequence o tiempos ilegibles quedan afuera
+    """
+
+    def __init__(self, stop_times):
+        self.table = stop_times
+        sequence, invalid = parse_field(stop_times, 'stop_sequence', 'integer')
+        arrival, invalid_arrival = parse_field(stop_times, 'arrival_time', 'time')
+        departure, invalid_departure = parse_field(stop_times, 'departure_time', 'time')
+        valid = np.flatnonzero(~(invalid | invalid_arrival | invalid_departure))
+        trip = stop_times['trip_id'].codes
+        self.order = valid[np.lexsort((sequence[valid], trip[valid]))]
+        self.trip = trip[self.order]
+        self.arrival = arrival[self.order]
+        self.departure = departure[self.order]
+
+    def __len__(self):
+        return len(self.order)
+
+    def text(self, column, positions):
+        """Textos de column en las posiciones dadas (del orden por trip)"""
+        return self.table[column].text(self.order[positions])
+
+    def file_rows(self, positions):
+        """Filas del archivo de las posiciones dadas (del orden por trip)"""
+        return self.table.rows[self.order[positions]]
+
+def check_stop_time_order(ordered, report):
+    arrival, departure, trip = ordered.arrival, ordered.departure, ordered.trip
+    inverted = np.flatnonzero((arrival >= 0) & (departure >= 0) & (departure < arrival))
+    report.add('stop_time_with_departure_before_arrival_time', ERROR, 'stop_times.txt',
+               ordered.file_rows(inverted), trip_id=ordered.text('trip_id', inverted),
+               stop_sequence=ordered.text('stop_sequence', inverted))
+
+    # Último tiempo conocido de cada trip (los vacíos, sin timepoint, se saltan)
+    departure_known = np.where(departure >= 0, departure, arrival)
+    last_known = np.where(departure_known >= 0, np.arange(len(ordered)), -1)
+    np.maximum.accumulate(last_known, out=last_known)
+    previous = np.concatenate([[-1], last_known[:-1]])
+    valid = (previous >= 0) & (arrival >= 0)
+    valid[valid] &= trip[previous[valid]] == trip[valid]
+    backwards = np.flatnonzero(valid)
+    backwards = backwards[arrival[backwards] < departure_known[previous[backwards]]]
+    report.add('stop_time_with_arrival_before_previous_departure_time', ERROR, 'stop_times.txt',
+               ordered.file_rows(backwards), trip_id=ordered.text('trip_id', backwards),
+               stop_sequence=ordered.text('stop_sequence', backwards))
+
+def check_travel_speed(ordered, stops, report, max_speed_kmh=MAX_SPEED_KMH):
+    # Fila de stops.txt de cada texto distinto de stop_id en stop_times
+    stop_id = ordered.table['stop_id']
+    stop = stops['stop_id'].row_of(stop_id.values)[stop_id.codes[ordered.order]]
+    lat, invalid_lat = parse_field(stops, 'stop_lat', 'float')
+    lon, invalid_lon = parse_field(stops, 'stop_lon', 'float')
+    # Paradas sin coordenadas legibles: como si no existieran
+    stop[stop >= 0] = np.where((invalid_lat | invalid_lon)[stop[stop >= 0]], -1, stop[stop >= 0])
+    arrival, departure, trip = ordered.arrival, ordered.departure, ordered.trip
+
+    # Pares consecutivos del mismo trip con ambas paradas y tiempos conocidos
+    a, b = np.arange(len(ordered) - 1), np.arange(1, len(ordered))
+    pair = (trip[a] == trip[b]) & (stop[a] >= 0) & (stop[b] >= 0) & (departure[a] >= 0) & (arrival[b] >= 0)
+    a, b = a[pair], b[pair]
+    distance = haversine(lat[stop[a]], lon[stop[a]], lat[stop[b]], lon[stop[b]])
+    elapsed = np.maximum(arrival[b] - departure[a], MIN_ELAPSED_SECONDS)
+    speed = distance / elapsed * 3.6
+    PROFILER.count('stop_pairs_checked', len(a))
+
+    fast = np.flatnonzero(speed > max_speed_kmh)
+    report.add('fast_travel_between_consecutive_stops', WARNING, 'stop_times.txt', ordered.file_rows(b[fast]),
+               trip_id=ordered.text('trip_id', b[fast]), stop_id1=ordered.text('stop_id', a[fast]),
+               stop_id2=ordered.text('stop_id', b[fast]), distance_km=np.round(distance[fast] / 1000, 2),
+               speed_kmh=np.round(speed[fast], 1))
+
+def validate_feed(feed_path, max_speed_kmh=MAX_SPEED_KMH):
+    """
+    Valida el feed (directorio con *.txt o zip)
+
+    Args:
+        feed_path: gtfs_feed/ o gtfs_trujillo.zip
+        max_speed_kmh: Velocidad máxima entre paradas consecutivas
+    Returns:
+        ValidationReport
+    """
+    report = ValidationReport()
+    with PROFILER.stage('load_tables'):
+        tables = load_tables(feed_path)
+    check_rows(tables, report)
+    with PROFILER.stage('field_formats'):
+        check_field_formats(tables, report)
+    with PROFILER.stage('duplicate_keys'):
+        check_duplicate_keys(tables, report)
+    with PROFILER.stage('foreign_keys'):
+        check_foreign_keys(tables, report)
+    stop_times = tables.get('stop_times.txt')
+    if not stop_times or not table_length(stop_times):
+        return report
+    with PROFILER.stage('stop_time_order'):
+        ordered = OrderedStopTimes(stop_times)
+        check_stop_time_order(ordered, report)
+    if 'stops.txt' in tables:
+        with PROFILER.stage('travel_speed'):
+            check_travel_speed(ordered, tables['stops.txt'], report, max_speed_kmh)
+    return report
+
+def print_report(report, limit=5):
+    """Resumen por código y los primeros avisos de cada uno"""
+    if not report.notices:
+        print("   ✅ Sin errores ni advertencias")
+        return
+    for (code, severity), count in report.summary().items():
+        icon = '❌' if severity == ERROR else '⚠️ '
+        print(f"   {icon} {code} ({severity}): {count}")
+        shown = [notice for notice in report.notices if notice['code'] == code][:limit]
+        for notice in shown:
+            details = ', '.join(f"{key}={value}" for key, value in notice.items()
+                                if key not in ('code', 'severity'))
+            print(f"      • {details}")
+        if count > len(shown):
+            print(f"      • ... y {count - len(shown)} más")
+
+def main():
+    parser = argparse.ArgumentParser(description="Valida el feed GTFS (claves, referencias, stop_times y velocidades)")
+    parser.add_argument('feed', nargs='?', type=Path, default=Path(__file__).parent / 'gtfs_feed',
+                        help="Directorio del feed o zip (default: gtfs_feed/)")
+    parser.add_argument('--max-speed', type=float, default=MAX_SPEED_KMH,
+                        help=f"Velocidad máxima entre paradas consecutivas en km/h (default: {MAX_SPEED_KMH:.0f})")
+    parser.add_argument('--report', type=Path, help="Escribir todos los avisos en este JSON")
+    parser.add_argument('--strict', action='store_true', help="Fallar también con advertencias")
+    add_profile_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args, 'validate_feed')
+
+    print("=" * 80)
+    print("🔎 VALIDANDO FEED GTFS")
+    print("=" * 80)
+    print()
+
+    report = validate_feed(args.feed, args.max_speed)
+    print_report(report)
+    print(f"\n📊 {len(report.errors)} errores, {len(report.warnings)} advertencias ({args.feed})")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report.to_json(), f, ensure_ascii=False, indent=2)
+        print(f"📁 Reporte: {args.report}")
+    print()
+
+    finish_profile()
+    if report.errors or (args.strict and report.warnings):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+Exporta paradas y shapes del feed como vector tiles (Mapbox Vector Tile 2.1)
+para que los clientes carguen solo los tiles visibles en vez del GeoJSON
+completo de todas las rutas.
+
+- capa 'routes': una feature por shape (route_id, shape_id) simplificada por
+  zoom con los niveles de shape_simplify (tolerancia = SIMPLIFY_PIXELS
+  píxeles del zoom) y recortada al tile con un margen de BUFFER unidades
+- capa 'stops': paradas y estaciones de stops.txt desde STOPS_MIN_ZOOM
+  (stop_id, stop_name, synthetic, location_type, parent_station)
+- salida como pirámide de directorios ({z}/{x}/{y}.pbf + metadata.json
+  TileJSON) o como un archivo MBTiles (SQLite, tiles con gzip)
+
+La asignación de segmentos y paradas a tiles es vectorizada por zoom; el
+recorte y la codificación protobuf de cada tile son independientes y se
+reparten en un pool de procesos con --workers.
+"""
+
+import argparse
+import csv
+import gzip
+import json
+import math
+import shutil
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+
+from instrumentation import (
+    PROFILER, add_profile_args, configure_from_args, finish_profile, init_pool_worker, merged, profiled
+)
+from shape_simplify import ShapeLevels
+from shape_store import load_shape_store
+
+EXTENT = 4096  # unidades de coordenada por tile
+BUFFER = 64  # margen de recorte en unidades del tile
+TILE_SIZE = 256  # píxeles de pantalla por tile
+SIMPLIFY_PIXELS = 0.5  # tolerancia Douglas-Peucker por zoom, en píxeles
+MIN_ZOOM = 10
+MAX_ZOOM = 16
+STOPS_MIN_ZOOM = 13
+EARTH_CIRCUMFERENCE = 40075016.686  # metros en el ecuador (Web Mercator)
+
+# Tipos de geometría y comandos (especificación MVT 2.1)
+POINT, LINESTRING = 1, 2
+MOVE_TO, LINE_TO = 1, 2
+
+ROUTE_FIELDS = {'route_id': 'String', 'shape_id': 'String'}
+STOP_FIELDS = {'stop_id': 'String', 'stop_name': 'String', 'synthetic': 'Boolean',
+               'location_type': 'Number', 'parent_station': 'String'}
+
+def default_gtfs_dir():
+    return Path(__file__).parent.parent / 'GTFS/out/trujillo/gtfs'
+
+# --- Protobuf -----------------------------------------------------------------
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def _packed_varints(values):
+    """Codifica un array de enteros no negativos como varints concatenados"""
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return b''
+    # Grupos de 7 bits por valor (al menos uno), como en polyline.encode_polyline
+    n_chunks = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        n_chunks += rest > 0
+        rest >>= np.uint64(7)
+    position = np.arange(n_chunks.sum()) - np.repeat(np.cumsum(n_chunks) - n_chunks, n_chunks)
+    chunks = (np.repeat(values, n_chunks) >> (np.uint64(7) * position.astype(np.uint64))) & np.uint64(0x7f)
+    chunks |= np.where(position < np.repeat(n_chunks, n_chunks) - 1, 0x80, 0).astype(np.uint64)
+    return chunks.astype(np.uint8).tobytes()
+
+def _zigzag(values):
+    values = np.asarray(values, dtype=np.int64)
+    return (values << 1) ^ (values >> 63)
+
+def _field_varint(number, value):
+    return _varint(number << 3) + _varint(value)
+
+def _field_bytes(number, payload):
+    return _varint((number << 3) | 2) + _varint(len(payload)) + payload
+
+def _encode_value(value):
+    """Mensaje Value de MVT: string (1), double (3), sint (6) o bool (7)"""
+    if isinstance(value, bool):
+        return _field_varint(7, int(value))
+    if isinstance(value, int):
+        return _field_varint(6, (value << 1) ^ (value >> 63))
+    if isinstance(value, float):
+        return _varint((3 << 3) | 1) + np.float64(value).tobytes()
+    return _field_bytes(1, str(value).encode('utf-8'))
+
+class LayerBuilder:
+    """Features de una capa de un tile, con claves y valores deduplicados"""
+
+    def __init__(self, name):
+        self.name = name
+        self.features = []
+        self.keys = {}
+        self.values = {}
+
+    def __len__(self):
+        return len(self.features)
+
+    def _tags(self, properties):
+        tags = []
+        for key, value in properties.items():
+            if value is None or value == '':
+                continue
+            tags.append(self.keys.setdefault(key, len(self.keys)))
+            tags.append(self.values.setdefault((type(value), value), len(self.values)))
+        return tags
+
+    def add(self, feature_id, geom_type, geometry, properties):
+        """geometry: array de enteros de comandos y parámetros (ver encode_points/encode_lines)"""
+        self.features.append(_field_varint(1, feature_id)
+                             + _field_bytes(2, _packed_varints(self._tags(properties)))
+                             + _field_varint(3, geom_type)
+                             + _field_bytes(4, _packed_varints(geometry)))
+
+    def encode(self):
+        layer = _field_varint(15, 2) + _field_bytes(1, self.name.encode('utf-8'))
+        layer += b''.join(_field_bytes(2, feature) for feature in self.features)
+        layer += b''.join(_field_bytes(3, key.encode('utf-8')) for key in self.keys)
+        layer += b''.join(_field_bytes(4, _encode_value(value)) for _, value in self.values)
+        return layer + _field_varint(5, EXTENT)
+
+def encode_tile(layers):
+    """Tile MVT con las capas no vacías"""
+    return b''.join(_field_bytes(3, layer.encode()) for layer in layers if len(layer))
+
+def encode_points(points):
+    """Geometría MultiPoint: un MoveTo con todos los puntos (enteros del tile)"""
+    deltas = np.diff(points, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    return np.concatenate([[MOVE_TO | (len(points) << 3)], _zigzag(deltas).ravel()])
+
+def encode_lines(parts):
+    """Geometría (Multi)LineString: MoveTo + LineTo por parte, cursor continuo entre partes"""
+    geometry, cursor = [], np.zeros(2, dtype=np.int64)
+    for part in parts:
+        deltas = _zigzag(np.diff(part, axis=0, prepend=cursor[None])).ravel()
+        geometry.append([MOVE_TO | (1 << 3), deltas[0], deltas[1], LINE_TO | ((len(part) - 1) << 3)])
+        geometry.append(deltas[2:])
+        cursor = part[-1]
+    return np.concatenate(geometry)
+
+# --- Geometría ----------------------------------------------------------------
+
+def mercator(lon, lat):
+    """lon/lat (grados) -> coordenadas Web Mercator normalizadas en [0, 1] (y hacia el sur)"""
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.0511, 85.0511)
+    u = (np.asarray(lon, dtype=np.float64) + 180.0) / 360.0
+    v = (1.0 - np.log(np.tan(np.radians(lat)) + 1.0 / np.cos(np.radians(lat))) / math.pi) / 2.0
+    return u, v
+
+def zoom_tolerance(zoom, lat):
+    """Tolerancia de simplificación (metros) del zoom a la latitud dada"""
+    return SIMPLIFY_PIXELS * EARTH_CIRCUMFERENCE * math.cos(math.radians(lat)) / (TILE_SIZE << zoom)
+
+def clip_segments(x0, y0, x1, y1, low, high):
+    """
+    Recorte de Liang-Barsky de segmentos al cuadrado [low, high]² (en lote)
+
+    Returns:
+        (keep, t0, t1): segmentos que tocan el cuadrado y la fracción de
+        inicio/fin de la parte recortada
+    """
+    dx, dy = x1 - x0, y1 - y0
+    p = np.stack([-dx, dx, -dy, dy])
+    q = np.stack([x0 - low, high - x0, y0 - low, high - y0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = q / p
+    t0 = np.max(np.where(p < 0, r, 0.0), axis=0, initial=0.0)
+    t1 = np.min(np.where(p > 0, r, 1.0), axis=0, initial=1.0)
+    outside = ((p == 0) & (q < 0)).any(axis=0)
+    return ~outside & (t0 <= t1), t0, t1
+
+def _tile_ranges(lo, hi, scale):
+    """Rango de tiles [first, last] que cubre [lo, hi] (coordenadas normalizadas) con el margen"""
+    margin = BUFFER / EXTENT
+    last_tile = scale - 1
+    first = np.clip(np.floor(lo * scale - margin), 0, last_tile).astype(np.int64)
+    last = np.clip(np.floor(hi * scale + margin), 0, last_tile).astype(np.int64)
+    return first, last
+
+def _expand_ranges(fx, lx, fy, ly):
+    """Un par (item, tile_x, tile_y) por cada tile del rango de cada item"""
+    nx, ny = lx - fx + 1, ly - fy + 1
+    count = nx * ny
+    item = np.repeat(np.arange(len(fx)), count)
+    k = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    return item, fx[item] + k % nx[item], fy[item] + k // nx[item]
+
+class TileSource:
+    """
+    Shapes y paradas en Web Mercator listas para cortar en tiles
+
+    Los vértices de todas las shapes están concatenados (orden del
+    ShapeStore); shape_of[i] es la shape del vértice i
+    """
+
+    def __init__(self, store, levels, shape_routes, stops):
+        self.store = store
+        self.levels = levels
+        coords = np.asarray(store.coords_array)
+        self.u, self.v = mercator(coords[:, 0], coords[:, 1])
+        offsets = np.asarray(store.offsets, dtype=np.int64)
+        self.shape_of = np.repeat(np.arange(len(store.shape_ids)), np.diff(offsets))
+        self.shape_props = [{'route_id': shape_routes.get(shape_id, ''), 'shape_id': shape_id}
+                            for shape_id in store.shape_ids]
+        self.stop_lon = np.array([float(s['stop_lon']) for s in stops], dtype=np.float64)
+        self.stop_lat = np.array([float(s['stop_lat']) for s in stops], dtype=np.float64)
+        self.stop_u, self.stop_v = mercator(self.stop_lon, self.stop_lat)
+        self.stop_props = [{
+            'stop_id': s['stop_id'],
+            'stop_name': s.get('stop_name', ''),
+            'synthetic': s['stop_id'].startswith('SYNTH_'),
+            'location_type': int(s.get('location_type') or 0),
+            'parent_station': s.get('parent_station', '')
+        } for s in stops]
+        self.lat = float(np.mean(coords[:, 1])) if len(coords) else 0.0
+
+    @classmethod
+    def from_files(cls, shapes_file, gtfs_dir):
+        """Shapes (con su caché y niveles), route_id por shape de trips.txt y stops.txt"""
+        store = load_shape_store(shapes_file)
+        with open(Path(gtfs_dir) / 'trips.txt', 'r', encoding='utf-8') as f:
+            shape_routes = {}
+            for trip in csv.DictReader(f):
+                shape_routes.setdefault(trip['shape_id'], trip['route_id'])
+        with open(Path(gtfs_dir) / 'stops.txt', 'r', encoding='utf-8') as f:
+            stops = list(csv.DictReader(f))
+        return cls(store, ShapeLevels.open(store), shape_routes, stops)
+
+    def bounds(self):
+        """[oeste, sur, este, norte] de shapes y paradas (grados)"""
+        coords = np.asarray(self.store.coords_array)
+        lons = np.concatenate([coords[:, 0], self.stop_lon])
+        lats = np.concatenate([coords[:, 1], self.stop_lat])
+        return [float(lons.min()), float(lats.min()), float(lons.max()), float(lats.max())]
+
+    def segments(self, zoom):
+        """Segmentos (vértice inicial, final) de las shapes simplificadas para el zoom"""
+        kept = np.flatnonzero(self.levels.importance > zoom_tolerance(zoom, self.lat))
+        a, b = kept[:-1], kept[1:]
+        same = self.shape_of[a] == self.shape_of[b]
+        return a[same], b[same]
+
+    def tile_jobs(self, zoom, stops_min_zoom=STOPS_MIN_ZOOM):
+        """
+        Trabajos (zoom, x, y, segment_a, segment_b, stops) de los tiles con
+        datos en el zoom, con los segmentos en el orden de las shapes
+        """
+        scale = 1 << zoom
+        a, b = self.segments(zoom)
+        fx, lx = _tile_ranges(np.minimum(self.u[a], self.u[b]), np.maximum(self.u[a], self.u[b]), scale)
+        fy, ly = _tile_ranges(np.minimum(self.v[a], self.v[b]), np.maximum(self.v[a], self.v[b]), scale)
+        seg, seg_x, seg_y = _expand_ranges(fx, lx, fy, ly)
+        seg_key = seg_x * scale + seg_y
+
+        if zoom >= stops_min_zoom:
+            fx, lx = _tile_ranges(self.stop_u, self.stop_u, scale)
+            fy, ly = _tile_ranges(self.stop_v, self.stop_v, scale)
+            stop, stop_x, stop_y = _expand_ranges(fx, lx, fy, ly)
+            stop_key = stop_x * scale + stop_y
+        else:
+            stop = stop_key = np.zeros(0, dtype=np.int64)
+
+        # Agrupar por tile (orden estable: segmentos y paradas en su orden original)
+        seg_order = np.argsort(seg_key, kind='stable')
+        stop_order = np.argsort(stop_key, kind='stable')
+        seg, seg_key = seg[seg_order], seg_key[seg_order]
+        stop, stop_key = stop[stop_order], stop_key[stop_order]
+        for key in np.union1d(seg_key, stop_key).tolist():
+            s0, s1 = np.searchsorted(seg_key, [key, key + 1])
+            p0, p1 = np.searchsorted(stop_key, [key, key + 1])
+            yield zoom, key // scale, key % scale, a[seg[s0:s1]], b[seg[s0:s1]], stop[p0:p1]
+
+    def _route_layer(self, zoom, x, y, seg_a, seg_b):
+        """Capa 'routes' del tile: partes recortadas de cada shape como MultiLineString"""
+        layer = LayerBuilder('routes')
+        scale = 1 << zoom
+        x0, y0 = (self.u[seg_a] * scale - x) * EXTENT, (self.v[seg_a] * scale - y) * EXTENT
+        x1, y1 = (self.u[seg_b] * scale - x) * EXTENT, (self.v[seg_b] * scale - y) * EXTENT
+        keep, t0, t1 = clip_segments(x0, y0, x1, y1, -BUFFER, EXTENT + BUFFER)
+        seg_a, seg_b, t0, t1 = seg_a[keep], seg_b[keep], t0[keep], t1[keep]
+        x0, y0, x1, y1 = x0[keep], y0[keep], x1[keep], y1[keep]
+        if not len(seg_a):
+            return layer
+
+        # Un segmento continúa la parte anterior si sigue al anterior en la
+        # misma shape y ninguno de los dos fue recortado en la unión
+        joined = np.zeros(len(seg_a), dtype=bool)
+        joined[1:] = (seg_a[1:] == seg_b[:-1]) & (t1[:-1] == 1.0) & (t0[1:] == 0.0)
+        part = np.cumsum(~joined) - 1
+
+        # Puntos de cada parte: inicio del primer segmento y fin de todos
+        start = np.column_stack([x0 + t0 * (x1 - x0), y0 + t0 * (y1 - y0)])
+        end = np.column_stack([x0 + t1 * (x1 - x0), y0 + t1 * (y1 - y0)])
+        emit = np.column_stack([~joined, np.ones(len(part), dtype=bool)]).ravel()
+        points = np.round(np.stack([start, end], axis=1).reshape(-1, 2)[emit]).astype(np.int64)
+        point_part = np.repeat(part, 2)[emit]
+
+        # Sin puntos repetidos tras redondear; partes de un solo punto se descartan
+        distinct = np.ones(len(points), dtype=bool)
+        distinct[1:] = (point_part[1:] != point_part[:-1]) | (points[1:] != points[:-1]).any(axis=1)
+        points, point_part = points[distinct], point_part[distinct]
+        bounds = np.searchsorted(point_part, np.arange(part[-1] + 2))
+        part_shape = self.shape_of[seg_a[np.searchsorted(part, np.arange(part[-1] + 1))]]
+
+        features = {}
+        for p, (lo, hi) in enumerate(zip(bounds[:-1].tolist(), bounds[1:].tolist())):
+            if hi - lo >= 2:
+                features.setdefault(int(part_shape[p]), []).append(points[lo:hi])
+        for shape, parts in features.items():
+            layer.add(shape + 1, LINESTRING, encode_lines(parts), self.shape_props[shape])
+        PROFILER.count('route_features', len(features))
+        return layer
+
+    def _stop_layer(self, zoom, x, y, stops):
+        """Capa 'stops' del tile: una feature Point por parada"""
+        layer = LayerBuilder('stops')
+        scale = 1 << zoom
+        px = np.round((self.stop_u[stops] * scale - x) * EXTENT).astype(np.int64)
+        py = np.round((self.stop_v[stops] * scale - y) * EXTENT).astype(np.int64)
+        for stop, point in zip(stops.tolist(), np.column_stack([px, py])):
+            layer.add(stop + 1, POINT, encode_points(point[None]), self.stop_props[stop])
+        PROFILER.count('stop_features', len(layer))
+        return layer
+
+    def render(self, zoom, x, y, seg_a, seg_b, stops):
+        """Tile MVT (bytes, sin comprimir); b'' si el recorte lo deja vacío"""
+        return encode_tile([self._route_layer(zoom, x, y, seg_a, seg_b), self._stop_layer(zoom, x, y, stops)])
+
+# --- Exportación --------------------------------------------------------------
+
+# Estado de solo lectura de cada proceso (shapes en mmap + paradas)
+_worker_state = {}
+
+def _init_worker(shapes_file, gtfs_dir):
+    _worker_state['source'] = TileSource.from_files(shapes_file, gtfs_dir)
+
+def _render_job(job):
+    zoom, x, y = job[:3]
+    with PROFILER.item('tile', f"{zoom}/{x}/{y}"):
+        return zoom, x, y, _worker_state['source'].render(*job)
+
+def iter_tiles(source, shapes_file, gtfs_dir, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM,
+               stops_min_zoom=STOPS_MIN_ZOOM, workers=1):
+    """
+    Tiles (zoom, x, y, datos) de todos los zooms; los tiles vacíos tras el
+    recorte se omiten. Con workers > 1 el recorte y la codificación se
+    reparten en un pool de procesos (cada uno abre el caché de shapes)
+    """
+    jobs = [job for zoom in range(min_zoom, max_zoom + 1) for job in source.tile_jobs(zoom, stops_min_zoom)]
+    PROFILER.count('tile_jobs', len(jobs))
+
+    if workers <= 1:
+        _worker_state['source'] = source
+        results = map(_render_job, jobs)
+    else:
+        chunksize = max(1, len(jobs) // (workers * 4))
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=init_pool_worker,
+                                   initargs=(PROFILER.enabled, _init_worker, str(shapes_file), str(gtfs_dir)))
+        results = merged(pool.map(partial(profiled, _render_job), jobs, chunksize=chunksize))
+    try:
+        for zoom, x, y, data in results:
+            if data:
+                yield zoom, x, y, data
+    finally:
+        if workers > 1:
+            pool.shutdown()
+
+def tilejson(source, min_zoom, max_zoom, tiles_url):
+    """Metadatos TileJSON 3.0 del conjunto de tiles"""
+    west, south, east, north = source.bounds()
+    return {
+        'tilejson': '3.0.0',
+        'name': 'gtfs_trujillo',
+        'format': 'pbf',
+        'tiles': [tiles_url],
+        'minzoom': min_zoom,
+        'maxzoom': max_zoom,
+        'bounds': [west, south, east, north],
+        'center': [(west + east) / 2, (south + north) / 2, min(max(min_zoom, 12), max_zoom)],
+        'vector_layers': [
+            {'id': 'routes', 'fields': ROUTE_FIELDS, 'minzoom': min_zoom, 'maxzoom': max_zoom},
+            {'id': 'stops', 'fields': STOP_FIELDS, 'minzoom': max(min_zoom, STOPS_MIN_ZOOM), 'maxzoom': max_zoom}
+        ]
+    }
+
+def write_directory(output_dir, tiles, metadata):
+    """Pirámide {z}/{x}/{y}.pbf (reemplaza la anterior) + metadata.json"""
+    output_dir = Path(output_dir)
+    for zoom_dir in output_dir.glob('[0-9]*'):
+        shutil.rmtree(zoom_dir)
+    count = size = 0
+    for zoom, x, y, data in tiles:
+        tile_file = output_dir / str(zoom) / str(x) / f"{y}.pbf"
+        tile_file.parent.mkdir(parents=True, exist_ok=True)
+        tile_file.write_bytes(data)
+        count += 1
+        size += len(data)
+    with open(output_dir / 'metadata.json', 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    return count, size
+
+def write_mbtiles(mbtiles_file, tiles, metadata):
+    """Archivo MBTiles 1.3 (filas TMS, tiles con gzip); reemplaza el anterior"""
+    mbtiles_file = Path(mbtiles_file)
+    mbtiles_file.parent.mkdir(parents=True, exist_ok=True)
+    mbtiles_file.unlink(missing_ok=True)
+    count = size = 0
+    with sqlite3.connect(mbtiles_file) as db:
+        db.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+        db.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+        db.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+        for zoom, x, y, data in tiles:
+            data = gzip.compress(data, mtime=0)
+            db.execute("INSERT INTO tiles VALUES (?, ?, ?, ?)", (zoom, x, (1 << zoom) - 1 - y, data))
+            count += 1
+            size += len(data)
+        db.executemany("INSERT INTO metadata VALUES (?, ?)", [
+            ('name', metadata['name']),
+            ('format', 'pbf'),
+            ('minzoom', str(metadata['minzoom'])),
+            ('maxzoom', str(metadata['maxzoom'])),
+            ('bounds', ','.join(str(value) for value in metadata['bounds'])),
+            ('center', ','.join(str(value) for value in metadata['center'])),
+            ('json', json.dumps({'vector_layers': metadata['vector_layers']}))
+        ])
+    return count, size
+
+def export_tiles(output, shapes_file=None, gtfs_dir=None, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM,
+                 stops_min_zoom=STOPS_MIN_ZOOM, workers=1):
+    """
+    Exporta los vector tiles del feed
+
+    Args:
+        output: Directorio de la pirámide, o archivo .mbtiles
+        shapes_file: shapes.txt (default: GTFS/out/trujillo/gtfs/shapes.txt)
+        gtfs_dir: Directorio con trips.txt y stops.txt (default: gtfs_feed/)
+        min_zoom, max_zoom: Zooms a generar
+        stops_min_zoom: Primer zoom con la capa de paradas
+        workers: Procesos para recortar y codificar tiles
+    Returns:
+        (tiles escritos, bytes escritos)
+    """
+    shapes_file = Path(shapes_file or default_gtfs_dir() / 'shapes.txt')
+    gtfs_dir = Path(gtfs_dir or Path(__file__).parent / 'gtfs_feed')
+    output = Path(output)
+    with PROFILER.stage('load_inputs'):
+        source = TileSource.from_files(shapes_file, gtfs_dir)
+
+    metadata = tilejson(source, min_zoom, max_zoom, '{z}/{x}/{y}.pbf')
+    tiles = iter_tiles(source, shapes_file, gtfs_dir, min_zoom, max_zoom, stops_min_zoom, workers)
+    with PROFILER.stage('render_tiles'):
+        if output.suffix == '.mbtiles':
+            return write_mbtiles(output, tiles, metadata)
+        return write_directory(output, tiles, metadata)
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta paradas y shapes como vector tiles (MVT)")
+    parser.add_argument('--output', type=Path, default=Path(__file__).parent / 'vector_tiles',
+                        help="Directorio de la pirámide {z}/{x}/{y}.pbf o archivo .mbtiles "
+                             "(default: vector_tiles/)")
+    parser.add_argument('--shapes', type=Path, default=default_gtfs_dir() / 'shapes.txt',
+                        help="shapes.txt de origen (default: GTFS/out/trujillo/gtfs/shapes.txt)")
+    parser.add_argument('--gtfs-dir', type=Path, default=Path(__file__).parent / 'gtfs_feed',
+                        help="Directorio con trips.txt y stops.txt (default: gtfs_feed/)")
+    parser.add_argument('--min-zoom', type=int, default=MIN_ZOOM, help=f"Zoom mínimo (default: {MIN_ZOOM})")
+    parser.add_argument('--max-zoom', type=int, default=MAX_ZOOM, help=f"Zoom máximo (default: {MAX_ZOOM})")
+    parser.add_argument('--stops-min-zoom', type=int, default=STOPS_MIN_ZOOM,
+                        help=f"Primer zoom con paradas (default: {STOPS_MIN_ZOOM})")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Procesos para recortar y codificar tiles (default: 1)")
+    add_profile_args(parser)
+    args = parser.parse_args()
+    configure_from_args(args, 'vector_tiles')
+
+    print("=" * 80)
+    print("🗺️  EXPORTANDO VECTOR TILES (MVT)")
+    print("=" * 80)
+    print()
+
+    start = time.perf_counter()
+    count, size = export_tiles(args.output, args.shapes, args.gtfs_dir, args.min_zoom, args.max_zoom,
+                               args.stops_min_zoom, args.workers)
+    elapsed = time.perf_counter() - start
+
+    print(f"   ✅ {count} tiles, zooms {args.min_zoom}-{args.max_zoom} ({size / 1024 / 1024:.2f} MB, {elapsed:.1f} s)")
+    print(f"\n📁 Salida: {args.output}")
+    print()
+
+    finish_profile()
+
+if __name__ == "__main__":
+    main()